@@ -137,8 +137,10 @@
 %ignore mega::MegaNode::getNodeKey;
 %ignore mega::MegaNode::getAttrString;
 %ignore mega::MegaNode::getAuth;
+#ifndef SWIGPYTHON
 %ignore mega::MegaListener::onSyncStateChanged;
 %ignore mega::MegaListener::onSyncFileStateChanged;
+#endif
 %ignore mega::MegaTransfer::getListener;
 %ignore mega::MegaRequest::getListener;
 %ignore mega::MegaHashSignature;
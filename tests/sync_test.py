@@ -19,14 +19,13 @@
 """
 
 # TODO tests:
-# * "pause" sync
 # * lock directory
-# * large (> 4Gb) files
 # * > 10000 folders to synchronize
 
 from sync_test_base import SyncTestBase
 from sync_test_base import get_random_str
 from sync_test_base import generate_unicode_name
+from sync_test_base import generate_non_bmp_name
 import random
 import os
 import logging
@@ -219,28 +218,35 @@ class SyncTest(SyncTestBase):
 
             logging.debug("Writing to both files: %s and %s" % (fname_in, fname_out))
 
+            self.trace("touch", [fname_in])
             with open(fname_in, 'a'):
                 os.utime(fname_in, None)
+            self.trace("touch", [fname_out])
             with open(fname_out, 'a'):
                 os.utime(fname_out, None)
 
             self.app.sync()
 
             for _ in range(10):
+                data = get_random_str(100)
+                self.trace("append", [fname_in], data)
                 with open(fname_in, 'a') as f_in:
-                    f_in.write(get_random_str(100))
+                    f_in.write(data)
 
+                data = get_random_str(100)
+                self.trace("append", [fname_out], data)
                 with open(fname_out, 'a') as f_out:
-                    f_out.write(get_random_str(100))
+                    f_out.write(data)
 
                 self.app.sync()
 
-            md5_in = self.md5_for_file(fname_in)
-            md5_out = self.md5_for_file(fname_out)
+            md5_in, md5_out = self.digest_files([fname_in, fname_out])
 
             logging.debug("File %s md5: %s" % (fname_in, md5_in))
             logging.debug("File %s md5: %s" % (fname_out, md5_out))
 
+            if md5_in != md5_out:
+                self.files_divergence([fname])
             self.assertEqual(md5_in, md5_out, "Files do not match")
 
     def test_local_operations(self):
@@ -250,7 +256,7 @@ class SyncTest(SyncTestBase):
         """
         logging.info("Launching test_local_operations test")
         self.assertTrue(self.app.is_alive(), "Test application is not running")
-        l_tree = self.local_tree_create("", 5)
+        l_tree = self.local_tree_create(5)
         self.assertIsNotNone(l_tree, "Failed to create directory tree!")
         self.assertTrue(self.app.is_alive(), "Test application is not running")
         self.app.sync()
@@ -275,6 +281,7 @@ class SyncTest(SyncTestBase):
         for _ in range(self.app.nr_retries):
             logging.debug("Touching: %s" % in_file)
             now = time.time()
+            self.trace("touch", [in_file])
             with open(in_file, 'a'):
                 os.utime(in_file, (now, now))
 
@@ -378,3 +385,56 @@ class SyncTest(SyncTestBase):
         self.assertTrue(self.app.is_alive(), "Test application is not running")
 
         return True
+
+    def test_create_delete_non_bmp_files_dirs(self):
+        """
+        create files and directories with names outside of the Basic Multilingual Plane,
+        compare them on both sync folders (a listing doesn't give the original unicode names back),
+        remove them, check that they are removed from the second folder
+        """
+        logging.info("Launching test_create_delete_non_bmp_files_dirs test")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # make sure remote folders are empty
+        self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # create files
+        l_files = self.files_create(generate_non_bmp_name)
+        self.assertIsNotNone(l_files, "Creating files")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        self.app.sync()
+
+        # comparing
+        self.assertTrue(self.files_check(l_files), "Comparing files")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # remove files
+        self.assertTrue(self.files_remove(l_files), "Removing files")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # make sure remote folders are empty
+        self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # create dirs
+        l_dirs = self.dirs_create(generate_non_bmp_name)
+        self.assertIsNotNone(l_dirs, "Creating directories")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        self.app.sync()
+
+        # comparing
+        self.assertTrue(self.dirs_check(l_dirs), "Comparing directories")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # remove dirs
+        self.assertTrue(self.dirs_remove(l_dirs), "Removing directories")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        # make sure remote folders are empty
+        self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        return True
@@ -22,6 +22,11 @@ import os
 import time
 import random
 from sync_test_base import get_random_str
+from sync_test_hash import HashPool
+from sync_test_manifest import HashCache
+from sync_test_latency import LatencyTracker
+from sync_test_retry import RetryPolicy
+from sync_test_watch import create_watcher
 import shutil
 import logging
 import datetime
@@ -39,20 +44,54 @@ class SyncTestApp(object):
 
         self.start_time = time.time()
 
-        random.seed(time.time())
+        # logged, so the random workload of a run can be generated again
+        self.seed = int(time.time() * 1000)
+        random.seed(self.seed)
+        logging.debug("Random seed: %d" % self.seed)
 
         self.local_mount_in = local_mount_in
         self.local_mount_out = local_mount_out
 
-        self.rnd_folder = get_random_str()
-        self.local_folder_in = os.path.join(self.local_mount_in, self.rnd_folder)
-        self.local_folder_out = os.path.join(self.local_mount_out, self.rnd_folder)
-        self.work_folder = os.path.join(work_folder, self.rnd_folder)
+        self.work_root = work_folder
+        self.set_rnd_folder(get_random_str())
 
+        # number of repetitions for stress tests
         self.nr_retries = 200
+        # deadline and backoff for operations waiting for synchronization
+        self.retry = RetryPolicy()
         self.delete_tmp_files = delete_tmp_files
         self.use_large_files = use_large_files
 
+        # sync() returns when both folders have been quiet for sync_settle seconds
+        # or when sync_timeout seconds have passed
+        self.sync_settle = 1.0
+        self.sync_timeout = 60.0
+        self.watcher = None
+
+        # content digest used for verification, a pool of processes calculating it
+        # and digests of already verified files
+        self.hash_algo = "md5"
+        self.hash_pool = HashPool()
+        # worker processes are forked before the watcher and application threads exist
+        self.hash_pool.start()
+        self.hash_cache = HashCache()
+        # verify files in "out" folder as they appear, while tests are still creating them
+        self.stream_verify = True
+        # seconds between resource usage samples of application processes, None to disable sampling
+        self.resource_interval = 1.0
+
+        # propagation latency of operations, reported per test
+        # to report_dir and to xmlrunner test suite properties
+        self.latency = LatencyTracker()
+        self.report_dir = "test-reports"
+        self.report_properties = {}
+        # TraceRecorder, filesystem operations of tests are recorded if set
+        self.trace = None
+        # FixtureStore, files are copied from it instead of being generated if set
+        self.fixtures = None
+        # StorageProfile the folders are placed on, results are tagged with it
+        self.storage = None
+
     def __enter__(self):
         # call subclass function
         res = self.start()
@@ -68,7 +107,25 @@ class SyncTestApp(object):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        # remove tmp folders
+        self.remove_folders()
+
+        # terminate apps
+        self.stop()
+        logging.info("Execution time: %s" % str(datetime.timedelta(seconds=time.time()-self.start_time)))
+
+    def set_rnd_folder(self, rnd_folder):
+        """
+        set the name of test folders inside "in", "out" and work folders
+        """
+        self.rnd_folder = rnd_folder
+        self.local_folder_in = os.path.join(self.local_mount_in, self.rnd_folder)
+        self.local_folder_out = os.path.join(self.local_mount_out, self.rnd_folder)
+        self.work_folder = os.path.join(self.work_root, self.rnd_folder)
+
+    def remove_folders(self):
+        """
+        remove test folders
+        """
         if self.delete_tmp_files:
             try:
                 logging.debug("Deleting %s" % self.local_folder_in)
@@ -86,9 +143,31 @@ class SyncTestApp(object):
             except OSError:
                 pass
 
-        # terminate apps
-        self.stop()
-        logging.info("Execution time: %s" % str(datetime.timedelta(seconds=time.time()-self.start_time)))
+    def attach(self):
+        """
+        called in a forked process to share running application instances:
+        prepare a new pair of test folders, drop watcher and hashing processes of the parent
+        """
+        random.seed()
+        self.set_rnd_folder(get_random_str())
+        self.watcher = None
+        self.hash_pool = HashPool()
+        self.hash_pool.start()
+        self.hash_cache = HashCache()
+        self.latency = LatencyTracker()
+        self.retry = RetryPolicy(self.retry.timeout, self.retry.initial_delay, self.retry.max_delay, self.retry.factor)
+        self.report_properties = {}
+        return self.prepare_folders()
+
+    def detach(self):
+        """
+        remove test folders of a forked process, application instances are left running
+        """
+        self.remove_folders()
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        self.hash_pool.close()
 
     @staticmethod
     def touch(path):
@@ -103,6 +182,10 @@ class SyncTestApp(object):
         """
         prepare upsync, downsync and work directories
         """
+        if self.storage is not None:
+            logging.info("Storage: %s" % self.storage.describe())
+            self.report_properties.update(self.storage.properties())
+
         # create "in" folder
         logging.info("IN folder: %s" % self.local_folder_in)
         try:
@@ -113,29 +196,20 @@ class SyncTestApp(object):
 
         logging.info("OUT folder: %s" % self.local_folder_out)
 
-        self.sync()
-
         # temporary workaround
         #tmp_fix_file = os.path.join(self.local_mount_out, "tmp_fix")
 
         success = False
         # try to access the dir
-        for r in range(0, self.nr_retries):
-            try:
-                if os.path.isdir(self.local_folder_out):
-                    success = True
-                    break
-                else:
-                    # wait for a dir
-                    logging.debug("Directory %s not found! Retrying [%d/%d] .." % (self.local_folder_out, r + 1, self.nr_retries))
-                    #self.touch(tmp_fix_file)
-                    self.sync()
-            except OSError:
-                # wait for a dir
-                logging.debug("Directory %s not found! Retrying [%d/%d] .." % (self.local_folder_out, r + 1, self.nr_retries))
-                #self.touch(tmp_fix_file)
-                self.sync()
-        if success is False:
+        retry = self.retry.begin("prepare_folders", self.sync_wait)
+        while retry.next():
+            if os.path.isdir(self.local_folder_out):
+                success = True
+                break
+            # wait for a dir
+            logging.debug("Directory %s not found! Retrying %s .." % (self.local_folder_out, retry))
+            #self.touch(tmp_fix_file)
+        if not retry.done(success):
             logging.error("Failed to access directory: %s" % self.local_folder_out)
             return False
 
@@ -161,6 +235,69 @@ class SyncTestApp(object):
         self.sync()
         self.finish()
 
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        self.hash_pool.close()
+        if self.trace is not None:
+            self.trace.close()
+        if self.fixtures is not None:
+            self.fixtures.close()
+
+    def sync(self, timeout=None):
+        """
+        wait for full synchronization:
+        return True as soon as both "in" and "out" folders have been quiet for sync_settle seconds,
+        False if there was still activity after timeout (sync_timeout by default) seconds
+        """
+        if timeout is None:
+            timeout = self.sync_timeout
+
+        self.watch()
+        start = time.time()
+        deadline = start + timeout
+        # events queued before the call are treated as a fresh activity
+        last_activity = start
+        while True:
+            now = time.time()
+            if now - last_activity >= self.sync_settle:
+                logging.debug("Folders are quiet after %.2f s" % (now - start))
+                return True
+            if now >= deadline:
+                logging.debug("Folders are still changing after %.2f s" % (now - start))
+                return False
+            if self.watcher.poll(min(last_activity + self.sync_settle, deadline) - now):
+                last_activity = max(self.watcher.last_activity, last_activity)
+
+    def watch(self):
+        """
+        start watching test folders
+        """
+        if self.watcher is None:
+            self.watcher = create_watcher([self.local_folder_in, self.local_folder_out])
+            self.watcher.listener = self.on_fs_event
+
+    def sync_wait(self, timeout):
+        """
+        sleep for timeout seconds while handling filesystem events,
+        used between attempts of retried operations
+        """
+        self.watch()
+        deadline = time.time() + timeout
+        while True:
+            left = deadline - time.time()
+            if left <= 0:
+                return
+            self.watcher.poll(left)
+
+    def on_fs_event(self, path, exists, t):
+        """
+        an object has appeared in / disappeared from a watched folder
+        """
+        prefix = self.local_folder_out + os.sep
+        if path.startswith(prefix):
+            self.latency.observed(path[len(prefix):], exists, t)
+
 # virtual methods
     def start(self):
         """
@@ -174,12 +311,6 @@ class SyncTestApp(object):
         """
         raise NotImplementedError("Not Implemented !")
 
-    def sync(self):
-        """
-        wait for full synchronization
-        """
-        raise NotImplementedError("Not Implemented !")
-
     def pause(self):
         """
         pause application
@@ -197,3 +328,16 @@ class SyncTestApp(object):
         return True if application instance is running
         """
         raise NotImplementedError("Not Implemented !")
+
+    def pids(self):
+        """
+        return dictionary: instance name => pid of processes doing synchronization,
+        their resource usage is sampled during tests
+        """
+        return {}
+
+    def log_files(self):
+        """
+        return dictionary: instance name => SDK log file, parsed during tests
+        """
+        return {}
@@ -22,10 +22,23 @@ import os
 import random
 import string
 import shutil
-import hashlib
+import errno
 import unittest
 import logging
 import platform
+from sync_test_convergence import ConvergenceCheck
+from sync_test_stream import StreamingCheck
+from sync_test_resources import ResourceSampler
+from sync_test_sdklog import SdkLogTailer
+from sync_test_sdklog import sdklog_report
+from sync_test_hash import file_digest
+from sync_test_hash import get_hash
+from sync_test_hash import block_divergence
+from sync_test_hash import log_divergence
+from sync_test_manifest import Manifest
+from sync_test_tree import LocalTree
+from sync_test_tree import TreeGenerator
+from sync_test_tree import size_fixed
 
 def get_unicode_str(size=10, max_char=0xFFFF):
     '''
@@ -64,6 +77,23 @@ def get_random_str(size=10, chars=string.ascii_lowercase + string.ascii_uppercas
     """
     return ''.join(random.choice(chars) for x in range(size))
 
+def get_random_blocks(size, seed=None, block_size=2**20):
+    """
+    generator of incompressible random data
+    size: total size of data
+    seed: if set, a seeded PRNG is used to produce reproducible data, os.urandom otherwise
+    block_size: maximum size of a yielded block
+    """
+    if seed is not None:
+        rnd = random.Random(seed)
+    while size > 0:
+        n = min(size, block_size)
+        if seed is None:
+            yield os.urandom(n)
+        else:
+            yield ("%0*x" % (n * 2, rnd.getrandbits(n * 8))).decode("hex")
+        size -= n
+
 def generate_ascii_name(first_symbol, i):
     """
     generate random ASCII string
@@ -86,6 +116,14 @@ def generate_unicode_name(first_symbol, i):
     #logging.debug("Creating Unicode file:  %s" % (s.encode("unicode-escape")))
     return s
 
+def generate_non_bmp_name(first_symbol, i):
+    """
+    generate a name with characters outside of the Basic Multilingual Plane:
+    a surrogate pair, which is written to disk and listed back as a single character,
+    and a character above U+FFFF
+    """
+    return first_symbol + u"a" + unichr(0xD8B7) + unichr(0xDDE0) + u"b" + u"\U0001F600" + unicode(i)
+
 class SyncTestBase(unittest.TestCase):
     """
     Base class with MEGA SDK test helper methods
@@ -100,11 +138,136 @@ class SyncTestBase(unittest.TestCase):
 
         self.app = app
 
-        self.nr_retries = 200
         self.nr_files = 10
-        self.nr_dirs = 5
+        # directories of every kind created by dirs_create()
+        self.nr_dirs = 10
         self.local_obj_nr = 5
         self.force_syncing = False
+        # verifies "out" folder in background while the test is running
+        self.stream = None
+        # samples resource usage of application processes while the test is running
+        self.sampler = None
+        # parse application logs while the test is running
+        self.l_log_tailers = []
+
+    def setUp(self):
+        self.trace("test", [], self._testMethodName)
+        self.app.latency.reset()
+        self.app.retry.reset()
+        if self.app.fixtures is not None:
+            self.app.fixtures.reset()
+        if self.app.stream_verify:
+            self.stream = StreamingCheck(self.app.local_folder_out, self.digest_files, self.app.latency)
+        if self.app.resource_interval and self.app.pids():
+            self.sampler = ResourceSampler(self.app.pids, self.app.resource_interval)
+            self.sampler.start()
+        for name, fname in sorted(self.app.log_files().items()):
+            tailer = SdkLogTailer(fname, name)
+            if tailer.start():
+                self.l_log_tailers.append(tailer)
+
+    def tearDown(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.latency_report()
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.resource_report()
+            self.sampler = None
+        if self.l_log_tailers:
+            for tailer in self.l_log_tailers:
+                tailer.stop()
+            self.sdklog_report()
+            self.l_log_tailers = []
+
+    def trace_path(self, path):
+        """
+        return path relative to one of test folders, prefixed with its name
+        """
+        for prefix, root in (("in", self.app.local_folder_in), ("out", self.app.local_folder_out),
+                             ("mount_in", self.app.local_mount_in), ("mount_out", self.app.local_mount_out)):
+            if path == root or path.startswith(root + os.sep):
+                return prefix + "/" + path[len(root) + 1:]
+        return path
+
+    def trace(self, op, l_paths, *args):
+        """
+        record a filesystem operation if the application records a trace
+        """
+        if self.app.trace is not None:
+            self.app.trace.record(op, [self.trace_path(p) for p in l_paths], args)
+
+    def latency_issued(self, op, ffname, present=True):
+        """
+        operation op on ffname has been done in "in" folder,
+        its result must be observed in "out" folder
+        """
+        self.app.latency.issued(op, os.path.relpath(ffname, self.app.local_folder_in), present)
+
+    def latency_report(self):
+        """
+        save propagation latency and retried operations of the current test as JSON
+        and add them to the test report properties
+        """
+        test_name = self._testMethodName
+        summary = self.app.latency.summary()
+        retries = self.app.retry.summary()
+        if not summary and not retries:
+            return
+        for op, info in sorted(summary.items()):
+            if info["count"]:
+                logging.info("Latency [%s] %s: n=%d p50=%.3fs p90=%.3fs p99=%.3fs max=%.3fs" %
+                             (test_name, op, info["count"], info["p50"], info["p90"], info["p99"], info["max"]))
+        for name, info in sorted(retries.items()):
+            logging.debug("Retries [%s] %s: calls=%d attempts=%d time=%.3fs max=%.3fs failures=%d" %
+                          (test_name, name, info["calls"], info["attempts"], info["time"], info["max_time"], info["failures"]))
+        self.app.report_properties.update(self.app.latency.properties("latency.%s" % test_name))
+        self.app.report_properties.update(self.app.retry.properties("retry.%s" % test_name))
+
+        try:
+            os.makedirs(self.app.report_dir)
+        except OSError:
+            pass
+        self.app.latency.write_json(os.path.join(self.app.report_dir, "latency_%s.json" % test_name),
+                                 {"test": test_name, "retries": retries})
+
+    def resource_report(self):
+        """
+        save resource usage time series of application processes as JSON
+        and add peak values to the test report properties
+        """
+        test_name = self._testMethodName
+        for name, info in sorted(self.sampler.summary().items()):
+            logging.info("Resources [%s] %s: max_rss=%.1fMB cpu=%.2fs fds=%s threads=%d" %
+                         (test_name, name, info["max_rss"] / 1048576.0, info.get("cpu", 0.0),
+                          info.get("max_fds", "?"), info["max_threads"]))
+        self.app.report_properties.update(self.sampler.properties("resources.%s" % test_name))
+
+        try:
+            os.makedirs(self.app.report_dir)
+        except OSError:
+            pass
+        self.sampler.write_json(os.path.join(self.app.report_dir, "resources_%s.json" % test_name), {"test": test_name})
+
+    def sdklog_report(self):
+        """
+        save events parsed from application logs as JSON, add counters and timings to the test report properties
+        """
+        test_name = self._testMethodName
+        try:
+            os.makedirs(self.app.report_dir)
+        except OSError:
+            pass
+        summaries = sdklog_report(self.l_log_tailers, os.path.join(self.app.report_dir, "sdklog_%s.json" % test_name),
+                                  {"test": test_name})
+        for name, info in sorted(summaries.items()):
+            logging.info("SDK log [%s] %s: api=%d (retries %d, %.2fs) transfers=%d/%d (failed %d) up=%d down=%d bytes" %
+                         (test_name, name, info["api_requests"], info["api_retries"], info.get("api_latency_total", 0.0),
+                          info["transfers_finished"], info["transfers_started"], info["transfers_failed"],
+                          info["bytes_up"], info["bytes_down"]))
+            for key, value in info.iteritems():
+                self.app.report_properties["sdklog.%s.%s.%s" % (test_name, name, key)] = value
 
     def check_empty(self, folder_name):
         """
@@ -116,38 +279,113 @@ class SyncTestBase(unittest.TestCase):
         if not self.app.delete_tmp_files:
             return True
 
-        for r in range(0, self.nr_retries):
+        retry = self.app.retry.begin("check_empty", self.app.sync_wait)
+        while retry.next():
             try:
-                res = not os.listdir(folder_name)
+                l_names = os.listdir(folder_name)
             except OSError, e:
                 logging.error("Failed to list dir: %s (%s)" % (folder_name, e))
-                return False
+                return retry.done(False)
 
-            if res:
-                return True
+            if not l_names:
+                return retry.done(True)
 
-            logging.debug("Directory %s is not empty! Retrying [%d/%d] .." % (folder_name, r + 1, self.nr_retries))
+            logging.debug("Directory %s is not empty! Retrying %s .." % (folder_name, retry))
 
-            try:
-                shutil.rmtree(folder_name)
-            except OSError, e:
-                logging.error("Failed to delete folder: %s (%s)" % (folder_name, e))
-                return False
+            # remove leftovers, but keep the folder itself
+            for name in l_names:
+                path = os.path.join(folder_name, name)
+                try:
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        self.trace("rmtree", [path])
+                        shutil.rmtree(path)
+                    else:
+                        self.trace("remove", [path])
+                        os.remove(path)
+                except OSError, e:
+                    # the sync engine may be removing it at the same time
+                    if e.errno == errno.ENOENT:
+                        continue
+                    logging.error("Failed to delete: %s (%s)" % (path, e))
+                    return retry.done(False)
+
+        logging.error("Directory %s is not empty" % folder_name)
+        return retry.done(False)
 
     @staticmethod
     def md5_for_file(fname, block_size=2**20):
         """
         calculates md5 of a file
         """
-        fout = open(fname, 'r')
-        md5 = hashlib.md5()
-        while True:
-            data = fout.read(block_size)
-            if not data:
-                break
-            md5.update(data)
-        fout.close()
-        return md5.hexdigest()
+        return file_digest(fname, "md5", block_size)
+
+    def digest_files(self, l_fnames):
+        """
+        calculates digests (app.hash_algo) of several files in parallel,
+        digests of files with unchanged inode, size and mtime are taken from the cache
+        returns None for files which can't be read
+        """
+        return self.app.hash_cache.digest_files(l_fnames, self.app.hash_pool, self.app.hash_algo)
+
+    def manifest_create(self, folder_name):
+        """
+        return manifest of a folder
+        """
+        return Manifest.scan(folder_name, self.app.hash_cache, self.app.hash_pool, self.app.hash_algo)
+
+    def local_trees_diff(self):
+        """
+        compare "in" and "out" folders, log and return differences
+        files present in both folders are compared block by block to find out which bytes differ
+        """
+        diff = self.manifest_create(self.app.local_folder_in).diff(self.manifest_create(self.app.local_folder_out))
+        diff.log()
+        self.files_divergence(diff.size_mismatch + diff.digest_mismatch)
+        return diff
+
+    def files_divergence(self, l_rel_paths, max_files=10):
+        """
+        locate and log the first differing bytes of files in "in" and "out" folders
+        return dictionary: relative path => block_divergence() result
+        """
+        res = {}
+        for rel_path in l_rel_paths[:max_files]:
+            fname_in = os.path.join(self.app.local_folder_in, rel_path)
+            fname_out = os.path.join(self.app.local_folder_out, rel_path)
+            try:
+                res[rel_path] = block_divergence(fname_in, fname_out)
+            except (IOError, OSError), e:
+                logging.error("Failed to compare files: %s and %s (%s)" % (fname_in, fname_out, e))
+                continue
+            log_divergence(fname_in, fname_out, res[rel_path])
+        if len(l_rel_paths) > max_files:
+            logging.error("%d more files differ" % (len(l_rel_paths) - max_files))
+        return res
+
+    def convergence_check(self):
+        """
+        return an empty set of expectations for "out" folder
+        """
+        if self.stream is not None:
+            return self.stream
+        return ConvergenceCheck(self.app.local_folder_out, self.digest_files, self.app.latency)
+
+    def prefetch_file(self, ffname, fsize, digest):
+        """
+        a file has been created in "in" folder:
+        start verifying it as soon as it appears in "out" folder
+        """
+        if self.stream is not None:
+            self.stream.prefetch_file(os.path.relpath(ffname, self.app.local_folder_in), fsize, digest)
+
+    def wait_for_convergence(self, conv, name="convergence"):
+        """
+        wait until all expectations are met in "out" folder
+        name: name of the operation in retry records
+        return True if success
+        """
+        self.trace("wait", [], name)
+        return conv.wait(self.app.retry.begin(name, self.app.sync_wait))
 
     @staticmethod
     def touch(path):
@@ -158,14 +396,27 @@ class SyncTestBase(unittest.TestCase):
         with open(path, 'a'):
             os.utime(path, None)
 
-    @staticmethod
-    def file_create(fname, fsize):
+    def file_create(self, fname, fsize, seed=None, algo="md5"):
         """
         create a file of a size fsize and fill with a random data
-        """
-        fout = open(fname, 'wb')
-        fout.write(get_random_str(fsize))
-        fout.close()
+        digest is calculated while writing, so the file is never read back
+        return digest of the file
+        """
+        if seed is None and self.app.fixtures is not None:
+            # a copy of a file generated by a previous run, its digest is already known
+            digest, seed = self.app.fixtures.place(fname, fsize, algo)
+            self.trace("create", [fname], fsize, seed)
+            return digest
+        if seed is None and self.app.trace is not None:
+            # the content must be reproducible
+            seed = random.getrandbits(63)
+        self.trace("create", [fname], fsize, seed)
+        h = get_hash(algo)
+        with open(fname, 'wb') as fout:
+            for data in get_random_blocks(fsize, seed):
+                h.update(data)
+                fout.write(data)
+        return h.hexdigest()
 
     def files_create_size(self, first_symbol, maxsize, nr_files, dname, file_generate_name_func, l_files):
         """
@@ -176,16 +427,19 @@ class SyncTestBase(unittest.TestCase):
             ffname = os.path.join(dname, fname)
             if maxsize == 0:
                 fsize = 0
+            elif self.app.fixtures is not None:
+                fsize = self.app.fixtures.tier_size(maxsize, i)
             else:
                 fsize = random.randint(1, maxsize)
 
             try:
-                self.file_create(ffname, fsize)
+                md5_str = self.file_create(ffname, fsize, algo=self.app.hash_algo)
             except IOError, e:
                 logging.error("Failed to create file: %s (%s)" % (ffname, e))
                 return False
-            md5_str = self.md5_for_file(ffname)
             l_files.append({"name":fname, "size":fsize, "md5":md5_str, "name_orig":fname})
+            self.latency_issued("create_file", ffname)
+            self.prefetch_file(ffname, fsize, md5_str)
             logging.debug("File created: %s [%s, %db]" % (ffname, md5_str, fsize))
         return True
 
@@ -231,37 +485,14 @@ class SyncTestBase(unittest.TestCase):
         """
         logging.debug("Checking files..")
 
-        # check files
+        conv = self.convergence_check()
         for f in l_files:
-            dd_out = os.path.join(self.app.local_folder_out, dir_name)
-            ffname = os.path.join(dd_out, f["name"])
-
-            dd_in = os.path.join(self.app.local_folder_in, dir_name)
-            ffname_in = os.path.join(dd_in, f["name"])
+            conv.expect_file(os.path.join(dir_name, f["name"]), f["size"], f["md5"])
 
-            success = False
-
-            logging.debug("Comparing %s and %s" % (ffname_in, ffname))
-            # try to access the file
-            for r in range(0, self.nr_retries):
-                try:
-                    with open(ffname):
-                        pass
-                    success = True
-                    break
-                except IOError:
-                    # wait for a file
-                    logging.debug("File %s not found! Retrying [%d/%d] .." % (ffname, r + 1, self.nr_retries))
-                    logging.debug("%s" % (ffname.encode("unicode-escape")))
-                    self.app.sync()
-            if success is False:
-                logging.error("Failed to compare files: %s and %s" % (ffname_in, ffname))
-                return False
-            # get md5 of synced file
-            md5_str = self.md5_for_file(ffname)
-            if md5_str != f["md5"]:
-                logging.error("MD5 sums don't match for file: %s" % ffname)
-                return False
+        if not self.wait_for_convergence(conv, "files_check"):
+            logging.error("Failed to compare files in: %s" % os.path.join(self.app.local_folder_out, dir_name))
+            self.local_trees_diff()
+            return False
         return True
 
     def dir_create(self, dname, files_num, files_maxsize, file_generate_name_func=generate_ascii_name):
@@ -269,6 +500,7 @@ class SyncTestBase(unittest.TestCase):
         create and fill directory with files
         return files list
         """
+        self.trace("mkdir", [dname])
         try:
             os.makedirs(dname)
         except OSError, e:
@@ -294,6 +526,7 @@ class SyncTestBase(unittest.TestCase):
                 logging.error("Failed to create directory: %s" % ddname)
                 return False
             l_dirs.append({"name":dname, "files_nr":files_num, "name_orig":dname, "l_files":l_files})
+            self.latency_issued("create_dir", ddname)
             logging.debug("Directory created: %s [%d files]" % (ddname, files_num))
         return True
 
@@ -306,12 +539,12 @@ class SyncTestBase(unittest.TestCase):
         l_dirs = []
 
         # create empty dirs
-        res = self.dir_create_size("z", 10, 0, 0, self.app.local_folder_in, dir_generate_name_func, l_dirs)
+        res = self.dir_create_size("z", self.nr_dirs, 0, 0, self.app.local_folder_in, dir_generate_name_func, l_dirs)
         if not res:
             return None
 
         # create dirs with < 20 files
-        res = self.dir_create_size("d", 10, 10, 1024, self.app.local_folder_in, dir_generate_name_func, l_dirs)
+        res = self.dir_create_size("d", self.nr_dirs, 10, 1024, self.app.local_folder_in, dir_generate_name_func, l_dirs)
         if not res:
             return None
 
@@ -326,37 +559,26 @@ class SyncTestBase(unittest.TestCase):
         """
         logging.debug("Checking directories..")
 
-        for d in l_dirs:
-            dname = os.path.join(self.app.local_folder_out, d["name"])
-            dname_in = os.path.join(self.app.local_folder_in, d["name"])
-            success = False
-
-            logging.debug("Comparing dirs: %s and %s" % (dname_in, dname))
-
-            # try to access the dir
-            for r in range(0, self.nr_retries):
-                try:
-                    if os.path.isdir(dname):
-                        success = True
-                        break
-                    else:
-                        # wait for a dir
-                        logging.debug("Directory %s not found! Retrying [%d/%d].." % (dname, r + 1, self.nr_retries))
-                        self.app.sync()
-                except OSError:
-                    # wait for a dir
-                    logging.debug("Directory %s not found! Retrying [%d/%d].." % (dname, r + 1, self.nr_retries))
-                    self.app.sync()
-            if success is False:
-                logging.error("Failed to access directories: %s and " % dname)
-                return False
+        # directories whose Merkle digests match the expected content on both sides are in sync,
+        # both trees are still scanned (hashing only files not in the hash cache) on every call
+        expected = Manifest.from_dirs(self.app.local_folder_in, l_dirs)
+        in_manifest = self.manifest_create(self.app.local_folder_in)
+        out_manifest = self.manifest_create(self.app.local_folder_out)
+        l_dirs = [d for d in l_dirs if expected.merkle_diff(in_manifest, d["name"]) or
+                  expected.merkle_diff(out_manifest, d["name"])]
+        if not l_dirs:
+            return True
 
-            # check files
-            res = self.files_check(d["l_files"], d["name"])
-            if not res:
-                logging.error("Directories do not match !")
-                return False
+        conv = self.convergence_check()
+        for d in l_dirs:
+            conv.expect_dir(d["name"])
+            for f in d["l_files"]:
+                conv.expect_file(os.path.join(d["name"], f["name"]), f["size"], f["md5"])
 
+        if not self.wait_for_convergence(conv, "dirs_check"):
+            logging.error("Directories do not match !")
+            self.local_trees_diff()
+            return False
         return True
 
     def file_rename(self, ffname_src, ffname_dst):
@@ -365,25 +587,28 @@ class SyncTestBase(unittest.TestCase):
         return True if renamed
         """
 
-        for r in range(0, self.nr_retries):
+        retry = self.app.retry.begin("file_rename", self.app.sync_wait)
+        while retry.next():
             if os.path.exists(ffname_src):
+                self.trace("move", [ffname_src, ffname_dst])
                 try:
                     shutil.move(ffname_src, ffname_dst)
                 except OSError, e:
                     logging.error("Failed to rename file: %s (%s)" % (ffname_src, e))
-                    return False
+                    return retry.done(False)
 
             if self.force_syncing:
                 self.app.sync()
 
             # try to access both files (old and new)
             if not os.path.exists(ffname_dst):
-                logging.debug("Failed to access a newly renamed file: %s, retrying [%d/%d].." % (ffname_dst, r + 1, self.nr_retries))
+                logging.debug("Failed to access a newly renamed file: %s, retrying %s.." % (ffname_dst, retry))
                 continue
             if os.path.exists(ffname_src):
-                logging.debug("Still can access an old renamed file: %s, retrying [%d/%d]" % (ffname_src, r + 1, self.nr_retries))
+                logging.debug("Still can access an old renamed file: %s, retrying %s" % (ffname_src, retry))
                 continue
             break
+        retry.done(os.path.exists(ffname_dst) and not os.path.exists(ffname_src))
 
         # try to access both files (old and new)
         if not os.path.exists(ffname_dst):
@@ -411,6 +636,7 @@ class SyncTestBase(unittest.TestCase):
 
             if not self.file_rename(ffname_src, ffname_dst):
                 return False
+            self.latency_issued("rename_file", ffname_dst)
 
         return True
 
@@ -425,12 +651,16 @@ class SyncTestBase(unittest.TestCase):
 
             logging.debug("Deleting: %s" % ffname)
 
-            for r in range(0, self.nr_retries):
-                try:
-                    os.remove(ffname)
-                except OSError, e:
-                    logging.error("Failed to delete file: %s (%s)" % (ffname, e))
-                    return False
+            retry = self.app.retry.begin("file_remove", self.app.sync_wait)
+            while retry.next():
+                if os.path.exists(ffname):
+                    self.trace("remove", [ffname])
+                    try:
+                        os.remove(ffname)
+                    except OSError, e:
+                        logging.error("Failed to delete file: %s (%s)" % (ffname, e))
+                        return retry.done(False)
+                    self.latency_issued("delete_file", ffname, False)
 
                 if self.force_syncing:
                     self.app.sync()
@@ -438,28 +668,16 @@ class SyncTestBase(unittest.TestCase):
                 # check if local file does not exist
                 if not os.path.exists(ffname):
                     break
-                logging.debug("Deleted file %s still exists, retrying [%d/%d].." % (ffname, r + 1, self.nr_retries))
+                logging.debug("Deleted file %s still exists, retrying %s.." % (ffname, retry))
 
-            if os.path.exists(ffname):
+            if not retry.done(not os.path.exists(ffname)):
                 logging.debug("Deleted file %s still exists, aborting.." % ffname)
 
-        success = False
+        # files must be deleted
+        conv = self.convergence_check()
         for f in l_files:
-            ffname = os.path.join(self.app.local_folder_out, f["name"])
-            for r in range(0, self.nr_retries):
-                try:
-                    # file must be deleted
-                    with open(ffname):
-                        pass
-                    logging.debug("File %s is not deleted. Retrying [%d/%d] .." % (ffname, r + 1, self.nr_retries))
-                    self.app.sync()
-                except IOError:
-                    success = True
-                    break
-            if success is False:
-                logging.error("Failed to delete file: %s" % ffname)
-                return False
-        return True
+            conv.expect_absent(f["name"])
+        return self.wait_for_convergence(conv, "files_remove")
 
     def dirs_rename(self, l_dirs, dir_generate_name_func=generate_ascii_name):
         """
@@ -473,11 +691,13 @@ class SyncTestBase(unittest.TestCase):
             d["name"] = dir_generate_name_func("renamed_", i)
             i = i + 1
             dname_dst = os.path.join(self.app.local_folder_in, d["name"])
+            self.trace("move", [dname_src, dname_dst])
             try:
                 shutil.move(dname_src, dname_dst)
             except OSError, e:
                 logging.error("Failed to rename directory: %s (%s)" % (dname_src, e))
                 return False
+            self.latency_issued("rename_dir", dname_dst)
 
             if self.force_syncing:
                 self.app.sync()
@@ -502,11 +722,13 @@ class SyncTestBase(unittest.TestCase):
 
         for d in l_dirs:
             dname = os.path.join(self.app.local_folder_in, d["name"])
+            self.trace("rmtree", [dname])
             try:
                 shutil.rmtree(dname)
             except OSError, e:
                 logging.error("Failed to delete dir: %s (%s)" % (dname, e))
                 return False
+            self.latency_issued("delete_dir", dname, False)
             logging.debug("Directory removed: %s" % dname)
 
             if self.force_syncing:
@@ -516,24 +738,11 @@ class SyncTestBase(unittest.TestCase):
                 logging.error("Still can access a renamed directory: %s" % dname)
                 return False
 
-        success = False
+        # dirs must be deleted
+        conv = self.convergence_check()
         for d in l_dirs:
-            dname = os.path.join(self.app.local_folder_out, d["name"])
-            for r in range(0, self.nr_retries):
-                try:
-                    # dir must be deleted
-                    if not os.path.isdir(dname):
-                        success = True
-                        break
-                    logging.debug("Directory %s is not deleted! Retrying [%d/%d] .." % (dname, r + 1, self.nr_retries))
-                    self.app.sync()
-                except OSError:
-                    success = True
-                    break
-            if success is False:
-                logging.error("Failed to delete dir: %s" % dname)
-                return False
-        return True
+            conv.expect_absent(d["name"])
+        return self.wait_for_convergence(conv, "dirs_remove")
 
     def dirs_check_empty(self):
         """
@@ -541,164 +750,128 @@ class SyncTestBase(unittest.TestCase):
         """
         return self.check_empty(self.app.local_folder_in) and self.check_empty(self.app.local_folder_out)
 
-    def local_tree_create_dir(self, parent_dir):
+    def local_tree_create_dir(self, tree, parent):
         """
-        generate directory
+        generate directory, populate with random amount of files and empty subdirectories
+        return index of the new directory in the tree, None on failure
         """
         strlen = random.randint(10, 20)
         dname = get_random_str(size=strlen)
-        ddname = os.path.join(parent_dir, dname)
-        real_dname = os.path.join(self.app.local_folder_in, ddname)
+        real_dname = os.path.join(self.app.local_folder_in, tree.path(parent), dname)
 
+        self.trace("mkdir", [real_dname])
         try:
             os.makedirs(real_dname)
         except OSError, e:
             logging.error("Failed to create directory: %s (%s)" % (real_dname, e))
-            return None, None, None, None
+            return None
+        idx = tree.add_dir(parent, dname)
+        self.latency_issued("create_dir", real_dname)
 
         # populate with random amount of files
         obj_nr = random.randint(1, self.local_obj_nr)
-        l_files = []
         for _ in range(0, obj_nr):
             strlen = random.randint(10, 20)
             fname = get_random_str(size=strlen) + ".txt"
-            ffname = os.path.join(ddname, fname)
-            fname_real = os.path.join(self.app.local_folder_in, ffname)
+            fname_real = os.path.join(real_dname, fname)
+            fsize = random.randint(10, 100)
             try:
-                self.file_create(fname_real, random.randint(10, 100))
+                digest = self.file_create(fname_real, fsize, algo=self.app.hash_algo)
             except IOError, e:
                 logging.error("Failed to create file: %s (%s)" % (fname_real, e))
-                return None, None, None, None
-            l_files.append({"name":fname, "fname":ffname})
+                return None
+            tree.add_file(idx, fname, fsize, digest)
+            self.latency_issued("create_file", fname_real)
 
         # populate with random amount of dirs
         obj_nr = random.randint(1, self.local_obj_nr)
-        l_dirs = []
         for _ in range(0, obj_nr):
             strlen = random.randint(10, 20)
             cname = get_random_str(size=strlen)
-            ccname = os.path.join(ddname, cname)
-            cname_real = os.path.join(self.app.local_folder_in, ccname)
+            cname_real = os.path.join(real_dname, cname)
+            self.trace("mkdir", [cname_real])
             try:
                 os.makedirs(cname_real)
             except OSError, e:
                 logging.error("Failed to create directory: %s (%s)" % (cname_real, e))
-                return None, None, None, None
-            l_dirs.append({"name":cname, "fname":ccname})
+                return None
+            tree.add_dir(idx, cname)
+            self.latency_issued("create_dir", cname_real)
 
-            # recursively create subtree
-        return dname, ddname, l_files, l_dirs
+        return idx
 
-    def local_tree_create(self, parent_dir, dirs_nr):
+    def local_tree_create(self, dirs_nr):
         """
-        generate local directory tree, recursively populate with random number of directories / files
-        return list of dictionaries
+        generate local directory tree, populate with random number of directories / files:
+        dirs_nr directories at the top level, each of them contains (dirs_nr - 1) directories and so on
+        return LocalTree
         """
-        if dirs_nr == 0:
-            return None
-
-        l_tree = []
+        tree = LocalTree()
 
-        for _ in range(0, dirs_nr):
-            dname, ddname, l_files, l_dirs = self.local_tree_create_dir(parent_dir)
-            if dname is None:
-                return None
-            l_child = self.local_tree_create(ddname, dirs_nr - 1)
-            l_tree.append({"name":dname, "fname":ddname, "files":l_files, "dirs":l_dirs, "child":l_child})
-        return l_tree
+        stack = [(LocalTree.ROOT, dirs_nr)]
+        while stack:
+            parent, nr = stack.pop()
+            for _ in range(0, nr):
+                idx = self.local_tree_create_dir(tree, parent)
+                if idx is None:
+                    return None
+                if nr > 1:
+                    stack.append((idx, nr - 1))
+        return tree
 
-    def local_tree_get_dir(self, l_tree):
+    def local_tree_generate(self, depth, fanout, files_nr, size_func=size_fixed(0)):
         """
-        directory walk generator
-        Returns relative directory path
+        generate a tree of a given shape in "in" folder using a pool of threads
+        return (LocalTree, expected Manifest)
         """
-        for i in l_tree:
-            yield i["fname"]
-            for dd in i["dirs"]:
-                yield dd["fname"]
-            if i["child"] is not None:
-                for x in self.local_tree_get_dir(i["child"]):
-                    yield x
+        generator = TreeGenerator(self.file_create, depth, fanout, files_nr, size_func, algo=self.app.hash_algo,
+                                  trace=self.trace)
+        return generator.generate(self.app.local_folder_in)
 
-    def local_tree_get_dirs(self, l_tree):
+    def local_tree_check(self, manifest):
         """
-        directory walk generator
-        Returns dir dict
+        compare "out" folder with an expected manifest using Merkle digests
+        return True if they are the same
         """
-        for i in l_tree:
-            yield i
-            if i["child"] is not None:
-                for x in self.local_tree_get_dirs(i["child"]):
-                    yield x
+        self.trace("wait", [], "local_tree_check")
+        retry = self.app.retry.begin("local_tree_check", self.app.sync_wait)
+        while retry.next():
+            out_manifest = self.manifest_create(self.app.local_folder_out)
+            l_diff = manifest.merkle_diff(out_manifest)
+            if not l_diff:
+                return retry.done(True)
+            logging.debug("%d objects are not synced yet. Retrying %s .." % (len(l_diff), retry))
 
-    def local_tree_get_file(self, l_tree):
-        """
-        directory walk generator
-        Returns relative file path
-        """
-        for i in l_tree:
-            for ff in i["files"]:
-                yield ff["fname"]
-            if i["child"] is not None:
-                for x in self.local_tree_get_file(i["child"]):
-                    yield x
+        retry.done(False)
+        for rel_path in l_diff:
+            logging.error("Object does not match: %s" % rel_path)
+        return False
 
-    def local_tree_compare(self, l_tree):
+    def local_tree_compare(self, tree, idx=LocalTree.ROOT):
         """
-        compare two local trees
+        compare "out" folder with a (sub)tree
         return True if they are the same
         """
         total_dirs = total_files = 0
+        conv = self.convergence_check()
 
-        # try to access directories in "out" folder
-        for d in self.local_tree_get_dir(l_tree):
-            dname = os.path.join(self.app.local_folder_out, d)
-            success = False
-            total_dirs = total_dirs + 1
-
-            # logging.debug("Trying to access dir: %s" % dname)
-            for r in range(0, self.nr_retries):
-                try:
-                    if os.path.isdir(dname):
-                        success = True
-                        break
-                    else:
-                        # wait for a dir
-                        logging.debug("Directory %s not found! Retrying [%d/%d].." % (dname, r + 1, self.nr_retries))
-                        self.app.sync()
-                except OSError:
-                    # wait for a dir
-                    logging.debug("Directory %s not found! Retrying [%d/%d].." % (dname, r + 1, self.nr_retries))
-                    self.app.sync()
-            if success is False:
-                logging.error("Failed to access directories: %s and " % dname)
-                return False
-
-        # try to access files in "out" folder
-        for f in self.local_tree_get_file(l_tree):
-            fname = os.path.join(self.app.local_folder_out, f)
-            success = False
-            total_files = total_files + 1
+        # directories and files must exist in "out" folder
+        for i, path in tree.walk(idx):
+            if tree.is_dir[i]:
+                conv.expect_dir(path)
+                total_dirs = total_dirs + 1
+            else:
+                conv.expect_file(path)
+                total_files = total_files + 1
 
-            # logging.debug("Trying to access file: %s" % fname)
-            for r in range(0, self.nr_retries):
-                try:
-                    with open(fname):
-                        pass
-                    success = True
-                    break
-                except IOError:
-                    # wait for a file
-                    logging.debug("File %s not found! Retrying [%d/%d] .." % (fname, r + 1, self.nr_retries))
-                    self.app.sync()
-            if success is False:
-                logging.error("Failed to access file: %s" % fname)
-                return False
+        if not self.wait_for_convergence(conv, "local_tree_compare"):
+            self.local_trees_diff()
+            return False
 
         logging.debug("Total dirs: %d, files: %d" % (total_dirs, total_files))
         return True
 
-    def local_tree_create_and_move(self, l_tree):
+    def local_tree_create_and_move(self, tree):
         """
         create a folder and fill with content
         randomly select an existing folder and create a subfolder of it
@@ -708,152 +881,100 @@ class SyncTestBase(unittest.TestCase):
         """
 
         for _ in range(0, 10):
+            # select random existing folder
+            dd = tree.random_dir()
+
             # Create a dir
-            l_dir = []
-            dname, ddname, l_files, l_dirs = self.local_tree_create_dir("")
-            if dname is None:
+            idx = self.local_tree_create_dir(tree, LocalTree.ROOT)
+            if idx is None:
                 return False
-            logging.debug("Directory created: %s" % ddname)
-            l_dir.append({"name":dname, "fname":ddname, "files":l_files, "dirs":l_dirs, "child":None})
+            logging.debug("Directory created: %s" % tree.path(idx))
 
             # wait for a sync and compare
-            if not self.local_tree_compare(l_dir):
+            if not self.local_tree_compare(tree, idx):
                 return False
 
             self.app.sync()
 
-            # select random existing folder
-            dir_dicts_l = [d for d in self.local_tree_get_dirs(l_tree)]
-            dd = random.choice(dir_dicts_l)
-
-            if dd["dirs"] is None:
-                dd["dirs"] = []
-
             # create a new subfolder
             strlen = random.randint(10, 20)
             dname = get_random_str(size=strlen)
-            ddname = os.path.join(dd["fname"], dname)
-            dname_real = os.path.join(self.app.local_folder_in, ddname)
-            logging.debug("Creating new dir: %s, parent: %s" % (ddname, dd["fname"]))
+            dname_real = os.path.join(self.app.local_folder_in, tree.path(dd), dname)
+            logging.debug("Creating new dir: %s, parent: %s" % (dname, tree.path(dd)))
+            self.trace("mkdir", [dname_real])
             try:
                 os.makedirs(dname_real)
             except OSError, e:
                 logging.error("Failed to create directory: %s (%s)" % (dname_real, e))
                 return False
-
-            dd["dirs"].append({"name":dname, "fname":ddname, "files":None, "dirs":None, "child":None})
+            new_idx = tree.add_dir(dd, dname)
+            self.latency_issued("create_dir", dname_real)
 
             # move existing folder into newly created folder
-            old_name = os.path.join(self.app.local_folder_in, l_dir[0]["fname"])
-            new_name = os.path.join(dname_real, l_dir[0]["name"])
+            old_name = os.path.join(self.app.local_folder_in, tree.path(idx))
+            new_name = os.path.join(dname_real, tree.names[idx])
 
             logging.debug("Moving %s to %s" % (old_name, new_name))
 
+            self.trace("move", [old_name, new_name])
             try:
                 shutil.move(old_name, new_name)
             except OSError, e:
                 logging.error("Failed to move dir: %s to new: %s (%s)" % (old_name, new_name, e))
                 return False
-
-            # fix existing dir dict
-            new_ffname = os.path.join(ddname, l_dir[0]["name"])
-            l_dir[0]["fname"] = new_ffname
-            for f in l_dir[0]["files"]:
-                f["ffname"] = os.path.join(new_ffname, f["name"])
-            for d in l_dir[0]["dirs"]:
-                d["ffname"] = os.path.join(new_ffname, d["name"])
+            tree.move(idx, new_idx)
+            self.latency_issued("move_dir", new_name)
 
             self.app.sync()
 
             # wait for a sync and compare
-            if not self.local_tree_compare(l_tree):
+            if not self.local_tree_compare(tree):
                 return False
 
         # all good !
         return True
 
-    def local_tree_multiple_renames(self, l_tree):
+    def local_tree_multiple_renames(self, tree):
         """
         perform several object renames
         then rename back to the original name
         """
 
-        # rename dirs
-        for _ in range(0, 10):
-            # select random existing folder
-            dir_dicts_l = [d for d in self.local_tree_get_dirs(l_tree)]
-            dd = random.choice(dir_dicts_l)
-            if dd["dirs"] is None:
-                continue
-
-            oname = dd["dirs"][0]["name"]
-            odname = os.path.join(dd["fname"], oname)
-            orig_name = os.path.join(self.app.local_folder_in, odname)
-            prev_name = orig_name
-
-            # rename 10 times
+        # rename dirs, then files
+        for is_dir in (True, False):
             for _ in range(0, 10):
-                strlen = random.randint(10, 20)
-                dname = get_random_str(size=strlen)
-                ddname = os.path.join(dd["fname"], dname)
-                dname_real = os.path.join(self.app.local_folder_in, ddname)
+                # select random existing folder
+                dd = tree.random_dir()
+                obj = tree.first(dd, is_dir)
+                if obj == LocalTree.NONE:
+                    continue
 
-                logging.debug("Renaming %s to %s" % (prev_name, dname_real))
+                orig_name = os.path.join(self.app.local_folder_in, tree.path(obj))
+                prev_name = orig_name
 
-                if not self.file_rename(prev_name, dname_real):
-                    return False
+                # rename 10 times
+                for _ in range(0, 10):
+                    strlen = random.randint(10, 20)
+                    dname = get_random_str(size=strlen)
+                    dname_real = os.path.join(self.app.local_folder_in, tree.path(dd), dname)
 
-                prev_name = dname_real
+                    logging.debug("Renaming %s to %s" % (prev_name, dname_real))
 
-            # rename back to origin
-            logging.debug("Moving %s to %s" % (prev_name, orig_name))
+                    if not self.file_rename(prev_name, dname_real):
+                        return False
 
-            if not self.file_rename(prev_name, orig_name):
-                return False
+                    prev_name = dname_real
 
-            self.app.sync()
-
-            # wait for a sync and compare
-            if not self.local_tree_compare(l_tree):
-                return False
+                # rename back to origin
+                logging.debug("Moving %s to %s" % (prev_name, orig_name))
 
-        # rename files
-        for _ in range(0, 10):
-            # select random existing folder
-            dir_dicts_l = [d for d in self.local_tree_get_dirs(l_tree)]
-            dd = random.choice(dir_dicts_l)
-            if dd["files"] is None:
-                continue
-
-            oname = dd["files"][0]["name"]
-            odname = os.path.join(dd["fname"], oname)
-            orig_name = os.path.join(self.app.local_folder_in, odname)
-            prev_name = orig_name
-
-            # rename 10 times
-            for _ in range(0, 10):
-                strlen = random.randint(10, 20)
-                dname = get_random_str(size=strlen)
-                ddname = os.path.join(dd["fname"], dname)
-                dname_real = os.path.join(self.app.local_folder_in, ddname)
-
-                logging.debug("Renaming %s to %s" % (prev_name, dname_real))
-
-                if not self.file_rename(prev_name, dname_real):
+                if not self.file_rename(prev_name, orig_name):
                     return False
 
-                prev_name = dname_real
-
-            # rename back to origin
-            logging.debug("Moving %s to %s" % (prev_name, orig_name))
-
-            if not self.file_rename(prev_name, orig_name):
-                return False
-
-            self.app.sync()
+                self.app.sync()
 
-            # wait for a sync and compare
-            if not self.local_tree_compare(l_tree):
-                return False
+                # wait for a sync and compare
+                if not self.local_tree_compare(tree):
+                    return False
 
         return True
@@ -0,0 +1,255 @@
+"""
+ Performance benchmarks for syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+from sync_test_base import SyncTestBase
+from sync_test_tree import size_fixed
+from sync_test_report import flatten_summary, write_json_report
+import os
+import time
+import math
+import shutil
+import logging
+
+# two-sided 95% Student's t critical values, by degrees of freedom
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def mean_ci(l_values):
+    """
+    return (mean, half width of 95% confidence interval) of a list of measurements
+    """
+    n = len(l_values)
+    mean = sum(l_values) / float(n)
+    if n < 2:
+        return mean, None
+    stdev = math.sqrt(sum((v - mean) ** 2 for v in l_values) / (n - 1))
+    t = T_95[n - 2] if n - 2 < len(T_95) else 1.96
+    return mean, t * stdev / math.sqrt(n)
+
+
+class SyncBenchmark(SyncTestBase):
+    """
+    Class with MEGA SDK sync performance benchmarks
+    every scenario is repeated nr_trials times
+    """
+    # lower bound of measured times, seconds
+    MIN_ELAPSED = 1e-3
+
+    def __init__(self, methodName, app, nr_trials=5):
+        super(SyncBenchmark, self).__init__(methodName, app)
+        self.nr_trials = nr_trials
+
+        # large files scenario
+        self.bench_large_nr = 5
+        self.bench_large_size = 20 * 1024 * 1024
+        # tiny files scenario
+        self.bench_small_nr = 1000
+        self.bench_small_size = 1024
+        # deep tree scenario
+        self.bench_tree_depth = 8
+        self.bench_tree_fanout = 2
+        self.bench_tree_files = 2
+        # backlog scenario: changes made while the application is paused
+        self.bench_backlog_nr = 500
+        self.bench_backlog_size = 4096
+
+    def converged_at(self):
+        """
+        return time when the last operation was observed in "out" folder
+        """
+        if self.app.latency.pending or self.app.latency.last_observed is None:
+            return time.time()
+        return self.app.latency.last_observed
+
+    def converge_time(self, start):
+        """
+        return time from start until the last operation was observed in "out" folder
+        """
+        # the last observation may precede start (timer resolution, events of objects created
+        # while the application was paused), keep rates finite
+        return max(self.converged_at() - start, self.MIN_ELAPSED)
+
+    def files_create_flat(self, nr_files, fsize):
+        """
+        create nr_files of fsize bytes in "in" folder, return list of files
+        """
+        l_files = []
+        for i in range(nr_files):
+            fname = "b%06d" % i
+            ffname = os.path.join(self.app.local_folder_in, fname)
+            try:
+                md5_str = self.file_create(ffname, fsize, algo=self.app.hash_algo)
+            except IOError, e:
+                logging.error("Failed to create file: %s (%s)" % (ffname, e))
+                return None
+            l_files.append({"name":fname, "size":fsize, "md5":md5_str, "name_orig":fname})
+            self.latency_issued("create_file", ffname)
+            self.prefetch_file(ffname, fsize, md5_str)
+        return l_files
+
+    def bench_report(self, name, l_results):
+        """
+        log mean and confidence interval of every metric,
+        save all trials as JSON and add summary to the test report properties
+        """
+        summary = {}
+        for metric in sorted(l_results[0].keys()):
+            l_values = [res[metric] for res in l_results]
+            mean, ci = mean_ci(l_values)
+            summary[metric] = {"mean": mean, "ci95": ci, "min": min(l_values), "max": max(l_values)}
+            if ci is None:
+                logging.info("Benchmark [%s] %s: %.3f" % (name, metric, mean))
+            else:
+                logging.info("Benchmark [%s] %s: %.3f +- %.3f (95%% CI, %d trials)" % (name, metric, mean, ci, len(l_values)))
+        self.app.report_properties.update(flatten_summary("bench.%s" % name, summary))
+
+        data = {"benchmark": name, "trials": l_results, "summary": summary}
+        if self.app.storage is not None:
+            data["storage"] = self.app.storage.properties()
+        write_json_report(os.path.join(self.app.report_dir, "bench_%s.json" % name), data, "benchmark")
+
+    def bench_files(self, name, nr_files, fsize):
+        """
+        create files, measure time until they are synced, remove them
+        """
+        l_results = []
+        for trial in range(0, self.nr_trials):
+            logging.info("Benchmark [%s] trial %d/%d" % (name, trial + 1, self.nr_trials))
+            self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+            self.app.latency.reset()
+
+            start = time.time()
+            l_files = self.files_create_flat(nr_files, fsize)
+            self.assertIsNotNone(l_files, "Creating files")
+            created = time.time()
+
+            self.assertTrue(self.files_check(l_files), "Comparing files")
+            elapsed = self.converge_time(start)
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+            total_size = sum(f["size"] for f in l_files)
+            l_results.append({"create_time": created - start,
+                              "converge_time": elapsed,
+                              "mb_per_sec": total_size / elapsed / 2**20,
+                              "files_per_sec": len(l_files) / elapsed})
+
+            self.assertTrue(self.files_remove(l_files), "Removing files")
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        self.bench_report(name, l_results)
+
+# benchmarks
+    def test_bench_large_files(self):
+        """
+        sustained throughput (MB/s) of large files
+        """
+        logging.info("Launching test_bench_large_files benchmark")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+        self.bench_files("large_files", self.bench_large_nr, self.bench_large_size)
+
+    def test_bench_small_files(self):
+        """
+        throughput (files/s) of tiny files
+        """
+        logging.info("Launching test_bench_small_files benchmark")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+        self.bench_files("small_files", self.bench_small_nr, self.bench_small_size)
+
+    def test_bench_deep_tree(self):
+        """
+        time to converge for a deep directory tree
+        """
+        logging.info("Launching test_bench_deep_tree benchmark")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        l_results = []
+        for trial in range(0, self.nr_trials):
+            logging.info("Benchmark [deep_tree] trial %d/%d" % (trial + 1, self.nr_trials))
+            self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+            self.app.latency.reset()
+
+            start = time.time()
+            tree, manifest = self.local_tree_generate(self.bench_tree_depth, self.bench_tree_fanout, self.bench_tree_files,
+                                                      size_fixed(self.bench_small_size))
+            self.assertIsNotNone(tree, "Failed to create directory tree!")
+            created = time.time()
+
+            # generated objects are not tracked by LatencyTracker: measured from the end of creation
+            # until local_tree_check() matches, which includes its retry interval and rescanning
+            # (and rehashing files not in the hash cache of) the whole "out" tree
+            self.assertTrue(self.local_tree_check(manifest), "Failed to compare directory trees!")
+            elapsed = max(time.time() - created, self.MIN_ELAPSED)
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+            # the root is not synced
+            l_results.append({"create_time": created - start,
+                              "converge_time": elapsed,
+                              "objects_per_sec": (len(tree) - 1) / elapsed})
+
+            # remove the tree
+            conv = self.convergence_check()
+            for idx in tree.children(tree.ROOT):
+                dname = os.path.join(self.app.local_folder_in, tree.names[idx])
+                self.trace("rmtree", [dname])
+                shutil.rmtree(dname)
+                conv.expect_absent(tree.names[idx])
+            self.assertTrue(self.wait_for_convergence(conv, "tree_remove"), "Removing directories")
+
+        self.bench_report("deep_tree", l_results)
+
+    def test_bench_backlog(self):
+        """
+        catch-up after an outage: changes are made while the application is paused,
+        time to converge and throughput are measured from the moment it is resumed
+        """
+        logging.info("Launching test_bench_backlog benchmark")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        l_results = []
+        for trial in range(0, self.nr_trials):
+            logging.info("Benchmark [backlog] trial %d/%d" % (trial + 1, self.nr_trials))
+            self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+            self.app.latency.reset()
+
+            start = time.time()
+            self.app.pause()
+            try:
+                l_files = self.files_create_flat(self.bench_backlog_nr, self.bench_backlog_size)
+            finally:
+                resumed = time.time()
+                self.app.unpause()
+            self.assertIsNotNone(l_files, "Creating files")
+
+            self.assertTrue(self.files_check(l_files), "Comparing files")
+            elapsed = self.converge_time(resumed)
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+            total_size = sum(f["size"] for f in l_files)
+            l_results.append({"backlog_time": resumed - start,
+                              "converge_time": elapsed,
+                              "mb_per_sec": total_size / elapsed / 2**20,
+                              "files_per_sec": len(l_files) / elapsed})
+
+            self.assertTrue(self.files_remove(l_files), "Removing files")
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        self.bench_report("backlog", l_results)
@@ -0,0 +1,195 @@
+"""
+ Command line options and test dispatch shared by test scripts
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import sys
+import os
+import atexit
+import logging
+import unittest
+import xmlrunner
+from sync_test import SyncTest
+from sync_test_benchmark import SyncBenchmark
+from sync_test_huge import SyncHugeFiles
+from sync_test_runner import ShardedRunner
+from sync_test_trace import TraceRecorder, SyncTraceReplay
+from sync_test_fixtures import FixtureStore
+from sync_test_storage import StorageProfile, PROFILES
+from sync_test_soak import SoakRunner
+
+# option => test method, in the order tests are run
+TESTS = [("test1", "test_create_delete_files"),
+         ("test2", "test_create_rename_delete_files"),
+         ("test3", "test_create_delete_dirs"),
+         ("test4", "test_create_rename_delete_dirs"),
+         ("test5", "test_sync_files_write"),
+         ("test6", "test_local_operations"),
+         ("test7", "test_update_mtime"),
+         ("test8", "test_create_rename_delete_unicode_files_dirs"),
+         ("test9", "test_create_delete_non_bmp_files_dirs")]
+BASIC_TESTS = ["test1", "test2", "test3", "test4"]
+BENCHMARKS = [("bench1", "test_bench_large_files"),
+              ("bench2", "test_bench_small_files"),
+              ("bench3", "test_bench_deep_tree"),
+              ("bench4", "test_bench_backlog")]
+
+
+def add_common_args(parser, storage=True, shards_help=None):
+    """
+    add options of tests, benchmarks and ways to run them
+    storage: add --storage options, test folders are placed in work_dir
+    shards_help: how --shards is run by this script
+    """
+    for opt, method in TESTS:
+        parser.add_argument("--" + opt, help=method, action="store_true")
+    for opt, method in BENCHMARKS:
+        parser.add_argument("--" + opt, help=method, action="store_true")
+    parser.add_argument("--record", help="record filesystem operations of tests to a trace file (gzipped if it ends with .gz)")
+    parser.add_argument("--replay", help="replay a trace file")
+    parser.add_argument("--replay-test", help="replay operations of a single test of the trace")
+    parser.add_argument("--speed", help="replay speed: 1 - original timing, N - N times faster, 0 - as fast as possible", type=float, default=1.0)
+    parser.add_argument("--huge", help="test_huge_files, files of SIZE MB (just over 4 GiB by default)", nargs="?", const=0, type=int, metavar="SIZE")
+    parser.add_argument("--fixtures", help="reuse generated files between runs, kept in DIR (%s by default)" % ("work_dir/fixtures" if storage else "./fixtures"),
+                        nargs="?", const="", metavar="DIR")
+    parser.add_argument("--hardlink", help="place fixtures as hardlinks instead of reflinks or copies", action="store_true")
+    if storage:
+        parser.add_argument("--storage", help="where to place test folders: default - work_dir, tmpfs - /dev/shm, loop - ext4 image (root only)", choices=PROFILES, default="default")
+        parser.add_argument("--storage-size", help="size of the loop image in MB", type=int, default=1024)
+    parser.add_argument("--trials", help="number of trials for every benchmark", type=int, default=5)
+    parser.add_argument("--soak", help="run randomly chosen tests (basic ones if none are selected) in a loop for SOAK hours", type=float, metavar="SOAK")
+    parser.add_argument("--seed", help="random seed of the soak run", type=int)
+    parser.add_argument("--shards", help="number of test folder pairs to run tests on in parallel" + (", " + shards_help if shards_help else ""), type=int, default=1)
+    parser.add_argument("-a", "--all", help="run all tests", action="store_true")
+    parser.add_argument("-b", "--basic", help="run basic, stable tests", action="store_true")
+    parser.add_argument("-d", "--debug", help="use debug output", action="store_true")
+    parser.add_argument("-l", "--large", help="use large files for testing", action="store_true")
+    parser.add_argument("--hash", help="content digest used for verification", choices=["md5", "blake2b"], default="md5")
+    parser.add_argument("-n", "--nodelete", help="Do not delete work files", action="store_false")
+
+
+def setup(parser, args):
+    """
+    check common options, set up logging and storage
+    return StorageProfile work_dir is placed on, None if the script has no --storage option
+    """
+    if args.record and args.shards > 1:
+        parser.error("--record can't be used with --shards")
+
+    if args.debug:
+        lvl = logging.DEBUG
+    else:
+        lvl = logging.INFO
+
+    if args.all:
+        for opt, _ in TESTS:
+            setattr(args, opt, True)
+    if args.basic:
+        for opt in BASIC_TESTS:
+            setattr(args, opt, True)
+
+    # logging stuff, output to stdout
+    logging.StreamHandler(sys.stdout)
+    logging.basicConfig(format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S', level=lvl)
+
+    if not hasattr(args, "storage"):
+        if args.fixtures == "":
+            args.fixtures = "fixtures"
+        return None
+
+    if args.fixtures == "":
+        # fixtures are kept on the original disk, tmpfs and loop images are removed after the run
+        args.fixtures = os.path.join(args.work_dir, "fixtures")
+    storage = StorageProfile(args.storage, args.work_dir, args.storage_size * 2**20, not args.nodelete)
+    args.work_dir = storage.setup()
+    atexit.register(storage.teardown)
+    return storage
+
+
+def get_tests(args):
+    """
+    return list of selected tests: (test class, test method, extra arguments..)
+    """
+    l_tests = []
+    for opt, method in TESTS:
+        if getattr(args, opt):
+            l_tests.append((SyncTest, method))
+
+    for opt, method in BENCHMARKS:
+        if getattr(args, opt):
+            l_tests.append((SyncBenchmark, method, args.trials))
+
+    if args.huge is not None:
+        l_tests.append((SyncHugeFiles, "test_huge_files", [args.huge * 2**20] if args.huge else None))
+
+    if args.replay:
+        l_tests.append((SyncTraceReplay, "test_replay", args.replay, args.speed, args.replay_test))
+    return l_tests
+
+
+def configure_app(app, args):
+    """
+    apply common options to an application instance
+    """
+    app.hash_algo = args.hash
+    if args.fixtures is not None:
+        app.fixtures = FixtureStore(args.fixtures, args.hardlink)
+    if args.record:
+        app.trace = TraceRecorder(args.record, app.seed)
+
+
+def run_tests(args, l_tests, create_app, create_shard_app=None):
+    """
+    run tests as a soak run, in shards or as a single suite
+    create_app: function returning an application instance
+    create_shard_app: function(shard index) returning an application instance for a shard of ShardedRunner,
+      shards share the instance returned by create_app if it's None
+    return True if all tests have passed
+    """
+    if args.soak:
+        if not l_tests:
+            l_tests = [(SyncTest, method) for opt, method in TESTS if opt in BASIC_TESTS]
+        with create_app() as app:
+            configure_app(app, args)
+            # leaks and failed iterations are reported through the result
+            return SoakRunner(app, l_tests, args.soak, args.seed).run()
+
+    if args.shards > 1 and create_shard_app is not None:
+        # every shard runs its own application instances
+        runner = ShardedRunner(args.shards, app_factory=create_shard_app)
+        for test in l_tests:
+            runner.add_test(*test)
+        return runner.run()
+
+    with create_app() as app:
+        configure_app(app, args)
+        if args.shards > 1:
+            # shards share application instances, every shard uses its own test folders
+            runner = ShardedRunner(args.shards, app.report_dir, shared_app=app)
+            for test in l_tests:
+                runner.add_test(*test)
+            return runner.run()
+
+        suite = unittest.TestSuite()
+        # filled by tests while running
+        suite.properties = app.report_properties
+        for test in l_tests:
+            suite.addTest(test[0](test[1], app, *test[2:]))
+
+        testRunner = xmlrunner.XMLTestRunner(output=app.report_dir)
+        return testRunner.run(suite).wasSuccessful()
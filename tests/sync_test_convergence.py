@@ -0,0 +1,230 @@
+"""
+ Snapshot based convergence checks for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import sys
+import time
+import logging
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def to_fs_path(path):
+    """
+    return path as a byte string in filesystem encoding, so it can be compared with directory listings:
+    names decoded back from a listing don't always match the original unicode name
+    (a surrogate pair is encoded as one non-BMP character and listed as such)
+    """
+    if isinstance(path, unicode):
+        return path.encode(sys.getfilesystemencoding() or "utf-8")
+    return path
+
+
+class TreeSnapshot(object):
+    """
+    a single listing of a directory tree:
+    maps relative path to True for directories and False for other objects
+    """
+    def __init__(self, root, wanted_dirs=None):
+        """
+        root: directory to scan
+        wanted_dirs: set of relative directory paths to descend into, None to scan the whole tree
+        """
+        self.root = to_fs_path(root)
+        self.entries = {}
+        self.stats = {}
+        self.listed = set()
+        self.scan(wanted_dirs)
+
+    def scan(self, wanted_dirs):
+        """
+        list root directory and all wanted subdirectories
+        """
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.root, rel_dir)
+            self.listed.add(rel_dir)
+            for name, is_dir, entry in self.list_dir(abs_dir):
+                rel_path = os.path.join(rel_dir, name)
+                self.entries[rel_path] = is_dir
+                if entry is not None:
+                    self.stats[rel_path] = entry
+                if is_dir and (wanted_dirs is None or rel_path in wanted_dirs):
+                    stack.append(rel_path)
+
+    @staticmethod
+    def list_dir(abs_dir):
+        """
+        return a list of (name, is_dir, entry) tuples, entry is a DirEntry if scandir is available
+        """
+        try:
+            if scandir is not None:
+                return [(e.name, e.is_dir(follow_symlinks=False), e) for e in scandir(abs_dir)]
+            l_entries = []
+            for name in os.listdir(abs_dir):
+                is_dir = os.path.isdir(os.path.join(abs_dir, name)) and not os.path.islink(os.path.join(abs_dir, name))
+                l_entries.append((name, is_dir, None))
+            return l_entries
+        except OSError:
+            # directory does not exist (yet)
+            return []
+
+    def __contains__(self, rel_path):
+        return rel_path in self.entries
+
+    def is_dir(self, rel_path):
+        return self.entries.get(rel_path, False)
+
+    def size(self, rel_path):
+        """
+        return size of an object, None if it has disappeared
+        """
+        try:
+            if rel_path in self.stats:
+                return self.stats[rel_path].stat(follow_symlinks=False).st_size
+            return os.lstat(os.path.join(self.root, rel_path)).st_size
+        except OSError:
+            return None
+
+
+class ConvergenceCheck(object):
+    """
+    collects expectations about a directory tree
+    and checks all of them against a single tree snapshot per round
+    """
+    PRESENT_FILE = "file"
+    PRESENT_DIR = "dir"
+    ABSENT = "absent"
+
+    def __init__(self, root, digest_files, latency=None):
+        """
+        root: directory to check ("out" folder)
+        digest_files: function returning a list of digests for a list of file paths
+        latency: LatencyTracker to report observed objects to
+        """
+        self.root = to_fs_path(root)
+        self.digest_files = digest_files
+        self.latency = latency
+        self.pending = {}
+        self.mismatches = []
+
+    def expect_file(self, rel_path, size=None, digest=None):
+        """
+        file must exist, optionally with the given size and content digest
+        """
+        self.pending[to_fs_path(rel_path)] = (self.PRESENT_FILE, size, digest)
+
+    def expect_dir(self, rel_path):
+        """
+        directory must exist
+        """
+        self.pending[to_fs_path(rel_path)] = (self.PRESENT_DIR, None, None)
+
+    def expect_absent(self, rel_path):
+        """
+        object must not exist
+        """
+        self.pending[to_fs_path(rel_path)] = (self.ABSENT, None, None)
+
+    def wanted_dirs(self):
+        """
+        return the set of directories which must be listed to check all pending expectations
+        """
+        dirs = set()
+        for rel_path in self.pending:
+            parent = os.path.dirname(rel_path)
+            while parent and parent not in dirs:
+                dirs.add(parent)
+                parent = os.path.dirname(parent)
+        return dirs
+
+    def check(self):
+        """
+        scan the tree once and drop all met expectations
+        mismatching files are moved to the mismatches list
+        return the number of pending expectations
+        """
+        snapshot = TreeSnapshot(self.root, self.wanted_dirs())
+        if self.latency is not None:
+            self.latency.observe_snapshot(snapshot, time.time())
+
+        l_hash = []
+        for rel_path, (kind, size, digest) in self.pending.items():
+            if kind == self.ABSENT:
+                if rel_path not in snapshot:
+                    del self.pending[rel_path]
+            elif kind == self.PRESENT_DIR:
+                if snapshot.is_dir(rel_path):
+                    del self.pending[rel_path]
+            elif rel_path in snapshot and not snapshot.is_dir(rel_path):
+                if size is not None:
+                    out_size = snapshot.size(rel_path)
+                    if out_size is None:
+                        continue
+                    if out_size != size:
+                        logging.error("Sizes don't match for file: %s (%d != %d)" % (rel_path, out_size, size))
+                        self.mismatches.append(rel_path)
+                        del self.pending[rel_path]
+                        continue
+                if digest is None:
+                    del self.pending[rel_path]
+                else:
+                    l_hash.append(rel_path)
+
+        if l_hash:
+            l_digests = self.digest_files([os.path.join(self.root, p) for p in l_hash])
+            for rel_path, out_digest in zip(l_hash, l_digests):
+                if out_digest is None:
+                    # disappeared while hashing
+                    continue
+                if out_digest != self.pending[rel_path][2]:
+                    logging.error("MD5 sums don't match for file: %s" % os.path.join(self.root, rel_path))
+                    self.mismatches.append(rel_path)
+                del self.pending[rel_path]
+
+        return len(self.pending)
+
+    def wait(self, retry):
+        """
+        check expectations until all of them are met or retry (RetryCall) gives up
+        return True if all expectations are met
+        """
+        while retry.next():
+            nr_pending = self.check()
+            if self.mismatches:
+                return retry.done(False)
+            if not nr_pending:
+                return retry.done(True)
+            logging.debug("%d objects are not synced yet in %s. Retrying %s .." % (nr_pending, self.root, retry))
+
+        retry.done(False)
+        for rel_path, (kind, _, _) in sorted(self.pending.items()):
+            if kind == self.ABSENT:
+                logging.error("Object still exists: %s" % os.path.join(self.root, rel_path))
+            else:
+                logging.error("Failed to access %s: %s" % (kind, os.path.join(self.root, rel_path)))
+        return False
@@ -0,0 +1,250 @@
+"""
+ Content-addressed fixture store for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import json
+import errno
+import fcntl
+import random
+import shutil
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import threading
+from sync_test_base import get_random_blocks
+from sync_test_hash import get_hash
+
+# ioctl(dst_fd, FICLONE, src_fd) from linux/fs.h: share extents of the source file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+# errors meaning that a copying method is not supported for this pair of files
+NOT_SUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _copy_file_range = _libc.copy_file_range
+    _copy_file_range.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                                 ctypes.c_size_t, ctypes.c_uint]
+    _copy_file_range.restype = ctypes.c_ssize_t
+except (OSError, AttributeError):
+    # glibc < 2.27
+    _copy_file_range = None
+
+
+def reflink(fin, fout):
+    fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+
+
+def copy_range(fin, fout, size, block_size=2**30):
+    """
+    copy data in kernel, without passing it through user space
+    """
+    if _copy_file_range is None:
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    while size > 0:
+        n = _copy_file_range(fin.fileno(), None, fout.fileno(), None, min(size, block_size), 0)
+        if n < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        if n == 0:
+            raise OSError(errno.EIO, "Unexpected end of file")
+        size -= n
+
+
+class FixtureStore(object):
+    """
+    files with random content kept between runs, so tests don't have to generate them again:
+    objects are named by their digest, index maps (size, variant) to the digest of the content,
+    which is generated from a seed derived from the key
+    files are placed into test folders as reflinks, with copy_file_range or plain copies;
+    hardlinks are used only if requested, as a test modifying such file would modify the store
+    """
+    # methods of placing files, the first working one is used
+    METHODS = ("reflink", "copy_file_range", "copy")
+
+    def __init__(self, root, hardlink=False):
+        self.root = root
+        self.hardlink = hardlink
+        self.index_fname = os.path.join(root, "index.json")
+        self.lock = threading.Lock()
+        # algo => {"size:variant": digest}
+        self.index = {}
+        self.dirty = False
+        # size => number of files of that size placed by the current test
+        self.variants = {}
+        self.l_methods = list(self.METHODS)
+        self.hits = self.misses = 0
+        self.generated_bytes = 0
+        try:
+            os.makedirs(root)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        try:
+            with open(self.index_fname) as fin:
+                self.index = json.load(fin)
+        except (IOError, ValueError):
+            pass
+
+    @staticmethod
+    def key_seed(*args):
+        """
+        return a seed of get_random_blocks() which is the same on every run
+        """
+        return int(hashlib.md5(":".join(str(a) for a in args)).hexdigest()[:15], 16)
+
+    def tier_size(self, maxsize, idx):
+        """
+        return size of idx-th file of a tier of files up to maxsize bytes,
+        replaces a random size so the same files are requested on every run
+        """
+        return random.Random(self.key_seed("tier", maxsize, idx)).randint(1, maxsize)
+
+    def reset(self):
+        """
+        called when a test starts, files of the same size get the same content in every test
+        """
+        with self.lock:
+            self.variants = {}
+
+    def next_variant(self, size):
+        with self.lock:
+            variant = self.variants.get(size, 0)
+            self.variants[size] = variant + 1
+            return variant
+
+    def object_path(self, algo, digest):
+        return os.path.join(self.root, algo, digest[:2], digest)
+
+    def get(self, size, variant, algo="md5"):
+        """
+        return (object path, digest, seed) of a file, generate it if it is not in the store yet
+        """
+        key = "%d:%d" % (size, variant)
+        seed = self.key_seed(size, variant)
+        with self.lock:
+            digest = self.index.get(algo, {}).get(key)
+        if digest is not None and os.path.exists(self.object_path(algo, digest)):
+            with self.lock:
+                self.hits += 1
+            return self.object_path(algo, digest), digest, seed
+
+        with self.lock:
+            self.misses += 1
+        tmp = os.path.join(self.root, ".tmp_%d_%d_%d" % (os.getpid(), size, variant))
+        h = get_hash(algo)
+        with open(tmp, "wb") as fout:
+            for data in get_random_blocks(size, seed):
+                h.update(data)
+                fout.write(data)
+        digest = h.hexdigest()
+        path = self.object_path(algo, digest)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        os.rename(tmp, path)
+        with self.lock:
+            self.index.setdefault(algo, {})[key] = digest
+            self.dirty = True
+            self.generated_bytes += size
+        return path, digest, seed
+
+    def copy(self, src, dst, size):
+        """
+        copy an object with the first working method
+        return name of the method used
+        """
+        if self.hardlink:
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            try:
+                os.link(src, dst)
+                return "hardlink"
+            except OSError, e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # test folders are on another filesystem (--storage), fall back to copying methods
+                logging.info("Fixtures: hardlinks are not possible across filesystems, copying instead")
+                with self.lock:
+                    self.hardlink = False
+
+        with open(src, "rb") as fin:
+            with open(dst, "wb") as fout:
+                for method in list(self.l_methods):
+                    try:
+                        if method == "reflink":
+                            reflink(fin, fout)
+                        elif method == "copy_file_range":
+                            copy_range(fin, fout, size)
+                        else:
+                            shutil.copyfileobj(fin, fout, 2**20)
+                        return method
+                    except (IOError, OSError), e:
+                        if method == "copy" or e.errno not in NOT_SUPPORTED:
+                            raise
+                        # the store and test folders are not going to change filesystems during a run
+                        logging.debug("Fixtures: %s is not supported (%s)" % (method, e))
+                        with self.lock:
+                            if method in self.l_methods:
+                                self.l_methods.remove(method)
+                        fin.seek(0)
+                        fout.seek(0)
+                        fout.truncate()
+
+    def place(self, dst, size, algo="md5"):
+        """
+        put a file with content from the store to dst
+        return (digest, seed)
+        """
+        path, digest, seed = self.get(size, self.next_variant(size), algo)
+        self.copy(path, dst, size)
+        return digest, seed
+
+    def close(self):
+        """
+        save the index, merged with entries added by other processes meanwhile
+        """
+        logging.info("Fixtures: %d reused, %d generated (%.1f MB), placed with %s" %
+                     (self.hits, self.misses, self.generated_bytes / float(2**20),
+                      "hardlink" if self.hardlink else self.l_methods[0]))
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with open(self.index_fname) as fin:
+                    index = json.load(fin)
+            except (IOError, ValueError):
+                index = {}
+            for algo, entries in self.index.items():
+                index.setdefault(algo, {}).update(entries)
+            tmp = "%s.%d" % (self.index_fname, os.getpid())
+            try:
+                with open(tmp, "w") as fout:
+                    json.dump(index, fout, sort_keys=True)
+                os.rename(tmp, self.index_fname)
+            except (IOError, OSError), e:
+                logging.error("Failed to save fixture index: %s (%s)" % (self.index_fname, e))
+                return
+            self.index = index
+            self.dirty = False
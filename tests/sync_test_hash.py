@@ -0,0 +1,325 @@
+"""
+ Content hashing service for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import mmap
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+# files of this size or larger are hashed through mmap
+MMAP_THRESHOLD = 4 * 2**20
+# amount of mapped data passed to a hash object at once
+MMAP_BLOCK = 16 * 2**20
+# below this amount of data, files are hashed in the calling process
+PARALLEL_THRESHOLD = 16 * 2**20
+# transfer chunks: 128K, 256K, ... 1M (ChunkedHash in src/utils.cpp), then 1M each
+SEGSIZE = 131072
+
+
+def chunk_floor(p):
+    """
+    return start of the transfer chunk containing offset p
+    """
+    cp = 0
+    for i in range(1, 9):
+        np = cp + i * SEGSIZE
+        if cp <= p < np:
+            return cp
+        cp = np
+    return ((p - cp) & -(8 * SEGSIZE)) + cp
+
+
+def chunk_ceil(p):
+    """
+    return end of the transfer chunk containing offset p
+    """
+    cp = 0
+    for i in range(1, 9):
+        cp += i * SEGSIZE
+        if p < cp:
+            return cp
+    return chunk_floor(p) + 8 * SEGSIZE
+
+
+def get_hash(algo="md5"):
+    """
+    return a new hash object
+    blake2b comes from hashlib (Python 3.6+) or from the pyblake2 package
+    """
+    if algo == "blake2b" and not hasattr(hashlib, "blake2b"):
+        try:
+            import pyblake2
+        except ImportError:
+            raise ValueError("blake2b is not available, please install pyblake2")
+        return pyblake2.blake2b()
+    return hashlib.new(algo)
+
+
+def file_digest(fname, algo="md5", block_size=2**20):
+    """
+    calculates digest of a file
+    large files are hashed through mmap to avoid copying data into Python strings
+    """
+    h = get_hash(algo)
+    with open(fname, 'rb') as fin:
+        size = os.fstat(fin.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, MMAP_BLOCK):
+                    h.update(buffer(mm, offset, MMAP_BLOCK))
+            finally:
+                mm.close()
+        else:
+            while True:
+                data = fin.read(block_size)
+                if not data:
+                    break
+                h.update(data)
+    return h.hexdigest()
+
+
+def file_digest_or_none(args):
+    """
+    pool worker: return digest of a file, None if it can't be read
+    """
+    fname, algo = args
+    try:
+        return file_digest(fname, algo)
+    except (IOError, OSError):
+        return None
+
+
+def range_digest(fname, offset, length, algo="md5", block_size=2**20):
+    """
+    calculates digest of length bytes of a file starting at offset
+    """
+    h = get_hash(algo)
+    with open(fname, 'rb') as fin:
+        fin.seek(offset)
+        while length > 0:
+            data = fin.read(min(block_size, length))
+            if not data:
+                break
+            h.update(data)
+            length -= len(data)
+    return h.hexdigest()
+
+
+def range_digest_or_none(args):
+    """
+    pool worker: return digest of a file range, None if it can't be read
+    """
+    fname, offset, length, algo = args
+    try:
+        return range_digest(fname, offset, length, algo)
+    except (IOError, OSError):
+        return None
+
+
+def split_ranges(offset, length, chunk_size):
+    """
+    return list of (offset, length) of chunks covering a range
+    """
+    return [(o, min(chunk_size, offset + length - o)) for o in xrange(offset, offset + length, chunk_size)]
+
+
+def differing_ranges(data_a, data_b, offset=0, sub_block=4096, max_ranges=16, merge_gap=64):
+    """
+    return list of (start, end) byte ranges where two buffers differ,
+    ranges less than merge_gap bytes apart are merged (random data matches by chance)
+    offset is added to the returned positions
+    the tail of the longer buffer counts as different
+    """
+    l_ranges = []
+    size = min(len(data_a), len(data_b))
+    for base in xrange(0, size, sub_block):
+        end = min(base + sub_block, size)
+        # most of the block is usually the same, compare bytes only where needed
+        if buffer(data_a, base, end - base) == buffer(data_b, base, end - base):
+            continue
+        for i in xrange(base, end):
+            if data_a[i] == data_b[i]:
+                continue
+            if l_ranges and offset + i - l_ranges[-1][1] < merge_gap:
+                l_ranges[-1][1] = offset + i + 1
+            elif len(l_ranges) < max_ranges:
+                l_ranges.append([offset + i, offset + i + 1])
+            else:
+                return [tuple(r) for r in l_ranges]
+    if len(data_a) != len(data_b) and len(l_ranges) < max_ranges:
+        l_ranges.append([offset + size, offset + max(len(data_a), len(data_b))])
+    return [tuple(r) for r in l_ranges]
+
+
+def block_divergence(fname_a, fname_b, offset=0, block_size=2**20, max_ranges=16):
+    """
+    read two files block by block in lockstep and stop at the first block which differs
+    return None if files are the same from offset on, otherwise a dictionary:
+        offset: start of the differing block
+        ranges: list of (start, end) byte ranges which differ within the block
+        chunks: list of (start, end) transfer chunks the ranges fall into
+        chunk_aligned: True if every range starts and ends at transfer chunk boundaries
+        size_a, size_b: file sizes
+    """
+    with open(fname_a, 'rb') as fin_a:
+        with open(fname_b, 'rb') as fin_b:
+            size_a = os.fstat(fin_a.fileno()).st_size
+            size_b = os.fstat(fin_b.fileno()).st_size
+            fin_a.seek(offset)
+            fin_b.seek(offset)
+            while True:
+                data_a = fin_a.read(block_size)
+                data_b = fin_b.read(block_size)
+                if not data_a and not data_b:
+                    return None
+                if data_a != data_b:
+                    break
+                offset += block_size
+
+    l_ranges = differing_ranges(data_a, data_b, offset, max_ranges=max_ranges)
+    l_chunks = []
+    for start, end in l_ranges:
+        chunk = (chunk_floor(start), chunk_ceil(end - 1))
+        if chunk not in l_chunks:
+            l_chunks.append(chunk)
+    aligned = all(start == chunk_floor(start) and end in (chunk_ceil(end - 1), max(size_a, size_b))
+                  for start, end in l_ranges)
+    return {"offset": offset, "ranges": l_ranges, "chunks": l_chunks, "chunk_aligned": aligned,
+            "size_a": size_a, "size_b": size_b}
+
+
+def log_divergence(fname_a, fname_b, div, level=logging.ERROR):
+    """
+    log result of block_divergence()
+    """
+    if div is None:
+        logging.log(level, "Files are the same: %s and %s" % (fname_a, fname_b))
+        return
+    logging.log(level, "Files differ: %s [%d bytes] and %s [%d bytes], first differing block at %d" %
+                (fname_a, div["size_a"], fname_b, div["size_b"], div["offset"]))
+    for start, end in div["ranges"]:
+        logging.log(level, "  bytes %d - %d (%d bytes), transfer chunk %d - %d" %
+                    (start, end, end - start, chunk_floor(start), chunk_ceil(end - 1)))
+    logging.log(level, "  differing ranges %s transfer chunk boundaries" %
+                ("match" if div["chunk_aligned"] else "do not match"))
+
+
+class HashPool(object):
+    """
+    calculates digests of many files in parallel worker processes
+    (md5 holds the GIL for small buffers, so threads would not help)
+    """
+    def __init__(self, nr_workers=None):
+        """
+        nr_workers: number of worker processes, CPU count by default
+        """
+        self.nr_workers = nr_workers or multiprocessing.cpu_count()
+        self.pool = None
+        # hashing is requested by the main thread and by StreamingCheck threads
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        start worker processes, should be called before any other thread is started:
+        a pool forked later would copy the state of running threads
+        """
+        if self.nr_workers >= 2:
+            self.get_pool()
+
+    def get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                logging.debug("Starting %d hashing processes" % self.nr_workers)
+                self.pool = multiprocessing.Pool(self.nr_workers)
+            return self.pool
+
+    def close(self):
+        """
+        terminate worker processes
+        """
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    def digest_files(self, l_fnames, algo="md5"):
+        """
+        return a list of digests for a list of files
+        None is returned for files which can't be read
+        """
+        l_args = [(fname, algo) for fname in l_fnames]
+
+        total_size = 0
+        for fname in l_fnames:
+            try:
+                total_size += os.path.getsize(fname)
+            except OSError:
+                pass
+
+        if self.nr_workers < 2 or len(l_fnames) < 2 or total_size < PARALLEL_THRESHOLD:
+            return [file_digest_or_none(args) for args in l_args]
+
+        chunksize = max(1, len(l_args) // (self.nr_workers * 4))
+        return self.get_pool().map(file_digest_or_none, l_args, chunksize)
+
+    def range_digests(self, fname, l_ranges, algo="md5"):
+        """
+        return a list of digests for a list of (offset, length) ranges of a file,
+        ranges are hashed in parallel, None is returned for ranges which can't be read
+        """
+        l_args = [(fname, offset, length, algo) for offset, length in l_ranges]
+        total_size = sum(length for _, length in l_ranges)
+        if self.nr_workers < 2 or len(l_args) < 2 or total_size < PARALLEL_THRESHOLD:
+            return [range_digest_or_none(args) for args in l_args]
+
+        return self.get_pool().map(range_digest_or_none, l_args, 1)
+
+    def first_difference(self, fname_a, fname_b, chunk_size=64 * 2**20, min_size=2**16, algo="md5"):
+        """
+        compare two files by digests of chunks hashed in parallel,
+        chunks which differ are split and compared again down to min_size bytes
+        return (offset, length) of the first differing range, None if files are the same
+        """
+        size_a = os.path.getsize(fname_a)
+        size_b = os.path.getsize(fname_b)
+        size = min(size_a, size_b)
+        offset, length = 0, size
+        while True:
+            l_ranges = split_ranges(offset, length, chunk_size)
+            l_a = self.range_digests(fname_a, l_ranges, algo)
+            l_b = self.range_digests(fname_b, l_ranges, algo)
+            diff = None
+            for r, da, db in zip(l_ranges, l_a, l_b):
+                if da is None or db is None or da != db:
+                    diff = r
+                    break
+            if diff is None:
+                if size_a != size_b:
+                    # the shorter file is a prefix of the longer one
+                    return size, max(size_a, size_b) - size
+                return None
+            offset, length = diff
+            if length <= min_size:
+                return diff
+            chunk_size = max(min_size, chunk_size // 16)
@@ -0,0 +1,171 @@
+"""
+ Huge files for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import random
+import logging
+from sync_test_base import SyncTestBase
+from sync_test_base import get_random_str
+from sync_test_base import get_random_blocks
+from sync_test_hash import SEGSIZE
+from sync_test_hash import chunk_floor
+from sync_test_hash import block_divergence
+from sync_test_hash import log_divergence
+
+MB = 2**20
+GB = 2**30
+
+
+def strategic_offsets(size, rnd, nr_random=16):
+    """
+    return sorted offsets where data is written:
+    file start and end, the first (growing) chunk boundaries,
+    2 GiB and 4 GiB marks and chunk boundaries around them, some random chunk boundaries
+    """
+    l_offsets = set([0, size])
+    cp = 0
+    for i in range(1, 9):
+        cp += i * SEGSIZE
+        l_offsets.add(cp)
+    for mark in (2 * GB, 4 * GB):
+        floor = chunk_floor(mark)
+        l_offsets.update([mark, floor, floor + 8 * SEGSIZE])
+    for _ in range(0, nr_random):
+        l_offsets.add(chunk_floor(rnd.randint(0, max(0, size - 1))))
+    return sorted(o for o in l_offsets if o <= size)
+
+
+def huge_file_create(fname, size, seed, block_size=64 * 1024):
+    """
+    create a sparse file of a given size with random data around strategic offsets only,
+    so even files of several GB are created in a moment
+    return number of bytes written
+    """
+    rnd = random.Random(seed)
+    written = 0
+    with open(fname, 'wb') as fout:
+        fout.truncate(size)
+        for offset in strategic_offsets(size, rnd):
+            start = max(0, offset - block_size // 2)
+            end = min(size, offset + block_size // 2)
+            if end <= start:
+                continue
+            fout.seek(start)
+            for data in get_random_blocks(end - start, rnd.getrandbits(63)):
+                fout.write(data)
+            written += end - start
+    return written
+
+
+class SyncHugeFiles(SyncTestBase):
+    """
+    files larger than 4 GiB, verified by digests of chunks calculated in parallel
+    """
+    def __init__(self, methodName, app, l_sizes=None):
+        """
+        l_sizes: sizes of files to test, just over 4 GiB by default
+        """
+        super(SyncHugeFiles, self).__init__(methodName, app)
+        self.huge_sizes = l_sizes or [4 * GB + 8 * SEGSIZE + 12345]
+        # assumed minimum synchronization speed, huge files get more time than the default retry timeout
+        self.min_throughput = 1 * MB
+
+    def free_space(self, path):
+        st = os.statvfs(path)
+        return st.f_bavail * st.f_frsize
+
+    def huge_file_wait(self, fname, size):
+        """
+        wait for a file to appear in "out" folder with full size
+        return True on success
+        """
+        ffname_out = os.path.join(self.app.local_folder_out, fname)
+        retry = self.app.retry.begin("huge_file_sync", self.app.sync_wait,
+                                     max(self.app.retry.timeout, size / self.min_throughput))
+        while retry.next():
+            try:
+                if os.path.getsize(ffname_out) == size:
+                    return retry.done(True)
+            except OSError:
+                pass
+            logging.debug("Huge file %s is not synced yet, retrying %s .." % (ffname_out, retry))
+        logging.error("Huge file %s has not been synced" % ffname_out)
+        return retry.done(False)
+
+    def huge_file_compare(self, fname):
+        """
+        compare digests of chunks of both files,
+        the first differing range is narrowed down to exact bytes
+        return True if files are the same
+        """
+        ffname_in = os.path.join(self.app.local_folder_in, fname)
+        ffname_out = os.path.join(self.app.local_folder_out, fname)
+        diff = self.app.hash_pool.first_difference(ffname_in, ffname_out, algo=self.app.hash_algo)
+        if diff is not None:
+            logging.error("Huge file %s differs, first different range: %d - %d" % (ffname_out, diff[0], diff[0] + diff[1]))
+            log_divergence(ffname_in, ffname_out, block_divergence(ffname_in, ffname_out, diff[0]))
+            return False
+        return True
+
+    def test_huge_files(self):
+        """
+        create huge sparse files one by one, check them and remove
+        report creation, synchronization and verification throughput
+        """
+        logging.info("Launching test_huge_files test")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+        self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+
+        for i, size in enumerate(self.huge_sizes):
+            # synced copy is not sparse, leave some space for the rest of the system
+            if self.free_space(self.app.local_folder_out) < size + GB:
+                self.skipTest("Not enough free space for a %d bytes file" % size)
+
+            fname = "huge%d_%s" % (i, get_random_str())
+            ffname = os.path.join(self.app.local_folder_in, fname)
+            seed = random.getrandbits(63)
+
+            start = time.time()
+            self.trace("create_huge", [ffname], size, seed)
+            written = huge_file_create(ffname, size, seed)
+            created = time.time()
+            self.latency_issued("create_file", ffname)
+            logging.info("Huge file created: %s [%d bytes, %d written, %.2f s]" % (ffname, size, written, created - start))
+
+            self.assertTrue(self.huge_file_wait(fname, size), "Waiting for huge file")
+            synced = time.time()
+            self.assertTrue(self.huge_file_compare(fname), "Comparing huge files")
+            verified = time.time()
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+            # both files are read
+            props = {"create_time": created - start,
+                     "sync_time": synced - created,
+                     "sync_mbps": size / float(MB) / (synced - created),
+                     "verify_time": verified - synced,
+                     "verify_mbps": 2 * size / float(MB) / (verified - synced)}
+            logging.info("Huge file synced in %.2f s (%.1f MB/s), verified in %.2f s (%.1f MB/s)" %
+                         (props["sync_time"], props["sync_mbps"], props["verify_time"], props["verify_mbps"]))
+            for key, value in props.items():
+                self.app.report_properties["huge.%s.%d.%s" % (self._testMethodName, size, key)] = value
+
+            self.assertTrue(self.files_remove([{"name": fname}]), "Removing huge file")
+            self.assertTrue(self.app.is_alive(), "Test application is not running")
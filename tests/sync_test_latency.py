@@ -0,0 +1,140 @@
+"""
+ Sync propagation latency tracking for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import threading
+from sync_test_convergence import to_fs_path
+from sync_test_report import flatten_summary, write_json_report
+
+# upper bounds (seconds) of histogram buckets
+HISTOGRAM_BUCKETS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+
+def percentile(l_sorted, p):
+    """
+    nearest-rank percentile of a sorted list
+    """
+    if not l_sorted:
+        return None
+    rank = int(round(p / 100.0 * len(l_sorted) + 0.5)) - 1
+    return l_sorted[max(0, min(rank, len(l_sorted) - 1))]
+
+
+def histogram(l_values):
+    """
+    return list of (bucket upper bound, count) tuples, None bound collects the rest
+    """
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for v in l_values:
+        i = 0
+        while i < len(HISTOGRAM_BUCKETS) and v > HISTOGRAM_BUCKETS[i]:
+            i += 1
+        counts[i] += 1
+    return zip(HISTOGRAM_BUCKETS + [None], counts)
+
+
+class LatencyTracker(object):
+    """
+    timestamps operations when they are issued in "in" folder
+    and when their result is first observed in "out" folder
+    observations may come from several threads (watcher, mirroring and streaming threads)
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.latencies = {}
+        self.last_observed = None
+
+    def reset(self):
+        with self.lock:
+            self.pending = {}
+            self.latencies = {}
+            self.last_observed = None
+
+    def issued(self, op, rel_path, present=True):
+        """
+        operation "op" has been done in "in" folder:
+        rel_path must appear in (present=True) or disappear from "out" folder
+        """
+        with self.lock:
+            self.pending[to_fs_path(rel_path)] = (op, time.time(), present)
+
+    def observed(self, rel_path, present, t=None):
+        """
+        rel_path is found in (present=True) or missing from "out" folder at time t
+        """
+        rel_path = to_fs_path(rel_path)
+        if t is None:
+            t = time.time()
+        with self.lock:
+            op_info = self.pending.get(rel_path)
+            if op_info is None or op_info[2] != present:
+                return
+            op, t_issued, _ = op_info
+            self.pending.pop(rel_path, None)
+            self.latencies.setdefault(op, []).append(max(t - t_issued, 0))
+            self.last_observed = max(t, self.last_observed)
+
+    def observe_snapshot(self, snapshot, t):
+        """
+        check pending operations against a tree snapshot taken at time t
+        only paths in listed directories are checked
+        """
+        with self.lock:
+            for rel_path in self.pending.keys():
+                if os.path.dirname(rel_path) in snapshot.listed:
+                    self.observed(rel_path, rel_path in snapshot, t)
+
+    def summary(self):
+        """
+        return dictionary: operation => count, percentiles, max latency and histogram
+        """
+        res = {}
+        with self.lock:
+            for op, l_values in self.latencies.iteritems():
+                l_sorted = sorted(l_values)
+                res[op] = {"count": len(l_sorted),
+                           "p50": percentile(l_sorted, 50),
+                           "p90": percentile(l_sorted, 90),
+                           "p99": percentile(l_sorted, 99),
+                           "max": l_sorted[-1],
+                           "histogram": histogram(l_sorted)}
+            l_lost = {}
+            for op, _, _ in self.pending.itervalues():
+                l_lost[op] = l_lost.get(op, 0) + 1
+        for op, nr in l_lost.iteritems():
+            res.setdefault(op, {"count": 0})["not_observed"] = nr
+        return res
+
+    def properties(self, prefix):
+        """
+        return summary as flat dictionary, suitable for xmlrunner test suite properties
+        """
+        return flatten_summary(prefix, self.summary())
+
+    def write_json(self, fname, extra=None):
+        """
+        save summary to a JSON file
+        """
+        data = {"latency": self.summary()}
+        if extra:
+            data.update(extra)
+        write_json_report(fname, data, "latency")
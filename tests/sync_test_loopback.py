@@ -0,0 +1,369 @@
+"""
+ Offline application for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import sys
+import os
+import stat
+import time
+import shutil
+import threading
+import zlib
+from sync_test_base import get_random_str
+from sync_test_app import SyncTestApp
+from sync_test_supervisor import pid_alive
+from sync_test_cli import add_common_args, setup, get_tests, configure_app, run_tests
+import logging
+import argparse
+import functools
+
+
+class LoopbackSyncApp(SyncTestApp):
+    """
+    keeps "in" and "out" folders in sync in-process, without network and MEGA account:
+    measures the overhead of the test harness itself
+    """
+    COPY_BLOCK = 64 * 1024
+    FINGERPRINT_BLOCK = 32 * 1024
+
+    def __init__(self, work_dir, delay=0.0, bandwidth=None, delete_tmp_files=True, use_large_files=True, storage=None):
+        """
+        work_dir: a temporary folder to place generated files
+        delay: seconds between detecting a change in one folder and applying it to the other one
+        bandwidth: copy speed limit in bytes per second, None for unlimited
+        storage: StorageProfile work_dir is placed on, to tag results with
+        """
+        self.local_mount_in = os.path.join(work_dir, "sync_in")
+        self.local_mount_out = os.path.join(work_dir, "sync_out")
+        self.work_dir = os.path.join(work_dir, "tmp")
+
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.scan_interval = 0.05
+
+        self.mirror_thread = None
+        self.running = False
+        # process running the mirroring thread
+        self.owner_pid = os.getpid()
+        self.paused = False
+        # rel_path => state of the object when both folders were equal
+        self.synced = {}
+        # path => ((inode, size, mtime, ctime), CRC)
+        self.fingerprints = {}
+        # rel_path => ((source folder, state of the object), time when the change was detected)
+        self.changes = {}
+        # number of completed mirror rounds and number of the last idle round
+        self.nr_rounds = 0
+        self.idle_round = -1
+        self.cond = threading.Condition()
+
+        # init base class
+        super(LoopbackSyncApp, self).__init__(self.local_mount_in, self.local_mount_out, self.work_dir, delete_tmp_files, use_large_files)
+        self.storage = storage
+        self.sync_settle = 0.1
+
+        for d in (self.local_mount_in, self.local_mount_out, self.work_dir):
+            try:
+                os.makedirs(d)
+            except OSError:
+                pass
+            if not os.access(d, os.W_OK | os.X_OK):
+                raise Exception("Not enough permissions to create / write to directory")
+
+    def fingerprint(self, path, st):
+        """
+        return CRC of a file (of its head and tail for large files),
+        cached while inode, size, mtime and ctime stay the same
+        """
+        key = (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+        cached = self.fingerprints.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, "rb") as f:
+            crc = zlib.crc32(f.read(self.FINGERPRINT_BLOCK))
+            if st.st_size > 2 * self.FINGERPRINT_BLOCK:
+                f.seek(-self.FINGERPRINT_BLOCK, os.SEEK_END)
+            crc = zlib.crc32(f.read(), crc)
+        self.fingerprints[path] = (key, crc)
+        return crc
+
+    def scan(self, root):
+        """
+        return dictionary: relative path => (is_dir, size, mtime in ms, fingerprint)
+        """
+        objects = {}
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                l_names = os.listdir(os.path.join(root, rel_dir))
+            except OSError:
+                continue
+            for name in l_names:
+                rel_path = os.path.join(rel_dir, name)
+                path = os.path.join(root, rel_path)
+                try:
+                    st = os.lstat(path)
+                    if stat.S_ISDIR(st.st_mode):
+                        objects[rel_path] = (True, 0, 0, 0)
+                        stack.append(rel_path)
+                    elif stat.S_ISREG(st.st_mode):
+                        objects[rel_path] = (False, st.st_size, int(st.st_mtime * 1000), self.fingerprint(path, st))
+                except (OSError, IOError):
+                    continue
+        return objects
+
+    @staticmethod
+    def same(state_a, state_b):
+        """
+        directories are equal regardless of their mtime
+        """
+        return state_a == state_b or (state_a is not None and state_b is not None and state_a[0] and state_b[0])
+
+    def mirror_round(self):
+        """
+        compare both folders and apply changes which are older than delay,
+        a change is propagated from the folder where the object differs from the last synced state,
+        newer file wins if it has been changed in both folders
+        return the number of differences found
+        """
+        objects = {self.local_mount_in: self.scan(self.local_mount_in),
+                   self.local_mount_out: self.scan(self.local_mount_out)}
+        objects_in = objects[self.local_mount_in]
+        objects_out = objects[self.local_mount_out]
+        now = time.time()
+
+        changes = {}
+        for rel_path in set(objects_in) | set(objects_out):
+            state_in = objects_in.get(rel_path)
+            state_out = objects_out.get(rel_path)
+            if self.same(state_in, state_out):
+                self.synced[rel_path] = state_in
+                continue
+            base = self.synced.get(rel_path)
+            if self.same(state_out, base):
+                src = self.local_mount_in
+            elif self.same(state_in, base):
+                src = self.local_mount_out
+            elif state_in is None or (state_out is not None and state_out[2] > state_in[2]):
+                src = self.local_mount_out
+            else:
+                src = self.local_mount_in
+            changes[rel_path] = (src, objects[src].get(rel_path))
+
+        for rel_path in self.synced.keys():
+            if rel_path not in objects_in and rel_path not in objects_out:
+                del self.synced[rel_path]
+                for root in objects:
+                    self.fingerprints.pop(os.path.join(root, rel_path), None)
+
+        # a change is applied only if it stayed the same for delay seconds:
+        # files which are still being written are not copied
+        ready = []
+        for rel_path, change in changes.iteritems():
+            prev = self.changes.get(rel_path)
+            if prev is None or prev[0] != change:
+                self.changes[rel_path] = (change, now)
+            elif now - prev[1] >= self.delay:
+                ready.append(rel_path)
+        for rel_path in self.changes.keys():
+            if rel_path not in changes:
+                del self.changes[rel_path]
+
+        # parents first for new objects, children first for removed ones
+        def order(rel_path):
+            removed = changes[rel_path][1] is None
+            return removed, rel_path.count(os.sep) * (-1 if removed else 1)
+        ready.sort(key=order)
+
+        for rel_path in ready:
+            if not self.running or self.paused:
+                break
+            src, state = changes[rel_path]
+            dst = self.local_mount_out if src == self.local_mount_in else self.local_mount_in
+            dst_state = objects[dst].get(rel_path)
+            try:
+                if state is None:
+                    self.remove(os.path.join(dst, rel_path), dst_state[0])
+                elif state[0]:
+                    self.mkdir(os.path.join(dst, rel_path), dst_state)
+                else:
+                    self.copy(os.path.join(src, rel_path), os.path.join(dst, rel_path), dst_state)
+            except (OSError, IOError), e:
+                # the object is changing under our hands, retry in the next round
+                logging.debug("Loopback failed to sync %s (%s)" % (rel_path, e))
+                continue
+            del self.changes[rel_path]
+            self.synced[rel_path] = state
+            if dst == self.local_mount_out:
+                self.on_fs_event(os.path.join(dst, rel_path), state is not None, time.time())
+
+        return len(changes)
+
+    @staticmethod
+    def remove(path, is_dir):
+        if is_dir:
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def mkdir(self, path, dst_state):
+        if dst_state is not None:
+            # a file with the same name
+            self.remove(path, dst_state[0])
+        os.mkdir(path)
+
+    def copy(self, src, dst, dst_state):
+        """
+        copy a file to a temporary location with bandwidth limit, then move it in place
+        """
+        tmp = os.path.join(self.work_dir, ".loopback_" + get_random_str())
+        start = time.time()
+        copied = 0
+        try:
+            with open(src, "rb") as fin:
+                with open(tmp, "wb") as fout:
+                    while True:
+                        buf = fin.read(self.COPY_BLOCK)
+                        if not buf:
+                            break
+                        fout.write(buf)
+                        copied += len(buf)
+                        if self.bandwidth:
+                            ahead = copied / float(self.bandwidth) - (time.time() - start)
+                            if ahead > 0:
+                                time.sleep(ahead)
+            shutil.copystat(src, tmp)
+            if dst_state is not None and dst_state[0]:
+                self.remove(dst, True)
+            os.rename(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def mirror(self):
+        """
+        mirror thread function
+        """
+        while self.running:
+            nr_changes = 0
+            if not self.paused:
+                try:
+                    nr_changes = self.mirror_round()
+                except Exception:
+                    # keep mirroring, the round is retried; a dead thread would fail every following test
+                    logging.exception("Loopback mirroring round has failed")
+                    nr_changes = 1
+            with self.cond:
+                self.nr_rounds += 1
+                if nr_changes == 0 and not self.paused:
+                    self.idle_round = self.nr_rounds
+                self.cond.notify_all()
+            time.sleep(self.scan_interval)
+
+    def start(self):
+        """
+        start mirroring thread
+        """
+        self.running = True
+        self.mirror_thread = threading.Thread(target=self.mirror, name="loopback")
+        self.mirror_thread.daemon = True
+        self.mirror_thread.start()
+        return True
+
+    def finish(self):
+        """
+        stop mirroring thread
+        """
+        self.running = False
+        if self.mirror_thread:
+            self.mirror_thread.join()
+            self.mirror_thread = None
+
+    def sync(self, timeout=None):
+        """
+        wait until a full mirror round which started after this call has found no differences
+        """
+        if timeout is None:
+            timeout = self.sync_timeout
+        if os.getpid() != self.owner_pid or not self.is_alive():
+            # a forked shard process can't see mirroring rounds
+            return super(LoopbackSyncApp, self).sync(timeout)
+
+        deadline = time.time() + timeout
+        with self.cond:
+            # the round in progress may have scanned before the caller's last change
+            wanted = self.nr_rounds + 2
+            while self.idle_round < wanted:
+                left = deadline - time.time()
+                if left <= 0 or not self.is_alive():
+                    return False
+                self.cond.wait(left)
+        return True
+
+    def pids(self):
+        """
+        return dictionary: instance name => pid
+        """
+        # mirroring runs in the test process
+        return {"loopback": self.owner_pid}
+
+    def is_alive(self):
+        """
+        return True if mirroring thread is running
+        """
+        if os.getpid() != self.owner_pid:
+            return pid_alive(self.owner_pid)
+        return self.mirror_thread is not None and self.mirror_thread.is_alive()
+
+    def pause(self):
+        """
+        stop applying changes
+        """
+        self.paused = True
+
+    def unpause(self):
+        """
+        resume applying changes
+        """
+        self.paused = False
+
+def create_shard_app(args, storage, shard_idx):
+    """
+    return application for a shard of ShardedRunner, with its own work directory and mirroring thread
+    """
+    bandwidth = args.bandwidth * 1024 if args.bandwidth else None
+    app = LoopbackSyncApp(os.path.join(args.work_dir, "shard_%d" % shard_idx), args.delay, bandwidth, args.nodelete, args.large, storage=storage)
+    configure_app(app, args)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(epilog="No network connection or MEGA account is required.")
+    add_common_args(parser)
+    parser.add_argument("--shared", help="all shards share the same application instances", action="store_true")
+    parser.add_argument("--delay", help="propagation delay in seconds", type=float, default=0.0)
+    parser.add_argument("--bandwidth", help="copy speed limit in KB/s", type=int, default=None)
+    parser.add_argument("work_dir", help="local work directory")
+    args = parser.parse_args()
+    storage = setup(parser, args)
+
+    bandwidth = args.bandwidth * 1024 if args.bandwidth else None
+    create_app = functools.partial(LoopbackSyncApp, args.work_dir, args.delay, bandwidth, args.nodelete, args.large, storage=storage)
+    shard_factory = None if args.shared else functools.partial(create_shard_app, args, storage)
+    sys.exit(0 if run_tests(args, get_tests(args), create_app, shard_factory) else 1)
@@ -0,0 +1,256 @@
+"""
+ Directory tree manifests for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import stat
+import hashlib
+import logging
+from sync_test_convergence import TreeSnapshot
+from sync_test_convergence import to_fs_path
+
+
+class ManifestEntry(object):
+    """
+    state of a single object in a tree
+    """
+    __slots__ = ("is_dir", "size", "mtime", "inode", "digest")
+
+    def __init__(self, is_dir, size, mtime, inode, digest=None):
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.inode = inode
+        self.digest = digest
+
+
+class HashCache(object):
+    """
+    content digests keyed by (digest algorithm, device, inode, size, mtime, ctime),
+    so untouched files are not hashed again;
+    ctime catches files rewritten with the same size and their mtime restored (as sync clients do)
+    and reused inodes, it also changes on rename on most filesystems, so renamed files are hashed again
+    """
+    def __init__(self):
+        self.digests = {}
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def get_key(st, algo):
+        return algo, st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime
+
+    def digest_files(self, l_fnames, hash_pool, algo="md5"):
+        """
+        return a list of digests for a list of files, hashing only files which are not cached
+        None is returned for files which can't be read
+        """
+        l_digests = [None] * len(l_fnames)
+        l_miss = []
+        for i, fname in enumerate(l_fnames):
+            try:
+                key = self.get_key(os.stat(fname), algo)
+            except OSError:
+                continue
+            digest = self.digests.get(key)
+            if digest is None:
+                l_miss.append((i, fname, key))
+            else:
+                l_digests[i] = digest
+        self.hits += len(l_fnames) - len(l_miss)
+        self.misses += len(l_miss)
+
+        if l_miss:
+            l_new = hash_pool.digest_files([fname for _, fname, _ in l_miss], algo)
+            for (i, fname, key), digest in zip(l_miss, l_new):
+                l_digests[i] = digest
+                if digest is not None:
+                    self.digests[key] = digest
+        return l_digests
+
+
+class Manifest(object):
+    """
+    path, size, mtime, inode and content digest of every object in a tree
+    """
+    def __init__(self, root, entries=None):
+        """
+        root: tree root directory
+        entries: dictionary of relative path => ManifestEntry
+        """
+        self.root = to_fs_path(root)
+        self.entries = entries if entries is not None else {}
+        self.dir_digests = None
+        self.children = None
+
+    @classmethod
+    def from_dirs(cls, root, l_dirs):
+        """
+        build a manifest of expected content from a list of directories created by tests:
+        {"name": dir name, "l_files": [{"name", "size", "md5"}, ..]}
+        """
+        manifest = cls(root)
+        for d in l_dirs:
+            manifest.entries[to_fs_path(d["name"])] = ManifestEntry(True, 0, None, None)
+            for f in d["l_files"]:
+                rel_path = to_fs_path(os.path.join(d["name"], f["name"]))
+                manifest.entries[rel_path] = ManifestEntry(False, f["size"], None, None, f["md5"])
+        return manifest
+
+    @classmethod
+    def scan(cls, root, hash_cache, hash_pool, algo="md5"):
+        """
+        build a manifest of a tree on disk
+        """
+        manifest = cls(root)
+        stack = [""]
+        l_files = []
+        while stack:
+            rel_dir = stack.pop()
+            for name, is_dir, _ in TreeSnapshot.list_dir(os.path.join(manifest.root, rel_dir)):
+                rel_path = os.path.join(rel_dir, name)
+                try:
+                    st = os.lstat(os.path.join(manifest.root, rel_path))
+                except OSError:
+                    continue
+                entry = ManifestEntry(is_dir, st.st_size, st.st_mtime, st.st_ino)
+                manifest.entries[rel_path] = entry
+                if is_dir:
+                    entry.size = 0
+                    stack.append(rel_path)
+                elif stat.S_ISREG(st.st_mode):
+                    l_files.append(rel_path)
+
+        l_digests = hash_cache.digest_files([os.path.join(manifest.root, p) for p in l_files], hash_pool, algo)
+        for rel_path, digest in zip(l_files, l_digests):
+            manifest.entries[rel_path].digest = digest
+        return manifest
+
+    def diff(self, other):
+        """
+        compare with another manifest (usually "in" against "out")
+        """
+        return ManifestDiff(self, other)
+
+    def calc_dir_digests(self):
+        """
+        calculate Merkle digest of every directory:
+        md5 over sorted child names, types and digests (content digest for files)
+        """
+        self.children = {"": []}
+        for rel_path, entry in self.entries.iteritems():
+            self.children.setdefault(os.path.dirname(rel_path), []).append(rel_path)
+            if entry.is_dir:
+                self.children.setdefault(rel_path, [])
+
+        self.dir_digests = {}
+        # children first
+        for rel_dir in sorted(self.children, key=lambda p: p.count(os.sep) + (1 if p else 0), reverse=True):
+            h = hashlib.md5()
+            for rel_path in sorted(self.children[rel_dir]):
+                entry = self.entries[rel_path]
+                if entry.is_dir:
+                    h.update("d\0%s\0%s\0" % (os.path.basename(rel_path), self.dir_digests[rel_path]))
+                else:
+                    h.update("f\0%s\0%s\0" % (os.path.basename(rel_path), entry.digest))
+            self.dir_digests[rel_dir] = h.hexdigest()
+
+    def dir_digest(self, rel_dir=""):
+        """
+        return Merkle digest of a directory, None if it's not in the manifest
+        """
+        if self.dir_digests is None:
+            self.calc_dir_digests()
+        return self.dir_digests.get(to_fs_path(rel_dir))
+
+    def merkle_diff(self, other, rel_dir=""):
+        """
+        compare directory digests starting from rel_dir
+        descend only into directories with different digests
+        return a sorted list of divergent relative paths
+        """
+        rel_dir = to_fs_path(rel_dir)
+        digest_a = self.dir_digest(rel_dir)
+        digest_b = other.dir_digest(rel_dir)
+        # a directory missing from both manifests is a difference too
+        if digest_a is None or digest_b is None:
+            return [rel_dir]
+        if digest_a == digest_b:
+            return []
+
+        l_diff = []
+        for rel_path in sorted(set(self.children[rel_dir]) | set(other.children[rel_dir])):
+            ea = self.entries.get(rel_path)
+            eb = other.entries.get(rel_path)
+            if ea is not None and eb is not None and ea.is_dir and eb.is_dir:
+                l_diff.extend(self.merkle_diff(other, rel_path))
+            elif ea is None or eb is None or ea.is_dir != eb.is_dir or ea.digest != eb.digest:
+                l_diff.append(rel_path)
+        return l_diff
+
+
+class ManifestDiff(object):
+    """
+    differences between two manifests, lists of relative paths
+    missing: present only in the first manifest
+    extra: present only in the second manifest
+    type_mismatch: file in one manifest, directory in another
+    size_mismatch, digest_mismatch: files with different content
+    """
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.missing = []
+        self.extra = []
+        self.type_mismatch = []
+        self.size_mismatch = []
+        self.digest_mismatch = []
+
+        for rel_path, ea in a.entries.iteritems():
+            eb = b.entries.get(rel_path)
+            if eb is None:
+                self.missing.append(rel_path)
+            elif ea.is_dir != eb.is_dir:
+                self.type_mismatch.append(rel_path)
+            elif ea.is_dir:
+                continue
+            elif ea.size != eb.size:
+                self.size_mismatch.append(rel_path)
+            elif ea.digest != eb.digest:
+                self.digest_mismatch.append(rel_path)
+        for rel_path in b.entries:
+            if rel_path not in a.entries:
+                self.extra.append(rel_path)
+
+        for l in (self.missing, self.extra, self.type_mismatch, self.size_mismatch, self.digest_mismatch):
+            l.sort()
+
+    def __nonzero__(self):
+        return bool(self.missing or self.extra or self.type_mismatch or self.size_mismatch or self.digest_mismatch)
+
+    def log(self, level=logging.ERROR):
+        """
+        log every divergent path
+        """
+        for title, l in (("Missing in %s" % self.b.root, self.missing),
+                         ("Not present in %s" % self.a.root, self.extra),
+                         ("File / directory mismatch", self.type_mismatch),
+                         ("Size mismatch", self.size_mismatch),
+                         ("Content mismatch", self.digest_mismatch)):
+            for rel_path in l:
+                logging.log(level, "%s: %s" % (title, rel_path))
@@ -0,0 +1,390 @@
+"""
+ Application for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import sys
+import os
+import posixpath
+import time
+import threading
+from sync_test_app import SyncTestApp
+from sync_test_cli import add_common_args, setup, get_tests, configure_app, run_tests
+import logging
+import argparse
+import functools
+
+# Python bindings built in the source tree (./configure --enable-python)
+_bindings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bindings", "python")
+if os.path.isfile(os.path.join(_bindings_dir, ".libs", "_mega.so")):
+    sys.path.insert(0, _bindings_dir)
+    sys.path.insert(0, os.path.join(_bindings_dir, ".libs"))
+
+import mega
+
+APP_KEY = "ox8xnQZL"
+# SimpleLogger level names, so SdkLogParser can read the log
+LOG_LEVELS = ["fatal", "err", "warn", "info", "debug", "verbose"]
+
+
+class RequestWaiter(mega.MegaRequestListener):
+    """
+    result of a single asynchronous request
+    """
+    def __init__(self):
+        super(RequestWaiter, self).__init__()
+        self.event = threading.Event()
+        self.error_code = None
+        self.error_str = None
+
+    def onRequestFinish(self, api, request, error):
+        # objects passed to callbacks are deleted when the callback returns
+        self.error_code = error.getErrorCode()
+        self.error_str = error.getErrorString()
+        self.event.set()
+
+
+class SyncStateListener(mega.MegaListener):
+    """
+    forwards sync callbacks of a MegaApi instance to the application
+    """
+    def __init__(self, app, name):
+        super(SyncStateListener, self).__init__()
+        self.app = app
+        self.name = name
+
+    def onSyncFileStateChanged(self, api, sync, filePath, newState):
+        self.app.on_file_state(self.name, filePath, newState)
+
+    def onSyncStateChanged(self, api, sync):
+        self.app.on_sync_state(self.name, sync.getState())
+
+    def onGlobalSyncStateChanged(self, api):
+        self.app.on_global_state(self.name, api.isScanning(), api.isWaiting())
+
+
+class FileLogger(mega.MegaLogger):
+    """
+    writes SDK log in SimpleLogger format
+    """
+    def __init__(self, fname):
+        super(FileLogger, self).__init__()
+        self.fout = open(fname, "a")
+        self.lock = threading.Lock()
+
+    def log(self, t, loglevel, source, message):
+        level = LOG_LEVELS[loglevel] if 0 <= loglevel < len(LOG_LEVELS) else str(loglevel)
+        with self.lock:
+            self.fout.write("[%s] [%s] %s %s\n" % (time.strftime("%H:%M:%S", time.gmtime()), level, source, message))
+            self.fout.flush()
+
+
+class InstanceState(object):
+    """
+    sync state of a MegaApi instance as reported by callbacks
+    """
+    def __init__(self):
+        self.scanning = True
+        self.waiting = False
+        self.sync_state = None
+        # local path => STATE_PENDING or STATE_SYNCING
+        self.pending = {}
+
+
+class SyncTestMegaApiApp(SyncTestApp):
+    """
+    runs two syncs of the same remote folder through the Python bindings in the test process,
+    each with its own MegaApi instance (a client can't sync a remote folder twice);
+    sync() returns as soon as both instances report they are idle
+    """
+    def __init__(self, work_dir, remote_folder, delete_tmp_files=True, use_large_files=True, storage=None, debug=False,
+                 create_remote=False):
+        """
+        work_dir: a temporary folder to place generated files
+        remote_folder: a remote folder to sync
+        create_remote: create remote_folder if it doesn't exist (its parent must exist)
+        storage: StorageProfile work_dir is placed on, to tag results with
+        debug: write SDK log to work_dir
+        """
+        self.local_mount_in = os.path.join(work_dir, "sync_in")
+        self.local_mount_out = os.path.join(work_dir, "sync_out")
+        self.work_dir = os.path.join(work_dir, "tmp")
+        # local caches of MegaApi instances
+        self.api_dir = os.path.join(work_dir, "megaapi")
+        self.remote_folder = remote_folder
+        self.create_remote = create_remote
+        self.debug = debug
+
+        self.apis = {}
+        self.listeners = {}
+        self.states = {}
+        self.lock = threading.Lock()
+        # time of the last sync callback
+        self.last_change = 0.0
+        self.request_timeout = 120.0
+        # listeners of requests which have timed out, the SDK may still call them
+        self.l_waiters = []
+        self.logger = None
+        self.log_fname = None
+
+        # init base class
+        super(SyncTestMegaApiApp, self).__init__(self.local_mount_in, self.local_mount_out, self.work_dir, delete_tmp_files, use_large_files)
+        self.storage = storage
+        # the SDK postpones local changes younger than 0.3 s (Sync::procscanq),
+        # "idle" is trusted only after it has lasted this long
+        self.idle_settle = 0.5
+        self.poll_interval = 0.05
+
+        for d in (self.local_mount_in, self.local_mount_out, self.work_dir, self.api_dir):
+            try:
+                os.makedirs(d)
+            except OSError:
+                pass
+            if not os.access(d, os.W_OK | os.X_OK):
+                raise Exception("Not enough permissions to create / write to directory")
+
+    def request(self, name, what, func, *args):
+        """
+        call an asynchronous MegaApi function and wait for its result
+        return True on success
+        """
+        waiter = RequestWaiter()
+        self.l_waiters.append(waiter)
+        func(*(args + (waiter,)))
+        if not waiter.event.wait(self.request_timeout):
+            logging.error("Instance %s: %s has timed out" % (name, what))
+            return False
+        self.l_waiters.remove(waiter)
+        if waiter.error_code != mega.MegaError.API_OK:
+            logging.error("Instance %s: %s has failed: %s" % (name, what, waiter.error_str))
+            return False
+        return True
+
+    def start(self):
+        """
+        log in both instances, the second one reuses the session of the first one, and start syncs
+        """
+        email = os.environ.get('MEGA_EMAIL')
+        password = os.environ.get('MEGA_PWD')
+        if email is None or password is None:
+            logging.error("Environment variables MEGA_EMAIL and MEGA_PWD are not set !")
+            return False
+        if not hasattr(mega.MegaApi, "syncFolder"):
+            logging.error("mega module is built without sync support")
+            return False
+
+        if self.debug:
+            self.log_fname = os.path.join(self.work_dir, "megaapi.log")
+            self.logger = FileLogger(self.log_fname)
+            mega.MegaApi.setLoggerObject(self.logger)
+            mega.MegaApi.setLogLevel(mega.MegaApi.LOG_LEVEL_MAX)
+
+        session = None
+        for name, local_folder in (("in", self.local_mount_in), ("out", self.local_mount_out)):
+            base_path = os.path.join(self.api_dir, name)
+            try:
+                os.makedirs(base_path)
+            except OSError:
+                pass
+            api = mega.MegaApi(APP_KEY, base_path + os.sep, "sync_test")
+            listener = SyncStateListener(self, name)
+            api.addListener(listener)
+            self.apis[name] = api
+            self.listeners[name] = listener
+            self.states[name] = InstanceState()
+
+            if session is None:
+                if not self.request(name, "login", api.login, email, password):
+                    return False
+                session = api.dumpSession()
+            elif not self.request(name, "fastLogin", api.fastLogin, session):
+                return False
+            if not self.request(name, "fetchNodes", api.fetchNodes):
+                return False
+
+            node = api.getNodeByPath(self.remote_folder)
+            if node is None and self.create_remote:
+                node = self.create_remote_folder(name, api)
+            if node is None or not node.isFolder():
+                logging.error("Remote folder is not found: %s" % self.remote_folder)
+                return False
+            if not self.request(name, "syncFolder", api.syncFolder, local_folder, node):
+                return False
+            logging.info("Instance %s: syncing %s with %s" % (name, local_folder, self.remote_folder))
+
+        return True
+
+    def create_remote_folder(self, name, api):
+        """
+        create remote_folder in its parent folder, return its node or None on failure
+        """
+        parent_path, folder_name = posixpath.split(self.remote_folder.rstrip("/"))
+        parent = api.getNodeByPath(parent_path or "/")
+        if parent is None or not parent.isFolder():
+            logging.error("Remote folder is not found: %s" % (parent_path or "/"))
+            return None
+        if not self.request(name, "createFolder", api.createFolder, folder_name, parent):
+            return None
+        logging.info("Instance %s: created remote folder %s" % (name, self.remote_folder))
+        return api.getNodeByPath(self.remote_folder)
+
+    def finish(self):
+        """
+        stop syncs and log out, the session is closed by the instance which has opened it
+        """
+        for name in ("out", "in"):
+            api = self.apis.get(name)
+            if api is None:
+                continue
+            self.request(name, "removeSyncs", api.removeSyncs)
+            if name == "in":
+                self.request(name, "logout", api.logout)
+            else:
+                self.request(name, "localLogout", api.localLogout)
+        if self.logger is not None:
+            mega.MegaApi.setLoggerObject(None)
+
+    def on_file_state(self, name, path, state):
+        with self.lock:
+            pending = self.states[name].pending
+            if state in (mega.MegaApi.STATE_PENDING, mega.MegaApi.STATE_SYNCING):
+                pending[path] = state
+            else:
+                pending.pop(path, None)
+            self.last_change = time.time()
+
+    def on_sync_state(self, name, state):
+        with self.lock:
+            self.states[name].sync_state = state
+            self.last_change = time.time()
+        if state in (mega.MegaSync.SYNC_FAILED, mega.MegaSync.SYNC_CANCELED):
+            logging.error("Instance %s: sync has stopped, state: %d" % (name, state))
+
+    def on_global_state(self, name, scanning, waiting):
+        with self.lock:
+            self.states[name].scanning = scanning
+            self.states[name].waiting = waiting
+            self.last_change = time.time()
+
+    def is_idle(self):
+        """
+        return True if no instance is scanning, waiting for the server or has files to transfer
+        """
+        with self.lock:
+            for state in self.states.values():
+                if state.scanning or state.waiting or state.pending or state.sync_state != mega.MegaSync.SYNC_ACTIVE:
+                    return False
+        for api in self.apis.values():
+            if api.getNumPendingUploads() or api.getNumPendingDownloads():
+                return False
+        return True
+
+    def sync(self, timeout=None):
+        """
+        wait until both instances are idle for idle_settle seconds
+        return False if they are still busy after timeout (sync_timeout by default) seconds
+        """
+        if timeout is None:
+            timeout = self.sync_timeout
+        if not self.apis:
+            return True
+
+        self.watch()
+        start = time.time()
+        deadline = start + timeout
+        while True:
+            now = time.time()
+            # changes made just before the call may not have been noticed yet
+            if now - max(self.last_change, start) >= self.idle_settle and self.is_idle():
+                logging.debug("Instances are idle after %.2f s" % (now - start))
+                return True
+            if now >= deadline:
+                logging.debug("Instances are still busy after %.2f s" % (now - start))
+                return False
+            # handle filesystem events meanwhile, for latency measurements
+            self.watcher.poll(min(self.poll_interval, deadline - now))
+
+    def pids(self):
+        """
+        return dictionary: instance name => pid
+        """
+        # both instances run in the test process
+        return {"megaapi": os.getpid()}
+
+    def log_files(self):
+        """
+        return dictionary: instance name => log file
+        """
+        if self.log_fname is None:
+            return {}
+        # SDK logger is global, both instances write to the same log
+        return {"megaapi": self.log_fname}
+
+    def is_alive(self):
+        """
+        return True if both syncs are running
+        """
+        with self.lock:
+            if len(self.states) != 2:
+                return False
+            for state in self.states.values():
+                if state.sync_state in (mega.MegaSync.SYNC_FAILED, mega.MegaSync.SYNC_CANCELED):
+                    return False
+        return True
+
+    def pause(self):
+        """
+        pause transfers of both instances
+        """
+        res = True
+        for name, api in self.apis.items():
+            res = self.request(name, "pauseTransfers", api.pauseTransfers, True) and res
+        return res
+
+    def unpause(self):
+        """
+        resume transfers of both instances
+        """
+        res = True
+        for name, api in self.apis.items():
+            res = self.request(name, "pauseTransfers", api.pauseTransfers, False) and res
+        return res
+
+def create_shard_app(args, storage, shard_idx):
+    """
+    return application for a shard of ShardedRunner, with its own work directory, MegaApi instances
+    and remote folder sync_dir/shard_N
+    """
+    remote_folder = "%s/shard_%d" % (args.sync_dir.rstrip("/"), shard_idx)
+    app = SyncTestMegaApiApp(os.path.join(args.work_dir, "shard_%d" % shard_idx), remote_folder, args.nodelete, args.large, storage,
+                             args.debug, create_remote=True)
+    configure_app(app, args)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(epilog="Please set MEGA_EMAIL and MEGA_PWD environment variables. "
+                                            "With --debug, SDK log is written to work_dir.")
+    add_common_args(parser, shards_help="every shard runs its own instances on sync_dir/shard_N")
+    parser.add_argument("work_dir", help="local work directory")
+    parser.add_argument("sync_dir", help="remote directory for synchronization")
+    args = parser.parse_args()
+    storage = setup(parser, args)
+
+    create_app = functools.partial(SyncTestMegaApiApp, args.work_dir, args.sync_dir, args.nodelete, args.large, storage, args.debug)
+    # SDK threads don't survive fork(), shards can't share instances
+    sys.exit(0 if run_tests(args, get_tests(args), create_app, functools.partial(create_shard_app, args, storage)) else 1)
@@ -22,14 +22,12 @@ import sys
 import os
 import time
 import shutil
-import unittest
-import xmlrunner
-import subprocess
-import re
 from sync_test_app import SyncTestApp
-from sync_test import SyncTest
+from sync_test_supervisor import ProcessSupervisor, find_pids
+from sync_test_cli import add_common_args, setup, get_tests, run_tests
 import logging
 import argparse
+import functools
 
 
 class SyncTestMegaCliApp(SyncTestApp):
@@ -44,20 +42,36 @@ class SyncTestMegaCliApp(SyncTestApp):
         self.work_dir = os.path.join(".", "work_dir")
         SyncTestApp.__init__(self, local_mount_in, local_mount_out, self.work_dir, delete_tmp_files, use_large_files)
         self.check_if_alive = check_if_alive
-
-    def sync(self):
-        time.sleep(5)
+        self.supervisor = ProcessSupervisor()
 
     def start(self):
         # try to create work dir
+        if not self.check_if_alive:
+            return True
+
+        # megacli instances are started by user, find them once
+        l_pids = find_pids("megacli")
+        if not l_pids:
+            logging.error("megacli is not running !")
+            return False
+        for pid in l_pids:
+            self.supervisor.add_pid("megacli_%d" % pid, pid)
+        logging.info("Found megacli instances: %s" % ", ".join(str(pid) for pid in l_pids))
         return True
 
     def finish(self):
+        self.supervisor.close()
         try:
             shutil.rmtree(self.work_dir)
         except OSError, e:
             logging.error("Failed to remove dir: %s (%s)" % (self.work_dir, e))
 
+    def pids(self):
+        """
+        return dictionary: instance name => pid
+        """
+        return dict((name, proc.pid) for name, proc in self.supervisor.procs.items())
+
     def is_alive(self):
         """
         return True if application instance is running
@@ -65,59 +79,29 @@ class SyncTestMegaCliApp(SyncTestApp):
         if not self.check_if_alive:
             return True
 
-        s = subprocess.Popen(["ps", "axw"], stdout=subprocess.PIPE)
-        for x in s.stdout:
-            if re.search("megacli", x):
-                return True
-        return False
+        return self.supervisor.is_alive()
 
     def pause(self):
         """
-        pause application
+        stop megacli processes with SIGSTOP
         """
-        # TODO: implement this !
-        raise NotImplementedError("Not Implemented !")
+        return self.supervisor.pause()
 
     def unpause(self):
         """
-        unpause application
+        resume megacli processes
         """
-        # TODO: implement this !
-        raise NotImplementedError("Not Implemented !")
+        return self.supervisor.unpause()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--test1", help="test_create_delete_files", action="store_true")
-    parser.add_argument("--test2", help="test_create_rename_delete_files", action="store_true")
-    parser.add_argument("--test3", help="test_create_delete_dirs", action="store_true")
-    parser.add_argument("--test4", help="test_create_rename_delete_dirs", action="store_true")
-    parser.add_argument("--test5", help="test_sync_files_write", action="store_true")
-    parser.add_argument("--test6", help="test_local_operations", action="store_true")
-    parser.add_argument("--test7", help="test_update_mtime", action="store_true")
-    parser.add_argument("--test8", help="test_create_rename_delete_unicode_files_dirs", action="store_true")
-    parser.add_argument("-a", "--all", help="run all tests", action="store_true")
-    parser.add_argument("-b", "--basic", help="run basic, stable tests", action="store_true")
-    parser.add_argument("-d", "--debug", help="use debug output", action="store_true")
-    parser.add_argument("-l", "--large", help="use large files for testing", action="store_true")
-    parser.add_argument("-n", "--nodelete", help="Do not delete work files", action="store_false")
+    add_common_args(parser, storage=False, shards_help="shards share megacli instances")
     parser.add_argument("-c", "--check", help="Do not check if megacli is running (useful, if other application is used for testing)", action="store_false")
     parser.add_argument("upsync_dir", help="local upsync directory")
     parser.add_argument("downsync_dir", help="local downsync directory")
     args = parser.parse_args()
-
-    if args.debug:
-        lvl = logging.DEBUG
-    else:
-        lvl = logging.INFO
-
-    if args.all:
-        args.test1 = args.test2 = args.test3 = args.test4 = args.test5 = args.test6 = args.test7 = args.test8 = True
-    if args.basic:
-        args.test1 = args.test2 = args.test3 = args.test4 = True
-
-    logging.StreamHandler(sys.stdout)
-    logging.basicConfig(format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S', level=lvl)
+    setup(parser, args)
 
     logging.info("")
     logging.info("1) Start the first [megacli] and run the following command:  sync " + args.upsync_dir + " [remote folder]")
@@ -129,32 +113,5 @@ if __name__ == "__main__":
     logging.info("")
     time.sleep(5)
 
-    with SyncTestMegaCliApp(args.upsync_dir, args.downsync_dir, args.nodelete, args.large, args.check) as app:
-        suite = unittest.TestSuite()
-
-        if args.test1:
-            suite.addTest(SyncTest("test_create_delete_files", app))
-
-        if args.test2:
-            suite.addTest(SyncTest("test_create_rename_delete_files", app))
-
-        if args.test3:
-            suite.addTest(SyncTest("test_create_delete_dirs", app, ))
-
-        if args.test4:
-            suite.addTest(SyncTest("test_create_rename_delete_dirs", app))
-
-        if args.test5:
-            suite.addTest(SyncTest("test_sync_files_write", app))
-
-        if args.test6:
-            suite.addTest(SyncTest("test_local_operations", app))
-
-        if args.test7:
-            suite.addTest(SyncTest("test_update_mtime", app))
-
-        if args.test8:
-            suite.addTest(SyncTest("test_create_rename_delete_unicode_files_dirs", app))
-
-        testRunner = xmlrunner.XMLTestRunner(output='test-reports')
-        testRunner.run(suite)
+    create_app = functools.partial(SyncTestMegaCliApp, args.upsync_dir, args.downsync_dir, args.nodelete, args.large, args.check)
+    sys.exit(0 if run_tests(args, get_tests(args), create_app) else 1)
@@ -23,12 +23,12 @@ import os
 import time
 import subprocess
 from sync_test_base import get_random_str
-from sync_test import SyncTest
 from sync_test_app import SyncTestApp
-import unittest
-import xmlrunner
+from sync_test_supervisor import ProcessSupervisor
+from sync_test_cli import add_common_args, setup, get_tests, run_tests
 import logging
 import argparse
+import functools
 import platform
 
 
@@ -36,14 +36,18 @@ class SyncTestMegaSyncApp(SyncTestApp):
     """
     operates with megasync application
     """
-    def __init__(self, work_dir, remote_folder, delete_tmp_files=True, use_large_files=True):
+    def __init__(self, work_dir, remote_folder, delete_tmp_files=True, use_large_files=True, restart=False, storage=None):
         """
         work_dir: a temporary folder to place generated files
         remote_folder: a remote folder to sync
+        restart: restart crashed megasimplesync instances
+        storage: StorageProfile work_dir is placed on, to tag results with
         """
 
-        self.megasync_ch_in = None
-        self.megasync_ch_out = None
+        self.supervisor = ProcessSupervisor()
+        # instance name => log file of the running megasimplesync
+        self.log_fnames = {}
+        self.restart = restart
 
         self.local_mount_in = os.path.join(work_dir, "sync_in")
         self.local_mount_out = os.path.join(work_dir, "sync_out")
@@ -53,6 +57,7 @@ class SyncTestMegaSyncApp(SyncTestApp):
 
         # init base class
         super(SyncTestMegaSyncApp, self).__init__(self.local_mount_in, self.local_mount_out, self.work_dir, delete_tmp_files, use_large_files)
+        self.storage = storage
 
         try:
             os.makedirs(self.local_mount_in)
@@ -102,6 +107,7 @@ class SyncTestMegaSyncApp(SyncTestApp):
         pargs = [os.path.join(bin_path, app_name), local_folder, self.remote_folder]
         output_fname = os.path.join(self.work_dir, "megasimplesync" + "_" + type_str + "_" + get_random_str() + ".log")
         output_log = open(output_fname, "w")
+        self.log_fnames[type_str] = output_fname
 
         logging.info("Launching cmd: \"%s\", log: \"%s\"" % (" ".join(pargs), output_fname))
 
@@ -112,12 +118,6 @@ class SyncTestMegaSyncApp(SyncTestApp):
             return None
         return ch
 
-    def sync(self):
-        """
-        TODO: wait for full synchronization
-        """
-        time.sleep(5)
-
     def start(self):
         """
         prepare and run tests
@@ -127,15 +127,17 @@ class SyncTestMegaSyncApp(SyncTestApp):
             logging.error("Environment variables MEGA_EMAIL and MEGA_PWD are not set !")
             return False
 
-        # start "in" instance
-        self.megasync_ch_in = self.start_megasync(self.local_mount_in, "in")
-        # pause
-        time.sleep(5)
-        # start "out" instance
-        self.megasync_ch_out = self.start_megasync(self.local_mount_out, "out")
-        # check both instances
-        if self.megasync_ch_in is None or self.megasync_ch_out is None:
-            return False
+        for type_str, local_folder in (("in", self.local_mount_in), ("out", self.local_mount_out)):
+            ch = self.start_megasync(local_folder, type_str)
+            if ch is None:
+                return False
+            restart = None
+            if self.restart:
+                restart = functools.partial(self.start_megasync, local_folder, type_str)
+            self.supervisor.add_child(type_str, ch, restart)
+            if type_str == "in":
+                # pause
+                time.sleep(5)
 
         return True
 
@@ -147,99 +149,53 @@ class SyncTestMegaSyncApp(SyncTestApp):
         self.sync()
 
         # kill instances
-        for _ in range(0, 5):
-            if self.megasync_ch_in:
-                self.megasync_ch_in.terminate()
-                time.sleep(5)
-            else:
-                break
+        self.supervisor.close()
+        for type_str in ("in", "out"):
+            if type_str in self.supervisor.procs:
+                self.supervisor.terminate(type_str, 25)
 
-        for _ in range(0, 5):
-            if self.megasync_ch_out:
-                self.megasync_ch_out.terminate()
-                time.sleep(5)
-            else:
-                break
+    def pids(self):
+        """
+        return dictionary: instance name => pid
+        """
+        return dict((name, proc.pid) for name, proc in self.supervisor.procs.items())
+
+    def log_files(self):
+        """
+        return dictionary: instance name => log file
+        """
+        return dict(self.log_fnames)
 
     def is_alive(self):
         """
         return True if application instance is running
         """
-        if not self.megasync_ch_in or not self.megasync_ch_out:
-            return False
-        return self.megasync_ch_in.poll() is None and self.megasync_ch_out.poll() is None
+        return self.supervisor.is_alive()
 
     def pause(self):
         """
-        pause application
+        stop megasimplesync instances with SIGSTOP
         """
+        return self.supervisor.pause()
 
     def unpause(self):
         """
-        unpause application
+        resume megasimplesync instances
         """
+        return self.supervisor.unpause()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(epilog="Please set MEGA_EMAIL and MEGA_PWD environment variables.")
-    parser.add_argument("--test1", help="test_create_delete_files", action="store_true")
-    parser.add_argument("--test2", help="test_create_rename_delete_files", action="store_true")
-    parser.add_argument("--test3", help="test_create_delete_dirs", action="store_true")
-    parser.add_argument("--test4", help="test_create_rename_delete_dirs", action="store_true")
-    parser.add_argument("--test5", help="test_sync_files_write", action="store_true")
-    parser.add_argument("--test6", help="test_local_operations", action="store_true")
-    parser.add_argument("--test7", help="test_update_mtime", action="store_true")
-    parser.add_argument("--test8", help="test_create_rename_delete_unicode_files_dirs", action="store_true")
-    parser.add_argument("-a", "--all", help="run all tests", action="store_true")
-    parser.add_argument("-b", "--basic", help="run basic, stable tests", action="store_true")
-    parser.add_argument("-d", "--debug", help="use debug output", action="store_true")
-    parser.add_argument("-l", "--large", help="use large files for testing", action="store_true")
-    parser.add_argument("-n", "--nodelete", help="Do not delete work files", action="store_false")
+    add_common_args(parser, shards_help="shards share megasimplesync instances")
+    parser.add_argument("--restart", help="restart crashed megasimplesync instances", action="store_true")
     parser.add_argument("work_dir", help="local work directory")
     parser.add_argument("sync_dir", help="remote directory for synchronization")
     args = parser.parse_args()
-
+    storage = setup(parser, args)
     if args.debug:
-        lvl = logging.DEBUG
         # megasync will use verbose output
         os.environ["MEGA_DEBUG"] = "2"
-    else:
-        lvl = logging.INFO
-
-    if args.all:
-        args.test1 = args.test2 = args.test3 = args.test4 = args.test5 = args.test6 = args.test7 = args.test8 = True
-    if args.basic:
-        args.test1 = args.test2 = args.test3 = args.test4 = True
-
-    # logging stuff, output to stdout
-    logging.StreamHandler(sys.stdout)
-    logging.basicConfig(format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S', level=lvl)
-
-    with SyncTestMegaSyncApp(args.work_dir, args.sync_dir, args.nodelete, args.large) as app:
-        suite = unittest.TestSuite()
-
-        if args.test1:
-            suite.addTest(SyncTest("test_create_delete_files", app))
-
-        if args.test2:
-            suite.addTest(SyncTest("test_create_rename_delete_files", app))
-
-        if args.test3:
-            suite.addTest(SyncTest("test_create_delete_dirs", app, ))
-
-        if args.test4:
-            suite.addTest(SyncTest("test_create_rename_delete_dirs", app))
-
-        if args.test5:
-            suite.addTest(SyncTest("test_sync_files_write", app))
-
-        if args.test6:
-            suite.addTest(SyncTest("test_local_operations", app))
-
-        if args.test7:
-            suite.addTest(SyncTest("test_update_mtime", app))
-
-        if args.test8:
-            suite.addTest(SyncTest("test_create_rename_delete_unicode_files_dirs", app))
 
-        testRunner = xmlrunner.XMLTestRunner(output='test-reports')
-        testRunner.run(suite)
+    # megasimplesync can't create a remote folder for every shard, shards share application instances
+    create_app = functools.partial(SyncTestMegaSyncApp, args.work_dir, args.sync_dir, args.nodelete, args.large, args.restart, storage)
+    sys.exit(0 if run_tests(args, get_tests(args), create_app) else 1)
@@ -0,0 +1,57 @@
+"""
+ Report helpers for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import json
+import logging
+
+
+def flatten_summary(prefix, summary):
+    """
+    return summary (name => {key: value}) as flat dictionary "prefix.name.key" => value,
+    suitable for xmlrunner test suite properties
+    None values and nested lists / dictionaries (histograms) are left out
+    """
+    props = {}
+    for name, info in summary.iteritems():
+        for key, value in info.iteritems():
+            if value is None or isinstance(value, (list, tuple, dict)):
+                continue
+            props["%s.%s.%s" % (prefix, name, key)] = value
+    return props
+
+
+def write_json_report(fname, data, what):
+    """
+    save data to a JSON file, creating its directory
+    what: kind of the report, for the error message
+    return True on success
+    """
+    try:
+        os.makedirs(os.path.dirname(fname))
+    except OSError:
+        pass
+    try:
+        with open(fname, "w") as fout:
+            json.dump(data, fout, indent=2, sort_keys=True)
+    except IOError, e:
+        logging.error("Failed to write %s report: %s (%s)" % (what, fname, e))
+        return False
+    return True
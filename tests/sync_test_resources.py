@@ -0,0 +1,154 @@
+"""
+ Resource usage sampler for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import threading
+from sync_test_report import flatten_summary, write_json_report
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_proc(pid):
+    """
+    return resource usage of a process from /proc, None if process doesn't exist:
+    RSS (bytes), CPU time (user + system, s), read/write bytes, open fds, threads
+    """
+    proc_dir = os.path.join("/proc", str(pid))
+    res = {}
+    try:
+        with open(os.path.join(proc_dir, "stat")) as f:
+            # command name may contain spaces, fields follow the closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 of stat(5), the state (field 3) is fields[0]
+        res["cpu"] = (int(fields[11]) + int(fields[12])) / float(CLK_TCK)
+        res["threads"] = int(fields[17])
+        res["rss"] = int(fields[21]) * PAGE_SIZE
+    except (IOError, IndexError, ValueError):
+        return None
+
+    # not readable for processes of other users
+    try:
+        with open(os.path.join(proc_dir, "io")) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("read_bytes", "write_bytes"):
+                    res[key] = int(value)
+    except (IOError, ValueError):
+        pass
+    try:
+        res["fds"] = len(os.listdir(os.path.join(proc_dir, "fd")))
+    except OSError:
+        pass
+    return res
+
+
+class ResourceSampler(object):
+    """
+    samples resource usage of application processes at a fixed interval by a background thread
+    """
+    def __init__(self, get_pids, interval=1.0):
+        """
+        get_pids: function returning dictionary: instance name => pid,
+                  called for every sample, as instances may be restarted
+        """
+        self.get_pids = get_pids
+        self.interval = interval
+        # name => list of samples
+        self.series = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.start_time = None
+
+    def start(self):
+        self.series = {}
+        self.start_time = time.time()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="resource_sampler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        # final sample: state after the test
+        self.sample()
+
+    def run(self):
+        """
+        sampling thread function
+        """
+        while True:
+            self.sample()
+            if self.stop_event.wait(self.interval):
+                return
+
+    def sample(self):
+        t = time.time() - self.start_time
+        for name, pid in self.get_pids().items():
+            res = read_proc(pid)
+            if res is None:
+                continue
+            res["t"] = round(t, 3)
+            res["pid"] = pid
+            self.series.setdefault(name, []).append(res)
+
+    def summary(self):
+        """
+        return dictionary: instance name => peak RSS, CPU time, read/write bytes, peak fds and threads
+        """
+        res = {}
+        for name, l_samples in self.series.items():
+            if not l_samples:
+                continue
+            first, last = l_samples[0], l_samples[-1]
+            info = {"samples": len(l_samples),
+                    "max_rss": max(s["rss"] for s in l_samples),
+                    "max_threads": max(s["threads"] for s in l_samples)}
+            # counters restart with the process
+            if first["pid"] == last["pid"]:
+                info["cpu"] = last["cpu"] - first["cpu"]
+                for key in ("read_bytes", "write_bytes"):
+                    if key in first and key in last:
+                        info[key] = last[key] - first[key]
+            l_fds = [s["fds"] for s in l_samples if "fds" in s]
+            if l_fds:
+                info["max_fds"] = max(l_fds)
+            res[name] = info
+        return res
+
+    def properties(self, prefix):
+        """
+        return summary as flat dictionary, suitable for xmlrunner test suite properties
+        """
+        return flatten_summary(prefix, self.summary())
+
+    def write_json(self, fname, extra=None):
+        """
+        save time series and summary to a JSON file
+        """
+        data = {"interval": self.interval, "summary": self.summary(), "series": self.series}
+        if extra:
+            data.update(extra)
+        write_json_report(fname, data, "resource")
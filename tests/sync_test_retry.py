@@ -0,0 +1,123 @@
+"""
+ Retry policy for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import time
+import random
+from sync_test_report import flatten_summary
+
+
+class RetryCall(object):
+    """
+    a single retried operation:
+
+        retry = policy.begin("name", wait_func)
+        while retry.next():
+            if check():
+                return retry.done(True)
+        return retry.done(False)
+    """
+    def __init__(self, policy, name, wait, timeout):
+        self.policy = policy
+        self.name = name
+        self.wait = wait
+        self.start = time.time()
+        self.timeout = timeout
+        self.deadline = self.start + timeout
+        self.delay = policy.initial_delay
+        self.nr_attempts = 0
+
+    def next(self):
+        """
+        return True if another attempt can be made, waits before every attempt except the first one
+        """
+        if self.nr_attempts:
+            left = self.deadline - time.time()
+            if left <= 0:
+                return False
+            # "equal jitter": at least half of the delay
+            delay = min(self.delay * random.uniform(0.5, 1.0), left)
+            self.wait(delay)
+            self.delay = min(self.delay * self.policy.factor, self.policy.max_delay)
+        self.nr_attempts += 1
+        return True
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def done(self, success):
+        """
+        record the result, return success
+        """
+        self.policy.record(self.name, self.nr_attempts, self.elapsed(), success)
+        return success
+
+    def __str__(self):
+        return "[attempt %d, %.2f/%.0f s]" % (self.nr_attempts, self.elapsed(), self.timeout)
+
+
+class RetryPolicy(object):
+    """
+    retries with a wall-clock deadline and exponential backoff with jitter,
+    keeps number of attempts and time spent by every retried operation
+    """
+    def __init__(self, timeout=300.0, initial_delay=0.005, max_delay=2.0, factor=2.0):
+        """
+        timeout: seconds after which an operation fails
+        initial_delay: wait before the second attempt, doubled (factor) up to max_delay for the next ones
+        """
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.records = []
+
+    def begin(self, name, wait=time.sleep, timeout=None):
+        """
+        start a retried operation
+        wait: function(seconds) called between attempts, e.g. SyncTestApp.sync
+        """
+        return RetryCall(self, name, wait, self.timeout if timeout is None else timeout)
+
+    def record(self, name, nr_attempts, elapsed, success):
+        self.records.append((name, nr_attempts, elapsed, success))
+
+    def reset(self):
+        self.records = []
+
+    def summary(self):
+        """
+        return dictionary: operation name => calls, attempts, total and max time, failures
+        """
+        res = {}
+        for name, nr_attempts, elapsed, success in self.records:
+            info = res.setdefault(name, {"calls": 0, "attempts": 0, "time": 0.0, "max_time": 0.0, "failures": 0})
+            info["calls"] += 1
+            info["attempts"] += nr_attempts
+            info["time"] += elapsed
+            info["max_time"] = max(info["max_time"], elapsed)
+            if not success:
+                info["failures"] += 1
+        return res
+
+    def properties(self, prefix):
+        """
+        return summary as flat dictionary, suitable for xmlrunner test suite properties
+        """
+        return flatten_summary(prefix, self.summary())
@@ -0,0 +1,202 @@
+"""
+ Parallel runner for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import glob
+import time
+import logging
+import unittest
+import traceback
+import multiprocessing
+import xml.etree.ElementTree as ET
+import xmlrunner
+
+
+class QueueSuite(unittest.TestSuite):
+    """
+    test suite which takes (test class, method name, extra args) tuples
+    from a queue shared by all shards until it gets None
+    """
+    def __init__(self, queue, app):
+        super(QueueSuite, self).__init__()
+        self.queue = queue
+        self.app = app
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            test_class, method_name, test_args = item
+            yield test_class(method_name, self.app, *test_args)
+
+
+def run_shard(shard_idx, queue, results, report_dir, app_factory, shared_app):
+    """
+    shard process: run tests from the queue on its own pair of test folders
+    """
+    shard_dir = os.path.join(report_dir, "shard_%d" % shard_idx)
+    res = None
+    try:
+        if shared_app is not None:
+            app = shared_app
+            if not app.attach():
+                raise Exception("Failed to prepare test folders!")
+            try:
+                res = run_queue(app, queue, report_dir, shard_dir)
+            finally:
+                app.detach()
+        else:
+            with app_factory(shard_idx) as app:
+                res = run_queue(app, queue, report_dir, shard_dir)
+    except Exception:
+        logging.error("Shard %d failed: %s" % (shard_idx, traceback.format_exc()))
+    results.put((shard_idx, res))
+
+
+def run_queue(app, queue, report_dir, shard_dir):
+    """
+    return (number of tests run, number of failed tests)
+    """
+    logging.info("Shard folders: %s %s" % (app.local_folder_in, app.local_folder_out))
+    # JSON reports go to the common directory, XML reports are merged later
+    app.report_dir = report_dir
+    suite = QueueSuite(queue, app)
+    # filled by tests while running
+    suite.properties = app.report_properties
+    res = xmlrunner.XMLTestRunner(output=shard_dir).run(suite)
+    return res.testsRun, len(res.failures) + len(res.errors)
+
+
+def merge_reports(l_dirs, report_dir):
+    """
+    merge xmlrunner reports of all shards: one report per test class
+    return list of written files
+    """
+    suites = {}
+    for d in l_dirs:
+        for fname in sorted(glob.glob(os.path.join(d, "TEST-*.xml"))):
+            try:
+                root = ET.parse(fname).getroot()
+            except (IOError, ET.ParseError), e:
+                logging.error("Failed to parse report: %s (%s)" % (fname, e))
+                continue
+            l_suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+            for ts in l_suites:
+                # drop timestamp suffix added by xmlrunner
+                name = ts.get("name", "")
+                prefix, _, suffix = name.rpartition("-")
+                if prefix and suffix.isdigit():
+                    name = prefix
+                ts.set("name", name)
+
+                merged = suites.get(name)
+                if merged is None:
+                    suites[name] = ts
+                    continue
+
+                for attr in ("tests", "errors", "failures", "skipped"):
+                    merged.set(attr, str(int(merged.get(attr, 0)) + int(ts.get(attr, 0))))
+                merged.set("time", "%.3f" % (float(merged.get("time", 0)) + float(ts.get("time", 0))))
+
+                merged_props = merged.find("properties")
+                for child in ts:
+                    if child.tag != "properties":
+                        merged.append(child)
+                    elif merged_props is None:
+                        merged.insert(0, child)
+                        merged_props = child
+                    else:
+                        names = set(p.get("name") for p in merged_props)
+                        for prop in child:
+                            if prop.get("name") not in names:
+                                merged_props.append(prop)
+
+    l_written = []
+    for name, ts in sorted(suites.items()):
+        fname = os.path.join(report_dir, "TEST-%s.xml" % name)
+        ET.ElementTree(ts).write(fname, encoding="UTF-8")
+        l_written.append(fname)
+    return l_written
+
+
+class ShardedRunner(object):
+    """
+    spreads test cases across nr_shards processes,
+    every shard works with its own pair of test folders (rnd_folder)
+    """
+    def __init__(self, nr_shards, report_dir="test-reports", app_factory=None, shared_app=None):
+        """
+        app_factory: function(shard index) returning a new SyncTestApp, every shard runs its own application instances
+        shared_app: already started SyncTestApp, its instances are shared by all shards
+        """
+        if (app_factory is None) == (shared_app is None):
+            raise ValueError("Either app_factory or shared_app must be set")
+        self.nr_shards = nr_shards
+        self.report_dir = report_dir
+        self.app_factory = app_factory
+        self.shared_app = shared_app
+        self.l_tests = []
+
+    def add_test(self, test_class, method_name, *test_args):
+        self.l_tests.append((test_class, method_name, test_args))
+
+    def run(self):
+        """
+        run all tests, merge reports
+        return True if all tests have passed
+        """
+        start = time.time()
+        nr_shards = max(1, min(self.nr_shards, len(self.l_tests)))
+
+        queue = multiprocessing.Queue()
+        for item in self.l_tests:
+            queue.put(item)
+        for _ in range(0, nr_shards):
+            queue.put(None)
+        results = multiprocessing.Queue()
+
+        # not a multiprocessing.Pool: shards start their own hashing processes,
+        # which is not allowed for daemonic pool workers
+        l_procs = []
+        for shard_idx in range(0, nr_shards):
+            p = multiprocessing.Process(target=run_shard, name="shard_%d" % shard_idx,
+                                        args=(shard_idx, queue, results, self.report_dir, self.app_factory, self.shared_app))
+            p.start()
+            l_procs.append(p)
+
+        nr_run = nr_failed = 0
+        success = True
+        for _ in range(0, nr_shards):
+            shard_idx, res = results.get()
+            if res is None:
+                success = False
+                continue
+            nr_run += res[0]
+            nr_failed += res[1]
+        for p in l_procs:
+            p.join()
+
+        l_dirs = [os.path.join(self.report_dir, "shard_%d" % i) for i in range(0, nr_shards)]
+        for fname in merge_reports(l_dirs, self.report_dir):
+            logging.info("Merged report: %s" % fname)
+
+        logging.info("Ran %d tests in %d shards, %d failed, %.1f s" % (nr_run, nr_shards, nr_failed, time.time() - start))
+        return success and nr_run == len(self.l_tests) and nr_failed == 0
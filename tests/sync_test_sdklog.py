@@ -0,0 +1,264 @@
+"""
+ megasimplesync log parser for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from sync_test_latency import percentile
+from sync_test_report import write_json_report
+
+# SimpleLogger prefix, written when MEGA_DEBUG is set: "[12:34:56] [debug] megaclient.cpp:123 "
+RE_PREFIX = re.compile(r"^\[(\d\d:\d\d:\d\d)\] \[(\w+)\] (\S+:\d+) (.*)$")
+RE_POST = re.compile(r"^POST target URL: (\S+)")
+RE_SENDING = re.compile(r"^\[sending (\d+) bytes of raw data\]")
+RE_RECEIVED_RAW = re.compile(r"^\[received (\d+) bytes of raw data\]")
+RE_HTTP_DONE = re.compile(r"^CURLMSG_DONE with HTTP status: (\d+)")
+RE_TRANSFER_START = re.compile(r"^Sync - (requesting|sending) file (.*)$")
+RE_TRANSFER_COMPLETE = re.compile(r"^Transfer complete: (.*) (\d+)$")
+RE_TRANSFER_FAILED = re.compile(r"^Transfer failed with error (-?\d+)")
+RE_TRANSFER_DEFERRED = re.compile(r"^Deferring transfer (\d+)")
+RE_SYNC_LOCAL = re.compile(r"^Sync - local (file|folder) (addition|deletion|change) detected:? (.*)$")
+RE_SYNC_REMOTE = re.compile(r"^Sync - remote (file|folder) (addition|deletion) detected (.*)$")
+RE_STATE = re.compile(r"^Sync - state change of node (.*) to (\w+)")
+
+
+class SdkLogParser(object):
+    """
+    turns SDK log lines (MEGA_DEBUG=2) into structured events:
+    api (client-server request and its latency), transfer_start, transfer_finish, transfer_failed, transfer_retry,
+    chunk (raw bytes sent / received), sync_local, sync_remote, state, http_error
+    every event has "t": time when the line was read, which is on the harness timeline
+    """
+    def __init__(self, instance):
+        self.instance = instance
+        self.events = []
+        # at most one client-server command request is in flight
+        self.pending_api = None
+        # file name => (start time, direction)
+        self.pending_transfers = {}
+        # time written by SDK (UTC, seconds resolution) of the current line, if any
+        self.log_time = None
+
+    def add_event(self, t, event_type, **kwargs):
+        kwargs["t"] = t
+        kwargs["type"] = event_type
+        kwargs["instance"] = self.instance
+        if self.log_time is not None:
+            kwargs["log_time"] = self.log_time
+        self.events.append(kwargs)
+
+    def parse_line(self, line, t):
+        line = line.rstrip("\r\n")
+        self.log_time = None
+        m = RE_PREFIX.match(line)
+        if m:
+            self.log_time, _, _, line = m.groups()
+
+        m = RE_POST.match(line)
+        if m:
+            url = m.group(1)
+            if "/cs?" in url:
+                self.pending_api = t
+            return
+
+        m = RE_SENDING.match(line)
+        if m:
+            self.add_event(t, "chunk", direction="up", bytes=int(m.group(1)))
+            return
+
+        m = RE_RECEIVED_RAW.match(line)
+        if m:
+            self.add_event(t, "chunk", direction="down", bytes=int(m.group(1)))
+            return
+
+        m = RE_HTTP_DONE.match(line)
+        if m:
+            status = int(m.group(1))
+            if status != 200:
+                self.add_event(t, "http_error", status=status)
+            return
+
+        if line.startswith("Received: "):
+            body = line[len("Received: "):].strip()
+            # command responses are JSON arrays or a single error code, server-client responses are objects
+            if self.pending_api is not None and (body[:1] == "[" or body.lstrip("-").isdigit()):
+                # -3: EAGAIN, the request is retried
+                self.add_event(t, "api", latency=t - self.pending_api, retry=(body == "-3"))
+                self.pending_api = None
+            return
+
+        m = RE_TRANSFER_START.match(line)
+        if m:
+            direction = "down" if m.group(1) == "requesting" else "up"
+            path = m.group(2)
+            self.pending_transfers[os.path.basename(path)] = (t, direction)
+            self.add_event(t, "transfer_start", direction=direction, path=path)
+            return
+
+        m = RE_TRANSFER_COMPLETE.match(line)
+        if m:
+            name = m.group(1)
+            start = self.pending_transfers.pop(os.path.basename(name), None)
+            if start is not None:
+                self.add_event(t, "transfer_finish", name=name, direction=start[1], duration=t - start[0])
+            else:
+                self.add_event(t, "transfer_finish", name=name)
+            return
+
+        m = RE_TRANSFER_FAILED.match(line)
+        if m:
+            self.add_event(t, "transfer_failed", error=int(m.group(1)))
+            return
+
+        m = RE_TRANSFER_DEFERRED.match(line)
+        if m:
+            self.add_event(t, "transfer_retry", count=int(m.group(1)))
+            return
+
+        m = RE_SYNC_LOCAL.match(line)
+        if m:
+            self.add_event(t, "sync_local", kind=m.group(1), op=m.group(2), path=m.group(3))
+            return
+
+        m = RE_SYNC_REMOTE.match(line)
+        if m:
+            self.add_event(t, "sync_remote", kind=m.group(1), op=m.group(2), path=m.group(3))
+            return
+
+        m = RE_STATE.match(line)
+        if m:
+            self.add_event(t, "state", path=m.group(1), state=m.group(2))
+
+    def summary(self):
+        """
+        return dictionary of counters and timings:
+        where time goes - api round trips, transfers or detecting local changes
+        """
+        res = {"api_requests": 0, "api_retries": 0, "transfers_started": 0, "transfers_finished": 0,
+               "transfers_failed": 0, "transfer_retries": 0, "bytes_up": 0, "bytes_down": 0,
+               "http_errors": 0, "local_changes": 0, "remote_changes": 0}
+        l_api = []
+        l_transfers = []
+        for event in self.events:
+            event_type = event["type"]
+            if event_type == "api":
+                res["api_requests"] += 1
+                if event["retry"]:
+                    res["api_retries"] += 1
+                l_api.append(event["latency"])
+            elif event_type == "chunk":
+                res["bytes_" + event["direction"]] += event["bytes"]
+            elif event_type == "transfer_start":
+                res["transfers_started"] += 1
+            elif event_type == "transfer_finish":
+                res["transfers_finished"] += 1
+                if "duration" in event:
+                    l_transfers.append(event["duration"])
+            elif event_type == "transfer_failed":
+                res["transfers_failed"] += 1
+            elif event_type == "transfer_retry":
+                res["transfer_retries"] += 1
+            elif event_type == "http_error":
+                res["http_errors"] += 1
+            elif event_type == "sync_local":
+                res["local_changes"] += 1
+            elif event_type == "sync_remote":
+                res["remote_changes"] += 1
+
+        for name, l_values in (("api_latency", l_api), ("transfer_time", l_transfers)):
+            if not l_values:
+                continue
+            l_values.sort()
+            res[name + "_total"] = sum(l_values)
+            res[name + "_p50"] = percentile(l_values, 50)
+            res[name + "_max"] = l_values[-1]
+        return res
+
+
+class SdkLogTailer(object):
+    """
+    follows a growing log file with a thread and feeds new lines to SdkLogParser
+    """
+    def __init__(self, fname, instance, interval=0.1):
+        self.fname = fname
+        self.parser = SdkLogParser(instance)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.fin = None
+
+    def start(self):
+        """
+        start reading from the current end of file, older lines belong to previous tests
+        """
+        try:
+            self.fin = open(self.fname, "rb")
+        except IOError, e:
+            logging.error("Failed to open log: %s (%s)" % (self.fname, e))
+            return False
+        self.fin.seek(0, os.SEEK_END)
+        self.thread = threading.Thread(target=self.run, name="sdklog_%s" % self.parser.instance)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.read_lines()
+        self.fin.close()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.read_lines()
+
+    def read_lines(self):
+        t = time.time()
+        partial = ""
+        while True:
+            line = self.fin.readline()
+            if not line:
+                break
+            if not line.endswith("\n"):
+                # the rest of the line is not written yet
+                partial = line
+                break
+            self.parser.parse_line(line, t)
+        if partial:
+            self.fin.seek(-len(partial), os.SEEK_CUR)
+
+
+def sdklog_report(l_tailers, fname, extra=None):
+    """
+    save events and summaries of all instances to a JSON file
+    return dictionary: instance => summary
+    """
+    summaries = dict((tailer.parser.instance, tailer.parser.summary()) for tailer in l_tailers)
+    l_events = sorted((e for tailer in l_tailers for e in tailer.parser.events), key=lambda e: e["t"])
+    data = {"summary": summaries, "events": l_events}
+    if extra:
+        data.update(extra)
+    write_json_report(fname, data, "log")
+    return summaries
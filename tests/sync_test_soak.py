@@ -0,0 +1,179 @@
+"""
+ Soak mode for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import random
+import logging
+import unittest
+from sync_test_resources import ResourceSampler
+from sync_test_report import write_json_report
+
+
+def linear_trend(l_points):
+    """
+    least squares fit of (x, y) points
+    return (slope, intercept, r2), None if there are less than two distinct x values
+    """
+    n = len(l_points)
+    if n < 2:
+        return None
+    mean_x = sum(x for x, _ in l_points) / float(n)
+    mean_y = sum(y for _, y in l_points) / float(n)
+    sxx = sum((x - mean_x) ** 2 for x, _ in l_points)
+    if sxx == 0:
+        return None
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in l_points)
+    syy = sum((y - mean_y) ** 2 for _, y in l_points)
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    r2 = (sxy * sxy) / (sxx * syy) if syy else 0.0
+    return slope, intercept, r2
+
+
+class SoakRunner(object):
+    """
+    runs randomly chosen tests with randomized workload sizes in a loop,
+    tracks memory and fd usage of application processes and propagation latency
+    and reports metrics which keep growing over time
+    """
+    # metrics which are checked for upward trends
+    TREND_METRICS = ("rss", "fds")
+
+    def __init__(self, app, l_tests, hours, seed=None, interval=30.0, min_r2=0.5, max_growth=0.2, warmup=0.1):
+        """
+        l_tests: list of (test class, method name, extra args...) tuples to choose from
+        interval: seconds between resource samples
+        min_r2: trend is reported only if a straight line explains at least this part of variance
+        max_growth: reported growth of a metric over the whole run, relative to its starting value
+        warmup: part of the samples at the beginning which are not used for trends (caches being filled)
+        """
+        self.app = app
+        self.l_tests = l_tests
+        self.duration = hours * 3600.0
+        self.seed = seed if seed is not None else int(time.time())
+        self.rnd = random.Random(self.seed)
+        self.interval = interval
+        self.min_r2 = min_r2
+        self.max_growth = max_growth
+        self.warmup = warmup
+        # op => list of (t, p50 latency) per iteration
+        self.latency_series = {}
+        self.l_iterations = []
+        self.sampler = ResourceSampler(app.pids, interval)
+
+    def randomize(self, test):
+        """
+        vary amount of work done by a test
+        """
+        test.nr_files = self.rnd.randint(5, 50)
+        test.nr_dirs = self.rnd.randint(2, 20)
+        test.local_obj_nr = self.rnd.randint(2, 10)
+
+    def run_iteration(self, idx, start):
+        item = self.rnd.choice(self.l_tests)
+        method_name = item[1]
+        test = item[0](method_name, self.app, *item[2:])
+        self.randomize(test)
+        # tests use the global generator for names and sizes
+        random.seed(self.rnd.random())
+
+        t = time.time()
+        result = unittest.TestResult()
+        test.run(result)
+        success = result.wasSuccessful()
+        for _, tb in result.errors + result.failures:
+            logging.error("Soak iteration %d, %s failed:\n%s" % (idx, method_name, tb))
+
+        elapsed = time.time() - start
+        for op, info in self.app.latency.summary().items():
+            if info["count"]:
+                self.latency_series.setdefault(op, []).append((elapsed, info["p50"]))
+        self.l_iterations.append({"t": round(t - start, 3), "test": method_name, "files": test.nr_files,
+                                  "dirs": test.nr_dirs, "time": round(time.time() - t, 3), "success": success})
+        return success
+
+    def trends(self):
+        """
+        return list of metrics which have grown more than max_growth during the run
+        """
+        l_series = []
+        for name, l_samples in self.sampler.series.items():
+            for metric in self.TREND_METRICS:
+                l_points = [(s["t"], s[metric]) for s in l_samples if metric in s]
+                l_series.append(("%s.%s" % (name, metric), l_points))
+        for op, l_points in self.latency_series.items():
+            l_series.append(("latency.%s.p50" % op, l_points))
+
+        l_trends = []
+        for name, l_points in sorted(l_series):
+            l_points = l_points[int(len(l_points) * self.warmup):]
+            if len(l_points) < 10:
+                continue
+            fit = linear_trend(l_points)
+            if fit is None:
+                continue
+            slope, intercept, r2 = fit
+            t_begin, t_end = l_points[0][0], l_points[-1][0]
+            base = slope * t_begin + intercept
+            growth = slope * (t_end - t_begin)
+            if slope <= 0 or r2 < self.min_r2 or base <= 0 or growth / base < self.max_growth:
+                continue
+            l_trends.append({"metric": name, "slope_per_hour": slope * 3600.0, "r2": r2,
+                             "start": base, "growth": growth / base})
+        return l_trends
+
+    def run(self):
+        """
+        run until time is over or the application dies
+        return True if all iterations have passed and no growing metrics were found
+        """
+        logging.info("Soak run for %.2f hours, seed: %d" % (self.duration / 3600.0, self.seed))
+        start = time.time()
+        self.sampler.start()
+        nr_failed = 0
+        idx = 0
+        try:
+            while time.time() - start < self.duration:
+                if not self.run_iteration(idx, start):
+                    nr_failed += 1
+                idx += 1
+                if not self.app.is_alive():
+                    logging.error("Test application is not running, soak run stopped after %d iterations" % idx)
+                    nr_failed += 1
+                    break
+                if idx % 10 == 0:
+                    logging.info("Soak: %d iterations, %d failed, %.0f s" % (idx, nr_failed, time.time() - start))
+        finally:
+            self.sampler.stop()
+
+        l_trends = self.trends()
+        for trend in l_trends:
+            logging.error("Soak: %s is growing: %+.1f%% during the run, %.3g per hour (r2=%.2f)" %
+                          (trend["metric"], trend["growth"] * 100, trend["slope_per_hour"], trend["r2"]))
+        logging.info("Soak finished: %d iterations, %d failed, %d growing metrics, %.0f s" %
+                     (idx, nr_failed, len(l_trends), time.time() - start))
+        self.write_report(os.path.join(self.app.report_dir, "soak.json"), l_trends)
+        return nr_failed == 0 and not l_trends
+
+    def write_report(self, fname, l_trends):
+        data = {"seed": self.seed, "iterations": self.l_iterations, "trends": l_trends,
+                "resources": self.sampler.series, "latency": self.latency_series}
+        write_json_report(fname, data, "soak")
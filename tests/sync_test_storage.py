@@ -0,0 +1,176 @@
+"""
+ Storage profiles for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import shutil
+import logging
+import subprocess
+from sync_test_base import get_random_str
+
+PROFILES = ("default", "tmpfs", "loop")
+
+
+def fs_type(path):
+    """
+    return (mount point, filesystem type) of the filesystem a path is on, from /proc/mounts
+    """
+    path = os.path.realpath(path)
+    best = ("/", None)
+    try:
+        with open("/proc/mounts") as fin:
+            for line in fin:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # spaces in mount points are escaped as \040
+                mnt = fields[1].replace("\\040", " ")
+                if (path == mnt or path.startswith(mnt.rstrip("/") + "/")) and len(mnt) >= len(best[0]):
+                    best = (mnt, fields[2])
+    except IOError:
+        pass
+    return best
+
+
+class StorageProfile(object):
+    """
+    backing storage of "in", "out" and work folders, so results can be compared
+    regardless of the disk work_dir happens to be on:
+        default - work_dir as it is
+        tmpfs   - a directory in /dev/shm, no disk I/O at all
+        loop    - a size-capped ext4 image mounted through a loop device (needs root),
+                  a plain directory in work_dir if it can't be mounted
+    """
+    def __init__(self, name, work_dir, size=1024 * 2**20, keep=False):
+        """
+        size: size of the loop image
+        keep: leave the data of tmpfs and loop profiles after the run
+        """
+        if name not in PROFILES:
+            raise ValueError("Unknown storage profile: %s" % name)
+        self.requested = name
+        self.name = name
+        self.work_dir = work_dir
+        self.size = size
+        self.keep = keep
+        self.path = None
+        self.image = None
+        self.mounted = False
+        # mount and cleanup are done by the process which has set the profile up
+        self.owner_pid = os.getpid()
+
+    def setup(self):
+        """
+        prepare the storage
+        return directory to be used as work_dir
+        """
+        if self.requested == "tmpfs":
+            if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+                self.path = os.path.join("/dev/shm", "sync_test_%s" % get_random_str())
+            else:
+                logging.error("/dev/shm is not available, using %s" % self.work_dir)
+                self.name = "default"
+        elif self.requested == "loop":
+            self.path = os.path.join(self.work_dir, "storage_mnt")
+            if not self.loop_mount():
+                logging.error("Failed to mount a loop image, using a plain directory %s" % self.path)
+                self.name = "default"
+
+        if self.path is None:
+            self.path = self.work_dir
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            pass
+        logging.debug("Storage profile: %s" % self.describe())
+        return self.path
+
+    def loop_mount(self):
+        """
+        create ext4 image of self.size bytes and mount it to self.path
+        """
+        if os.geteuid() != 0:
+            logging.info("Loop devices need root privileges")
+            return False
+        self.image = os.path.join(self.work_dir, "storage.img")
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            pass
+        try:
+            with open(self.image, "wb") as fout:
+                fout.truncate(self.size)
+            subprocess.check_call(["mkfs.ext4", "-q", "-F", self.image])
+            subprocess.check_call(["mount", "-o", "loop", self.image, self.path])
+        except (IOError, OSError, subprocess.CalledProcessError), e:
+            logging.error("Failed to prepare loop image: %s (%s)" % (self.image, e))
+            try:
+                os.remove(self.image)
+            except OSError:
+                pass
+            self.image = None
+            return False
+        self.mounted = True
+        return True
+
+    def teardown(self):
+        """
+        unmount and remove the storage
+        """
+        if os.getpid() != self.owner_pid or self.path is None:
+            return
+        if self.mounted:
+            try:
+                subprocess.check_call(["umount", self.path])
+                self.mounted = False
+            except (OSError, subprocess.CalledProcessError), e:
+                logging.error("Failed to unmount: %s (%s)" % (self.path, e))
+                return
+            if not self.keep:
+                try:
+                    os.remove(self.image)
+                    os.rmdir(self.path)
+                except OSError:
+                    pass
+        elif self.name == "tmpfs" and not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+    def properties(self):
+        """
+        return dictionary describing the storage, to tag results with
+        """
+        mnt, fs = fs_type(self.path or self.work_dir)
+        props = {"storage.profile": self.name, "storage.fs": fs, "storage.mount": mnt}
+        if self.requested != self.name:
+            props["storage.requested"] = self.requested
+        try:
+            st = os.statvfs(self.path or self.work_dir)
+            props["storage.capacity"] = st.f_blocks * st.f_frsize
+        except OSError:
+            pass
+        return props
+
+    def describe(self):
+        props = self.properties()
+        res = "%s (%s at %s, %.1f MB)" % (props["storage.profile"], props["storage.fs"], props["storage.mount"],
+                                          props.get("storage.capacity", 0) / float(2**20))
+        if "storage.requested" in props:
+            res += ", %s requested" % props["storage.requested"]
+        return res
@@ -0,0 +1,212 @@
+"""
+ Streaming verification for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+from sync_test_watch import create_watcher
+from sync_test_convergence import ConvergenceCheck
+from sync_test_convergence import to_fs_path
+
+
+class StreamingCheck(ConvergenceCheck):
+    """
+    checks files the moment they appear in the watched folder:
+    a thread handles filesystem events and files are hashed by a pool of threads,
+    so verification overlaps with file creation and ongoing synchronization.
+    files announced with prefetch_file() while they are being created are verified in advance,
+    expectations are met from these results and wait() only has to collect what is left,
+    using snapshot checks as a fallback for missed events (or platforms without inotify)
+    """
+    def __init__(self, root, digest_files, latency=None, nr_threads=4):
+        """
+        root: directory to check ("out" folder)
+        digest_files: function returning a list of digests for a list of file paths, must be thread safe
+        latency: LatencyTracker to report observed objects to
+        """
+        super(StreamingCheck, self).__init__(root, digest_files, latency)
+        self.lock = threading.RLock()
+        # rel_path => (size, digest) of files which are going to be expected
+        self.prefetched = {}
+        # rel_path => (size, digest, (inode, size, mtime)) of already verified files
+        self.verified = {}
+        self.nr_streamed = 0
+
+        self.watcher = create_watcher([self.root])
+        self.watcher.listener = self.on_event
+        self.pool = ThreadPool(nr_threads)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="stream_check")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """
+        stop event thread and hashing threads
+        """
+        self.running = False
+        self.thread.join()
+        self.watcher.close()
+        self.pool.close()
+        self.pool.join()
+
+    def run(self):
+        """
+        event thread function
+        """
+        while self.running:
+            try:
+                self.watcher.poll(0.1)
+            except OSError, e:
+                logging.error("Failed to read filesystem events: %s" % e)
+                return
+            except Exception:
+                # an event handler has failed, keep verifying the following events
+                logging.exception("Failed to handle filesystem events")
+
+    @staticmethod
+    def stat_key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime, st.st_ctime
+
+    def prefetch_file(self, rel_path, size, digest):
+        """
+        file has been created in "in" folder, verify it as soon as it appears
+        without waiting for it
+        """
+        rel_path = to_fs_path(rel_path)
+        with self.lock:
+            self.prefetched[rel_path] = (size, digest)
+        if os.path.exists(os.path.join(self.root, rel_path)):
+            self.schedule(rel_path)
+
+    def expected_file(self, rel_path):
+        """
+        return (size, digest) a file is checked against, None if it's not expected
+        """
+        expected = self.pending.get(rel_path)
+        if expected is not None:
+            if expected[0] != self.PRESENT_FILE:
+                return None
+            return expected[1:]
+        return self.prefetched.get(rel_path)
+
+    def expect_file(self, rel_path, size=None, digest=None):
+        """
+        file must exist, it is checked immediately if it is already there
+        """
+        rel_path = to_fs_path(rel_path)
+        path = os.path.join(self.root, rel_path)
+        with self.lock:
+            known = self.verified.get(rel_path)
+            if known is not None and known[:2] == (size, digest) and known[2] == self.stat_key(path):
+                return
+            super(StreamingCheck, self).expect_file(rel_path, size, digest)
+        if os.path.exists(path):
+            self.schedule(rel_path)
+
+    def expect_dir(self, rel_path):
+        with self.lock:
+            self.verified.pop(to_fs_path(rel_path), None)
+            super(StreamingCheck, self).expect_dir(rel_path)
+
+    def expect_absent(self, rel_path):
+        with self.lock:
+            self.verified.pop(to_fs_path(rel_path), None)
+            super(StreamingCheck, self).expect_absent(rel_path)
+
+    def on_event(self, path, exists, t):
+        """
+        an object has appeared in / disappeared from the watched folder
+        """
+        prefix = self.root + os.sep
+        path = to_fs_path(path)
+        if not path.startswith(prefix):
+            return
+        rel_path = path[len(prefix):]
+        if self.latency is not None:
+            self.latency.observed(rel_path, exists, t)
+
+        with self.lock:
+            expected = self.pending.get(rel_path)
+            if expected is None:
+                if exists and rel_path in self.prefetched:
+                    self.schedule(rel_path)
+                return
+            kind = expected[0]
+            if kind == self.ABSENT:
+                if not exists and not os.path.lexists(path):
+                    del self.pending[rel_path]
+            elif kind == self.PRESENT_DIR:
+                if exists and os.path.isdir(path):
+                    del self.pending[rel_path]
+            elif exists:
+                self.schedule(rel_path)
+
+    def schedule(self, rel_path):
+        self.pool.apply_async(self.verify, (rel_path,))
+
+    def verify(self, rel_path):
+        """
+        hashing thread: check a file against its expectation
+        a file which does not match yet is left pending, it may still be written to
+        """
+        with self.lock:
+            expected = self.expected_file(rel_path)
+        if expected is None:
+            return
+        size, digest = expected
+        path = os.path.join(self.root, rel_path)
+
+        key = self.stat_key(path)
+        if key is None or (size is not None and key[1] != size):
+            return
+        if digest is not None:
+            l_digests = self.digest_files([path])
+            if l_digests[0] != digest or self.stat_key(path) != key:
+                return
+
+        with self.lock:
+            # the expectation may have changed meanwhile
+            if self.expected_file(rel_path) != expected:
+                return
+            self.pending.pop(rel_path, None)
+            self.prefetched.pop(rel_path, None)
+            self.verified[rel_path] = (size, digest, key)
+            self.nr_streamed += 1
+
+    def check(self):
+        with self.lock:
+            return super(StreamingCheck, self).check()
+
+    def wait(self, retry):
+        """
+        most of expectations are met by the time wait() is called,
+        the rest is checked with snapshots
+        """
+        res = super(StreamingCheck, self).wait(retry)
+        logging.debug("%d files have been verified while streaming" % self.nr_streamed)
+        with self.lock:
+            self.mismatches = []
+        return res
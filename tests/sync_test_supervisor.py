@@ -0,0 +1,251 @@
+"""
+ Process supervisor for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import errno
+import signal
+import logging
+import datetime
+import threading
+
+
+def pid_alive(pid):
+    """
+    return True if process exists, works for processes which are not our children
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def find_pids(app_name):
+    """
+    return pids of processes whose executable name is app_name, using /proc
+    """
+    l_pids = []
+    try:
+        l_entries = os.listdir("/proc")
+    except OSError:
+        return l_pids
+    for entry in l_entries:
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(os.path.join("/proc", entry, "cmdline"), "rb") as f:
+                argv0 = f.read().split("\0", 1)[0]
+        except IOError:
+            # process has exited
+            continue
+        if os.path.basename(argv0) == app_name:
+            l_pids.append(int(entry))
+    return sorted(l_pids)
+
+
+class SupervisedProcess(object):
+    """
+    a process under supervision and its fate
+    """
+    def __init__(self, name, pid, popen=None, restart=None):
+        self.name = name
+        self.pid = pid
+        self.popen = popen
+        # function returning a new Popen object
+        self.restart = restart
+        self.started = time.time()
+        self.exit_code = None
+        self.died_at = None
+        self.nr_restarts = 0
+        # stopped with SIGSTOP
+        self.paused = False
+
+    def alive(self):
+        return self.died_at is None
+
+
+class ProcessSupervisor(object):
+    """
+    tracks liveness of application instances without spawning processes:
+    our children are waited for by a thread each, so crashes are detected as they happen
+    with exit code and time of death, other processes are checked with kill(pid, 0)
+    """
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self.procs = {}
+        self.l_deaths = []
+        self.lock = threading.Lock()
+        self.stopping = False
+        # children can only be waited for by the process which has started them
+        self.owner_pid = os.getpid()
+        self.poll_thread = None
+
+    def add_child(self, name, popen, restart=None):
+        """
+        supervise a child process started with subprocess.Popen
+        restart: function returning a new Popen object, called when the child dies unexpectedly
+        """
+        proc = SupervisedProcess(name, popen.pid, popen, restart)
+        self.procs[name] = proc
+        t = threading.Thread(target=self.wait_child, args=(proc,), name="supervisor_%s" % name)
+        t.daemon = True
+        t.start()
+        return proc
+
+    def add_pid(self, name, pid):
+        """
+        supervise a process which is not our child
+        """
+        proc = SupervisedProcess(name, pid)
+        self.procs[name] = proc
+        if self.poll_thread is None:
+            self.poll_thread = threading.Thread(target=self.poll_pids, name="supervisor_poll")
+            self.poll_thread.daemon = True
+            self.poll_thread.start()
+        return proc
+
+    def on_death(self, proc, exit_code):
+        with self.lock:
+            proc.exit_code = exit_code
+            proc.died_at = time.time()
+            self.l_deaths.append((proc.name, proc.pid, exit_code, proc.died_at))
+        if self.stopping:
+            logging.debug("Process %s (%d) exited with code %s" % (proc.name, proc.pid, exit_code))
+        else:
+            logging.error("Process %s (%d) died at %s with exit code %s after %.1f s" %
+                          (proc.name, proc.pid, datetime.datetime.fromtimestamp(proc.died_at).strftime("%H:%M:%S"),
+                           exit_code, proc.died_at - proc.started))
+
+    def wait_child(self, proc):
+        """
+        thread function: wait for a child, restart it if requested
+        """
+        while True:
+            exit_code = proc.popen.wait()
+            self.on_death(proc, exit_code)
+            if self.stopping or proc.restart is None:
+                return
+            popen = proc.restart()
+            if popen is None:
+                logging.error("Failed to restart process %s" % proc.name)
+                return
+            with self.lock:
+                proc.popen = popen
+                proc.pid = popen.pid
+                proc.started = time.time()
+                proc.exit_code = proc.died_at = None
+                proc.paused = False
+                proc.nr_restarts += 1
+            logging.info("Process %s restarted, pid: %d" % (proc.name, proc.pid))
+
+    def poll_pids(self):
+        """
+        thread function: detect death of processes which are not our children
+        """
+        while not self.stopping:
+            for proc in self.procs.values():
+                if proc.popen is None and proc.alive() and not pid_alive(proc.pid):
+                    # exit code of a foreign process is not available
+                    self.on_death(proc, None)
+            time.sleep(self.poll_interval)
+
+    def is_alive(self, name=None):
+        """
+        return True if the process (all processes if name is None) is running
+        """
+        l_procs = self.procs.values() if name is None else [self.procs[name]]
+        if not l_procs:
+            return False
+        for proc in l_procs:
+            if os.getpid() != self.owner_pid or proc.popen is None:
+                # a forked process has no supervising threads
+                if not pid_alive(proc.pid):
+                    return False
+            elif not proc.alive():
+                return False
+        return True
+
+    def deaths(self):
+        """
+        return list of (name, pid, exit code, time of death) tuples
+        """
+        with self.lock:
+            return list(self.l_deaths)
+
+    def send_signal(self, name, sig):
+        """
+        send a signal to a process (all processes if name is None)
+        return False if any of them doesn't exist
+        """
+        res = True
+        l_procs = self.procs.values() if name is None else [self.procs[name]]
+        for proc in l_procs:
+            try:
+                os.kill(proc.pid, sig)
+            except OSError, e:
+                logging.error("Failed to send signal %d to process %s (%d): %s" % (sig, proc.name, proc.pid, e))
+                res = False
+                continue
+            if sig in (signal.SIGSTOP, signal.SIGCONT):
+                proc.paused = (sig == signal.SIGSTOP)
+        return res
+
+    def pause(self, name=None):
+        """
+        stop a process (all processes if name is None) with SIGSTOP, the kernel keeps its state,
+        connections and queued filesystem events
+        """
+        return self.send_signal(name, signal.SIGSTOP)
+
+    def unpause(self, name=None):
+        """
+        resume processes stopped by pause()
+        """
+        return self.send_signal(name, signal.SIGCONT)
+
+    def terminate(self, name, timeout=5.0):
+        """
+        stop a child process: SIGTERM, then SIGKILL if it's still running after timeout seconds
+        """
+        self.stopping = True
+        proc = self.procs[name]
+        if proc.popen is None or not proc.alive():
+            return
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.kill(proc.pid, sig)
+                if proc.paused:
+                    # a stopped process would not handle SIGTERM
+                    os.kill(proc.pid, signal.SIGCONT)
+            except OSError:
+                return
+            deadline = time.time() + timeout
+            while proc.alive() and time.time() < deadline:
+                time.sleep(0.05)
+            if not proc.alive():
+                return
+        logging.error("Failed to stop process %s (%d)" % (proc.name, proc.pid))
+
+    def close(self):
+        """
+        stop supervising (and restarting)
+        """
+        self.stopping = True
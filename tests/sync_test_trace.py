@@ -0,0 +1,226 @@
+"""
+ Workload traces for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import gzip
+import json
+import errno
+import shutil
+import logging
+import threading
+from sync_test_base import SyncTestBase
+from sync_test_base import get_random_blocks
+from sync_test_huge import huge_file_create
+
+TRACE_VERSION = 1
+
+
+def open_trace(fname, mode):
+    """
+    traces are gzipped if file name ends with .gz
+    """
+    if fname.endswith(".gz"):
+        return gzip.open(fname, mode)
+    return open(fname, mode)
+
+
+class TraceRecorder(object):
+    """
+    writes filesystem operations done by tests to a trace file, one JSON array per line:
+        [milliseconds since start, operation, paths..., arguments...]
+    paths are relative to test folders and prefixed with the folder: "in/", "out/" (rnd folders)
+    or "mount_in/", "mount_out/"; file contents are recorded as seeds of get_random_blocks()
+
+    operations:
+        test name              - a test has started
+        mkdir path
+        create path size seed
+        create_huge path size seed - sparse file, see huge_file_create()
+        append path data       - data is written as is
+        touch path
+        move src dst
+        remove path
+        rmtree path
+        wait name              - test waited for synchronization
+    """
+    def __init__(self, fname, seed=None):
+        self.fname = fname
+        self.fout = open_trace(fname, "wb")
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.nr_ops = 0
+        self.write({"version": TRACE_VERSION, "seed": seed, "start": self.start})
+
+    def write(self, obj):
+        self.fout.write(json.dumps(obj, separators=(",", ":")) + "\n")
+
+    def record(self, op, l_paths, l_args=()):
+        """
+        l_paths: already prefixed relative paths
+        """
+        with self.lock:
+            if self.fout is None:
+                return
+            self.write([int((time.time() - self.start) * 1000), op] + list(l_paths) + list(l_args))
+            self.nr_ops += 1
+
+    def close(self):
+        with self.lock:
+            if self.fout is None:
+                return
+            self.fout.close()
+            self.fout = None
+        logging.info("Trace: %d operations recorded to %s" % (self.nr_ops, self.fname))
+
+
+class TraceReplayer(object):
+    """
+    re-issues operations of a trace file
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        with open_trace(fname, "rb") as fin:
+            self.header = json.loads(fin.readline())
+            if self.header.get("version") != TRACE_VERSION:
+                raise ValueError("Unsupported trace version: %s" % self.header.get("version"))
+            self.l_ops = [json.loads(line) for line in fin if line.strip()]
+
+    def tests(self):
+        return [op[2] for op in self.l_ops if op[1] == "test"]
+
+    def select(self, test_name=None):
+        """
+        return operations of a single test (all operations if test_name is None)
+        """
+        if test_name is None:
+            return self.l_ops
+        l_ops = []
+        current = None
+        for op in self.l_ops:
+            if op[1] == "test":
+                current = op[2]
+            elif current == test_name:
+                l_ops.append(op)
+        return l_ops
+
+    @staticmethod
+    def real_path(roots, path):
+        prefix, _, rel_path = path.partition("/")
+        return os.path.join(roots[prefix], rel_path.encode("utf-8"))
+
+    def replay(self, roots, speed=1.0, on_wait=None, test_name=None):
+        """
+        roots: dictionary: path prefix ("in", "out", "mount_in", "mount_out") => directory
+        speed: 1 - original timing, N - N times faster, 0 - as fast as possible
+        on_wait: function called for "wait" operations, e.g. SyncTestApp.sync,
+                 keeps the order of operations and synchronization when timing is not kept
+        return number of failed operations
+        """
+        l_ops = self.select(test_name)
+        if not l_ops:
+            return 0
+        nr_failed = 0
+        first = l_ops[0][0]
+        start = time.time()
+        for op in l_ops:
+            if speed:
+                delay = (op[0] - first) / 1000.0 / speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if op[1] == "wait":
+                if on_wait is not None and not speed:
+                    on_wait()
+                continue
+            try:
+                self.apply(roots, op[1], op[2:])
+            except (OSError, IOError), e:
+                # the application may have already done it (e.g. leftovers removal)
+                if e.errno != errno.ENOENT:
+                    logging.error("Failed to replay %s: %s" % (op, e))
+                    nr_failed += 1
+        logging.info("Trace: replayed %d operations in %.2f s, %d failed" % (len(l_ops), time.time() - start, nr_failed))
+        return nr_failed
+
+    def apply(self, roots, op, args):
+        if op == "test":
+            return
+        path = self.real_path(roots, args[0])
+        if op == "mkdir":
+            os.makedirs(path)
+        elif op == "create":
+            with open(path, "wb") as fout:
+                for data in get_random_blocks(args[1], args[2]):
+                    fout.write(data)
+        elif op == "create_huge":
+            huge_file_create(path, args[1], args[2])
+        elif op == "append":
+            with open(path, "ab") as fout:
+                fout.write(args[1].encode("utf-8"))
+        elif op == "touch":
+            with open(path, "a"):
+                os.utime(path, None)
+        elif op == "move":
+            shutil.move(path, self.real_path(roots, args[1]))
+        elif op == "remove":
+            os.remove(path)
+        elif op == "rmtree":
+            shutil.rmtree(path)
+        else:
+            logging.error("Unknown trace operation: %s" % op)
+
+
+class SyncTraceReplay(SyncTestBase):
+    """
+    replays a recorded trace against an application
+    and measures time until "out" folder matches "in" folder
+    """
+    def __init__(self, methodName, app, trace_fname, speed=1.0, test_name=None):
+        super(SyncTraceReplay, self).__init__(methodName, app)
+        self.trace_fname = trace_fname
+        self.speed = speed
+        self.test_name = test_name
+
+    def test_replay(self):
+        """
+        replay, wait for synchronization and compare folders
+        """
+        logging.info("Launching test_replay test: %s" % self.trace_fname)
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+        self.assertTrue(self.dirs_check_empty(), "Checking if remote folders are empty")
+
+        replayer = TraceReplayer(self.trace_fname)
+        roots = {"in": self.app.local_folder_in, "out": self.app.local_folder_out,
+                 "mount_in": self.app.local_mount_in, "mount_out": self.app.local_mount_out}
+        start = time.time()
+        nr_failed = replayer.replay(roots, self.speed, self.app.sync, self.test_name)
+        issued = time.time() - start
+        self.assertEqual(nr_failed, 0, "Replaying trace")
+        self.assertTrue(self.app.is_alive(), "Test application is not running")
+
+        self.app.sync()
+        self.assertTrue(self.local_tree_check(self.manifest_create(self.app.local_folder_in)), "Comparing folders")
+        converged = time.time() - start
+        logging.info("Trace replayed in %.2f s, folders converged in %.2f s" % (issued, converged))
+        name = os.path.basename(self.trace_fname)
+        self.app.report_properties["replay.%s.issue_time" % name] = issued
+        self.app.report_properties["replay.%s.converge_time" % name] = converged
+
+        self.assertTrue(self.dirs_check_empty(), "Cleaning up folders")
@@ -0,0 +1,269 @@
+"""
+ Directory tree model for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import math
+import time
+import random
+import logging
+from array import array
+from multiprocessing.pool import ThreadPool
+from sync_test_manifest import Manifest
+from sync_test_manifest import ManifestEntry
+
+
+class LocalTree(object):
+    """
+    memory compact model of a directory tree:
+    every object is an index into parallel arrays, each name is stored once
+    and paths are built on demand from parent links,
+    so renaming or moving a directory is O(1) for the whole subtree
+    """
+    ROOT = 0
+    NONE = -1
+
+    def __init__(self):
+        self.names = [""]
+        self.digests = [None]
+        self.parents = array('l', [self.NONE])
+        self.first_child = array('l', [self.NONE])
+        self.next_sibling = array('l', [self.NONE])
+        self.is_dir = array('b', [1])
+        self.sizes = array('l', [0])
+        # all directories except root, for constant time random selection
+        self.dirs = array('l')
+        self.nr_files = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, parent, name, is_dir, size=0, digest=None):
+        """
+        add a new object to parent directory, return its index
+        """
+        idx = len(self.names)
+        self.names.append(name)
+        self.digests.append(digest)
+        self.parents.append(parent)
+        self.first_child.append(self.NONE)
+        self.next_sibling.append(self.first_child[parent])
+        self.first_child[parent] = idx
+        self.is_dir.append(1 if is_dir else 0)
+        self.sizes.append(size)
+        if is_dir:
+            self.dirs.append(idx)
+        else:
+            self.nr_files += 1
+        return idx
+
+    def add_dir(self, parent, name):
+        return self.add(parent, name, True)
+
+    def add_file(self, parent, name, size, digest=None):
+        return self.add(parent, name, False, size, digest)
+
+    def children(self, idx):
+        """
+        iterate over indexes of direct children
+        """
+        child = self.first_child[idx]
+        while child != self.NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def first(self, idx, is_dir):
+        """
+        return the first child directory (or file), NONE if there is no such child
+        """
+        for child in self.children(idx):
+            if self.is_dir[child] == is_dir:
+                return child
+        return self.NONE
+
+    def path(self, idx):
+        """
+        return path of an object relative to the tree root
+        """
+        l_names = []
+        while idx != self.ROOT:
+            l_names.append(self.names[idx])
+            idx = self.parents[idx]
+        l_names.reverse()
+        return os.path.join("", *l_names)
+
+    def walk(self, idx=ROOT):
+        """
+        iterative pre-order walk over a subtree, excluding its top
+        yields (index, relative path) tuples
+        """
+        stack = [(idx, self.path(idx))]
+        while stack:
+            parent, parent_path = stack.pop()
+            for child in self.children(parent):
+                child_path = os.path.join(parent_path, self.names[child])
+                yield child, child_path
+                if self.is_dir[child]:
+                    stack.append((child, child_path))
+
+    def random_dir(self, rnd=random):
+        """
+        return index of a random directory (except root) in constant time
+        """
+        return rnd.choice(self.dirs)
+
+    def rename(self, idx, name):
+        self.names[idx] = name
+
+    def move(self, idx, new_parent):
+        """
+        move an object with its subtree to another directory
+        """
+        parent = self.parents[idx]
+        if self.first_child[parent] == idx:
+            self.first_child[parent] = self.next_sibling[idx]
+        else:
+            for child in self.children(parent):
+                if self.next_sibling[child] == idx:
+                    self.next_sibling[child] = self.next_sibling[idx]
+                    break
+        self.parents[idx] = new_parent
+        self.next_sibling[idx] = self.first_child[new_parent]
+        self.first_child[new_parent] = idx
+
+
+def size_fixed(size):
+    """
+    all files have the same size
+    """
+    return lambda rnd: size
+
+
+def size_uniform(min_size, max_size):
+    """
+    file sizes are uniformly distributed
+    """
+    return lambda rnd: rnd.randint(min_size, max_size)
+
+
+def size_lognormal(median, sigma, max_size):
+    """
+    file sizes follow log-normal distribution (lots of small files, a few large ones)
+    """
+    return lambda rnd: min(int(rnd.lognormvariate(math.log(median), sigma)), max_size)
+
+
+class TreeGenerator(object):
+    """
+    builds a tree of a given shape on disk using a pool of threads
+    """
+    def __init__(self, file_create, depth, fanout, files_nr, size_func=size_fixed(0), nr_threads=16, algo="md5", trace=None):
+        """
+        file_create: function(fname, fsize, seed, algo) creating a file and returning its digest
+        depth: number of directory levels below root
+        fanout: number of subdirectories in every directory above the last level
+        files_nr: number of files in every directory (root excluded)
+        size_func: function(random.Random) returning size of a new file
+        trace: function(op, paths) recording created directories
+        """
+        self.file_create = file_create
+        self.depth = depth
+        self.fanout = fanout
+        self.files_nr = files_nr
+        self.size_func = size_func
+        self.nr_threads = nr_threads
+        self.algo = algo
+        self.trace = trace
+        self.rnd = random.Random(random.random())
+
+    def build_model(self):
+        """
+        return LocalTree of the requested shape and a list of directories per level
+        """
+        tree = LocalTree()
+        levels = [[LocalTree.ROOT]]
+        for _ in range(0, self.depth):
+            level = []
+            for parent in levels[-1]:
+                for i in range(0, self.fanout):
+                    idx = tree.add_dir(parent, "d%d" % i)
+                    level.append(idx)
+                    for j in range(0, self.files_nr):
+                        tree.add_file(idx, "f%d" % j, self.size_func(self.rnd))
+            levels.append(level)
+        return tree, levels
+
+    def generate(self, root):
+        """
+        create the tree under root directory
+        return (LocalTree, Manifest) with expected sizes and digests,
+        None, None on failure
+        """
+        start = time.time()
+        tree, levels = self.build_model()
+        logging.debug("Generating %d directories and %d files in %s" % (len(tree.dirs), tree.nr_files, root))
+
+        pool = ThreadPool(self.nr_threads)
+        try:
+            # parents must exist before their children
+            for level in levels[1:]:
+                for res in pool.imap_unordered(lambda idx: self.mkdir(root, tree, idx), level, 64):
+                    if not res:
+                        return None, None
+
+            l_files = [i for i in range(1, len(tree)) if not tree.is_dir[i]]
+            for idx, digest in pool.imap_unordered(lambda idx: self.create(root, tree, idx), l_files, 64):
+                if digest is None:
+                    return None, None
+                tree.digests[idx] = digest
+        finally:
+            pool.close()
+            pool.join()
+
+        logging.info("Generated %d directories and %d files in %.2f s" % (len(tree.dirs), tree.nr_files, time.time() - start))
+        return tree, self.manifest(root, tree)
+
+    def mkdir(self, root, tree, idx):
+        dname = os.path.join(root, tree.path(idx))
+        if self.trace is not None:
+            self.trace("mkdir", [dname])
+        try:
+            os.mkdir(dname)
+        except OSError, e:
+            logging.error("Failed to create directory: %s (%s)" % (dname, e))
+            return False
+        return True
+
+    def create(self, root, tree, idx):
+        fname = os.path.join(root, tree.path(idx))
+        try:
+            return idx, self.file_create(fname, tree.sizes[idx], None, self.algo)
+        except IOError, e:
+            logging.error("Failed to create file: %s (%s)" % (fname, e))
+            return idx, None
+
+    @staticmethod
+    def manifest(root, tree):
+        """
+        return expected manifest of a tree, without inodes and mtimes
+        """
+        manifest = Manifest(root)
+        for idx, path in tree.walk():
+            manifest.entries[path] = ManifestEntry(bool(tree.is_dir[idx]), tree.sizes[idx], None, None, tree.digests[idx])
+        return manifest
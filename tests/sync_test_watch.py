@@ -0,0 +1,261 @@
+"""
+ Filesystem watchers for testing syncing algorithm
+
+ (c) 2013-2014 by Mega Limited, Wellsford, New Zealand
+
+ This file is part of the MEGA SDK - Client Access Engine.
+
+ Applications using the MEGA API must present a valid application key
+ and comply with the the rules set forth in the Terms of Service.
+
+ The MEGA SDK is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+ @copyright Simplified (2-clause) BSD License.
+
+ You should have received a copy of the license along with this
+ program.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+
+class InotifyWatcher(object):
+    """
+    watches directory trees with Linux inotify
+    and remembers the time of the last filesystem activity
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    # reads are not watched: verification hashing "out" files would count as sync activity
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+        IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, roots):
+        """
+        roots: list of directories to watch recursively,
+        a directory which does not exist yet is watched for through its nearest existing parent
+        """
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, "libc is not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not supported")
+
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.wds = {}
+        self.anchors = set()
+        self.last_activity = 0
+        self.limit_reached = False
+        # function(path, exists, time) called for every created, moved or deleted object
+        self.listener = None
+
+        for root in self.roots:
+            self.watch_root(root)
+
+    def close(self):
+        """
+        release inotify descriptor
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path):
+        """
+        add a single watch, return watch descriptor or -1
+        """
+        if isinstance(path, unicode):
+            path = path.encode("utf-8")
+        wd = self.libc.inotify_add_watch(self.fd, path, self.WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC and not self.limit_reached:
+                self.limit_reached = True
+                logging.warning("inotify watch limit reached, activity in %s and further directories is not tracked" % path)
+            return -1
+        self.wds[wd] = path
+        return wd
+
+    def watch_tree(self, path):
+        """
+        recursively watch all directories under path
+        """
+        for dirpath, _, _ in os.walk(path):
+            self.add_watch(dirpath)
+
+    def watch_root(self, root):
+        """
+        watch a root directory or its nearest existing parent
+        """
+        if os.path.isdir(root):
+            self.watch_tree(root)
+            return
+        parent = os.path.dirname(root)
+        while parent and not os.path.isdir(parent):
+            parent = os.path.dirname(parent)
+        if parent:
+            wd = self.add_watch(parent)
+            if wd >= 0:
+                self.anchors.add(wd)
+
+    def on_dir_created(self, wd, path):
+        """
+        start watching a directory created (or moved) into a watched directory
+        """
+        if wd not in self.anchors:
+            self.watch_tree(path)
+            return
+        for root in self.roots:
+            if root == path:
+                self.watch_tree(path)
+            elif root.startswith(path + os.sep):
+                new_wd = self.add_watch(path)
+                if new_wd >= 0:
+                    self.anchors.add(new_wd)
+
+    def read_events(self):
+        """
+        read and process all queued events, return the number of events read
+        """
+        nr_events = 0
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(buf, pos)
+                pos += self.EVENT_HEADER.size
+                name = buf[pos:pos + name_len].rstrip("\0")
+                pos += name_len
+
+                nr_events += 1
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # events were dropped, directories created meanwhile may not be watched yet
+                    logging.debug("inotify queue has overflowed, watching trees again")
+                    for root in self.roots:
+                        self.watch_root(root)
+                elif mask & self.IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    self.anchors.discard(wd)
+                elif mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO) and wd in self.wds:
+                    self.on_dir_created(wd, os.path.join(self.wds[wd], name))
+
+                if self.listener and name and wd in self.wds:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO | self.IN_CLOSE_WRITE):
+                        self.listener(os.path.join(self.wds[wd], name), True, time.time())
+                    elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        self.listener(os.path.join(self.wds[wd], name), False, time.time())
+
+        return nr_events
+
+    def poll(self, timeout):
+        """
+        wait up to timeout seconds for filesystem events
+        return the number of events received
+        """
+        try:
+            r, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return 0
+            raise
+        if not r:
+            return 0
+        nr_events = self.read_events()
+        if nr_events:
+            self.last_activity = time.time()
+        return nr_events
+
+
+class ScanWatcher(object):
+    """
+    fallback watcher for platforms without inotify:
+    periodically scans directory trees and compares their signatures
+    """
+    def __init__(self, roots, scan_interval=0.25):
+        self.roots = roots
+        self.scan_interval = scan_interval
+        self.last_activity = 0
+        self.signature = self.get_signature()
+
+    def close(self):
+        pass
+
+    def get_signature(self):
+        """
+        return a cheap signature of all trees: number of entries, total size, latest mtime
+        """
+        nr_entries = total_size = 0
+        max_mtime = 0
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in dirnames + filenames:
+                    try:
+                        st = os.lstat(os.path.join(dirpath, name))
+                    except OSError:
+                        continue
+                    nr_entries += 1
+                    total_size += st.st_size
+                    max_mtime = max(max_mtime, st.st_mtime)
+        return nr_entries, total_size, max_mtime
+
+    def poll(self, timeout):
+        """
+        wait up to timeout seconds, return 1 if trees have changed, 0 otherwise
+        """
+        time.sleep(max(min(timeout, self.scan_interval), 0))
+        signature = self.get_signature()
+        if signature == self.signature:
+            return 0
+        self.signature = signature
+        self.last_activity = time.time()
+        return 1
+
+
+def create_watcher(roots):
+    """
+    return inotify watcher if supported, scanning watcher otherwise
+    """
+    try:
+        return InotifyWatcher(roots)
+    except OSError, e:
+        logging.debug("inotify is not available (%s), falling back to tree scanning" % e)
+        return ScanWatcher(roots)